@@ -1,4 +1,22 @@
-from .checks import collect_all_checks  # noqa: F401
-from .state import load_last_state, save_last_state  # noqa: F401
-from .transport import post_update  # noqa: F401
-from .utils import get_machine_identity  # noqa: F401
+import importlib
+
+# Public helpers, resolved on first use so `import agent.<module>` does not
+# pull in requests, platformdirs and every check at startup
+_EXPORTS = {
+    "collect_all_checks": ".checks",
+    "load_last_state": ".state",
+    "save_last_state": ".state",
+    "post_update": ".transport",
+    "get_machine_identity": ".utils",
+}
+
+__all__ = sorted(_EXPORTS)
+
+
+def __getattr__(name):
+    module = _EXPORTS.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(module, __name__), name)
+    globals()[name] = value
+    return value
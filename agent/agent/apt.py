@@ -0,0 +1,611 @@
+import fnmatch
+import functools
+import glob
+import os
+import re
+import threading
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+DPKG_STATUS = "/var/lib/dpkg/status"
+APT_LISTS_DIR = "/var/lib/apt/lists"
+APT_ETC_DIR = "/etc/apt"
+MACHINE_ID = "/etc/machine-id"
+
+# Default pin priorities (apt_preferences(5))
+PRIORITY_DEFAULT = 500
+PRIORITY_INSTALLED = 100
+PRIORITY_BUT_AUTOMATIC_UPGRADES = 100
+PRIORITY_NOT_AUTOMATIC = 1
+PRIORITY_DEFAULT_RELEASE = 990
+
+
+# Debian version comparison (deb-version(7))
+
+def _order(c: str) -> int:
+    if c == "~":
+        return -1
+    if c.isdigit():
+        return 0
+    if c.isalpha():
+        return ord(c)
+    return ord(c) + 256
+
+
+def _compare_part(a: str, b: str) -> int:
+    i = j = 0
+    while i < len(a) or j < len(b):
+        first_diff = 0
+        # Non-digit prefix, compared with the modified ordering above
+        while (i < len(a) and not a[i].isdigit()) or (j < len(b) and not b[j].isdigit()):
+            ac = _order(a[i]) if i < len(a) else 0
+            bc = _order(b[j]) if j < len(b) else 0
+            if ac != bc:
+                return ac - bc
+            i += 1
+            j += 1
+        while i < len(a) and a[i] == "0":
+            i += 1
+        while j < len(b) and b[j] == "0":
+            j += 1
+        # Digit run, compared numerically
+        while i < len(a) and a[i].isdigit() and j < len(b) and b[j].isdigit():
+            if not first_diff:
+                first_diff = ord(a[i]) - ord(b[j])
+            i += 1
+            j += 1
+        if i < len(a) and a[i].isdigit():
+            return 1
+        if j < len(b) and b[j].isdigit():
+            return -1
+        if first_diff:
+            return first_diff
+    return 0
+
+
+def _split_version(v: str) -> Tuple[int, str, str]:
+    epoch = 0
+    if ":" in v:
+        e, v = v.split(":", 1)
+        try:
+            epoch = int(e)
+        except ValueError:
+            epoch = 0
+    if "-" in v:
+        upstream, revision = v.rsplit("-", 1)
+    else:
+        upstream, revision = v, ""
+    return epoch, upstream, revision
+
+
+def compare_versions(a: str, b: str) -> int:
+    """Return <0, 0 or >0 as Debian version a sorts before, equal to or after b."""
+    if a == b:
+        return 0
+    ea, ua, ra = _split_version(a)
+    eb, ub, rb = _split_version(b)
+    if ea != eb:
+        return ea - eb
+    c = _compare_part(ua, ub)
+    if c:
+        return c
+    return _compare_part(ra, rb)
+
+
+# Control file parsing
+
+def _iter_stanzas(path: str, fields: Tuple[str, ...]):
+    # Only the fields we need are picked out; everything else is skipped cheaply
+    prefixes = tuple(f + ":" for f in fields)
+    current: Dict[str, str] = {}
+    with open(path, "r", encoding="utf-8", errors="replace") as f:
+        for line in f:
+            if line == "\n":
+                if current:
+                    yield current
+                    current = {}
+                continue
+            if line[0] in " \t" or not line.startswith(prefixes):
+                continue
+            key, _, value = line.partition(":")
+            current[key] = value.strip()
+    if current:
+        yield current
+
+
+class Version(NamedTuple):
+    version: str
+    source: str  # source package name and version, used for phasing
+    source_version: str
+    phased: Optional[int] = None  # Phased-Update-Percentage, None when not phased
+
+
+def _version(st: Dict[str, str]) -> Version:
+    # "Source: name" or "Source: name (version)"; both default to the binary's own
+    source, _, source_version = st.get("Source", "").partition(" (")
+    try:
+        phased: Optional[int] = min(100, max(0, int(st["Phased-Update-Percentage"])))
+    except (KeyError, ValueError):
+        phased = None
+    return Version(
+        version=st["Version"],
+        source=source.strip() or st.get("Package", ""),
+        source_version=source_version.rstrip(")").strip() or st["Version"],
+        phased=phased,
+    )
+
+
+def parse_status(path: str = DPKG_STATUS) -> Dict[Tuple[str, str], Version]:
+    installed = {}
+    for st in _iter_stanzas(path, ("Package", "Status", "Version", "Architecture", "Source")):
+        if not st.get("Status", "").endswith(" installed") or "Version" not in st:
+            continue
+        installed[(st.get("Package", ""), st.get("Architecture", "all"))] = _version(st)
+    return installed
+
+
+def parse_packages(path: str) -> Dict[Tuple[str, str], List[Version]]:
+    """Every version per (package, architecture) in one Packages list."""
+    versions: Dict[Tuple[str, str], List[Version]] = {}
+    fields = ("Package", "Version", "Architecture", "Source", "Phased-Update-Percentage")
+    for st in _iter_stanzas(path, fields):
+        if "Version" not in st:
+            continue
+        versions.setdefault((st.get("Package", ""), st.get("Architecture", "all")), []).append(_version(st))
+    return versions
+
+
+class PackageList(NamedTuple):
+    """What apt knows about one package index: its Release fields and where it came from."""
+
+    path: str
+    archive: str = ""
+    codename: str = ""
+    version: str = ""
+    origin: str = ""
+    label: str = ""
+    component: str = ""
+    architecture: str = ""
+    site: str = ""
+    not_automatic: bool = False
+    but_automatic_upgrades: bool = False
+
+
+STATUS_LIST = PackageList(path=DPKG_STATUS, archive="now")
+
+
+def parse_release(path: str) -> Dict[str, str]:
+    fields = ("Origin", "Label", "Suite", "Codename", "Version", "NotAutomatic", "ButAutomaticUpgrades")
+    # InRelease is clearsigned; the fields are in the first stanza after the armor header
+    for st in _iter_stanzas(path, fields):
+        return st
+    return {}
+
+
+def describe_list(path: str, release_files: Iterable[str]) -> PackageList:
+    """Match a *_Packages file to its Release file by the shared file-name prefix."""
+    name = os.path.basename(path)
+    release: Dict[str, str] = {}
+    prefix = ""
+    for rel in release_files:
+        base = os.path.basename(rel)
+        stem = base[: -len("InRelease")] if base.endswith("InRelease") else base[: -len("Release")]
+        # InRelease sorts before Release, so it wins on an equal prefix
+        if name.startswith(stem) and len(stem) > len(prefix):
+            prefix = stem
+            release = parse_release(rel)
+    rest = name[len(prefix):]
+    component, _, arch = rest.partition("_binary-")
+    return PackageList(
+        path=path,
+        archive=release.get("Suite", ""),
+        codename=release.get("Codename", ""),
+        version=release.get("Version", ""),
+        origin=release.get("Origin", ""),
+        label=release.get("Label", ""),
+        component=component.replace("_", "/") if arch else "",
+        architecture=arch[: -len("_Packages")] if arch.endswith("_Packages") else "",
+        site=name.split("_", 1)[0],
+        not_automatic=release.get("NotAutomatic", "").lower() == "yes",
+        but_automatic_upgrades=release.get("ButAutomaticUpgrades", "").lower() == "yes",
+    )
+
+
+def _parts(directory: str, extension: Optional[str] = None) -> List[str]:
+    # apt only reads parts named [A-Za-z0-9_.-]+; preferences.d also wants no or a .pref extension
+    names = []
+    try:
+        entries = sorted(os.listdir(directory))
+    except OSError:
+        return names
+    for name in entries:
+        if not re.fullmatch(r"[A-Za-z0-9_.\-]+", name):
+            continue
+        if extension is not None and "." in name and not name.endswith(extension):
+            continue
+        names.append(os.path.join(directory, name))
+    return names
+
+
+def read_apt_config(etc_dir: str = APT_ETC_DIR) -> Dict[str, str]:
+    """The few apt.conf options that change what `apt-get upgrade` picks, by their last name component."""
+    wanted = ("Default-Release", "Always-Include-Phased-Updates", "Never-Include-Phased-Updates", "Machine-ID")
+    pattern = re.compile(r"(?:^|[\s:{;])(%s)\s+\"([^\"]*)\"" % "|".join(re.escape(w) for w in wanted))
+    options: Dict[str, str] = {}
+    for path in [os.path.join(etc_dir, "apt.conf")] + _parts(os.path.join(etc_dir, "apt.conf.d")):
+        try:
+            with open(path, "r", encoding="utf-8", errors="replace") as f:
+                text = f.read()
+        except OSError:
+            continue
+        text = re.sub(r"/\*.*?\*/", "", text, flags=re.S)
+        for line in text.splitlines():
+            line = line.split("//", 1)[0]
+            if line.lstrip().startswith("#"):
+                continue
+            for key, value in pattern.findall(line):
+                options[key] = value
+    return options
+
+
+def _truthy(value: Optional[str]) -> bool:
+    return (value or "").lower() in ("1", "yes", "true", "on", "with", "enable")
+
+
+def _list_prefix(uri: str, suite: str) -> str:
+    # apt names list files after the URI without scheme or credentials, "/" -> "_"
+    uri = re.sub(r"^[a-z0-9+.\-]+://(?:[^/@]*@)?", "", uri.strip()).rstrip("/")
+    if suite.endswith("/"):  # flat repository
+        path = uri if suite.strip("/") in ("", ".") else f"{uri}/{suite.strip('/')}"
+    else:
+        path = f"{uri}/dists/{suite}"
+    return path.replace("/", "_") + "_"
+
+
+def source_prefixes(etc_dir: str = APT_ETC_DIR) -> List[str]:
+    """List file name prefixes of the enabled deb sources, in the order apt reads them."""
+    prefixes: List[str] = []
+    parts = [p for p in _parts(os.path.join(etc_dir, "sources.list.d")) if p.endswith((".list", ".sources"))]
+    for path in [os.path.join(etc_dir, "sources.list")] + parts:
+        try:
+            if path.endswith(".sources"):
+                for st in _iter_stanzas(path, ("Types", "URIs", "Suites", "Enabled")):
+                    if "deb" not in st.get("Types", "").split() or st.get("Enabled", "yes").lower() == "no":
+                        continue
+                    for uri in st.get("URIs", "").split():
+                        prefixes.extend(_list_prefix(uri, suite) for suite in st.get("Suites", "").split())
+                continue
+            with open(path, "r", encoding="utf-8", errors="replace") as f:
+                for line in f:
+                    words = re.sub(r"\[[^\]]*\]", "", line.split("#", 1)[0]).split()
+                    if len(words) >= 3 and words[0] == "deb":
+                        prefixes.append(_list_prefix(words[1], words[2]))
+        except OSError:
+            continue
+    return prefixes
+
+
+# Pins (apt_preferences(5))
+
+def _matches(pattern: str, value: str) -> bool:
+    if len(pattern) > 2 and pattern[0] == "/" and pattern[-1] == "/":
+        return re.search(pattern[1:-1], value) is not None
+    if any(c in pattern for c in "*?["):
+        return fnmatch.fnmatchcase(value, pattern)
+    return pattern == value
+
+
+class Pin(NamedTuple):
+    packages: Optional[Tuple[str, ...]]  # None for "Package: *"
+    kind: str  # release, origin or version
+    terms: Tuple[Tuple[str, str], ...]  # release: (key, value) pairs; origin/version: one ("", value)
+    priority: int
+
+    def applies_to(self, name: str, arch: str, source: str) -> bool:
+        if self.packages is None:
+            return True
+        for entry in self.packages:
+            if entry.startswith("src:"):
+                if _matches(entry[4:], source):
+                    return True
+            elif ":" in entry:
+                pkg, _, pkg_arch = entry.partition(":")
+                if _matches(pkg, name) and _matches(pkg_arch, arch):
+                    return True
+            elif _matches(entry, name):
+                return True
+        return False
+
+    def matches_list(self, info: PackageList) -> bool:
+        if self.kind == "origin":
+            # origin "" means local repositories, never the dpkg status file
+            return info is not STATUS_LIST and _matches(self.terms[0][1], info.site)
+        if self.kind != "release":
+            return False
+        fields = {
+            "a": info.archive, "n": info.codename, "v": info.version, "o": info.origin,
+            "l": info.label, "c": info.component, "b": info.architecture,
+        }
+        for key, value in self.terms:
+            if key:
+                if not _matches(value, fields[key]):
+                    return False
+            # A bare value is a release version, archive or codename
+            elif not any(_matches(value, f) for f in (info.version, info.archive, info.codename)):
+                return False
+        return True
+
+
+def _pin(packages: Optional[Tuple[str, ...]], pin: str, priority: int) -> Pin:
+    kind, _, data = pin.strip().partition(" ")
+    data = data.strip()
+    if kind == "release":
+        terms = []
+        for term in data.split(","):
+            key, eq, value = term.strip().partition("=")
+            if not eq:
+                terms.append(("", term.strip().strip('"')))
+            elif key in ("a", "n", "v", "o", "l", "c", "b"):
+                terms.append((key, value.strip().strip('"')))
+            else:
+                raise ValueError(f"unsupported release pin term {term.strip()!r}")
+        return Pin(packages, kind, tuple(terms), priority)
+    if kind in ("origin", "version"):
+        if kind == "version" and packages is None:
+            raise ValueError("version pins need a package name")
+        return Pin(packages, kind, (("", data.strip('"')),), priority)
+    raise ValueError(f"unsupported pin {pin!r}")
+
+
+def parse_preferences(path: str) -> List[Pin]:
+    """Pins from one preferences file; raises ValueError on anything apt would not accept either."""
+    pins = []
+    for st in _iter_stanzas(path, ("Package", "Pin", "Pin-Priority")):
+        if "Pin" not in st or "Pin-Priority" not in st:
+            if "Package" in st or "Pin" in st:
+                raise ValueError(f"incomplete pin in {path}")
+            continue
+        names = tuple(st.get("Package", "").split())
+        packages = None if names in ((), ("*",)) else names
+        pins.append(_pin(packages, st["Pin"], int(st["Pin-Priority"])))
+    return pins
+
+
+# Phased updates: apt seeds std::minstd_rand through std::seed_seq with
+# "<source>-<source version>-<machine id>" and draws uniformly from 0..100;
+# the machine gets the update when the draw is at most the percentage.
+
+_U32 = 0xFFFFFFFF
+_MINSTD_M = 2147483647
+
+
+def _seed_seq(values: List[int], n: int) -> List[int]:
+    out = [0x8B8B8B8B] * n
+    s = len(values)
+    t = 11 if n >= 623 else 7 if n >= 68 else 5 if n >= 39 else 3 if n >= 7 else (n - 1) // 2
+    p = (n - t) // 2
+    q = p + t
+    m = max(s + 1, n)
+    for k in range(m):
+        x = out[k % n] ^ out[(k + p) % n] ^ out[(k - 1) % n]
+        r1 = (1664525 * (x ^ (x >> 27))) & _U32
+        r2 = (r1 + (s if k == 0 else k % n + values[k - 1] if k <= s else k % n)) & _U32
+        out[(k + p) % n] = (out[(k + p) % n] + r1) & _U32
+        out[(k + q) % n] = (out[(k + q) % n] + r2) & _U32
+        out[k % n] = r2
+    for k in range(m, m + n):
+        x = (out[k % n] + out[(k + p) % n] + out[(k - 1) % n]) & _U32
+        r3 = (1566083941 * (x ^ (x >> 27))) & _U32
+        r4 = (r3 - k % n) & _U32
+        out[(k + p) % n] ^= r3
+        out[(k + q) % n] ^= r4
+        out[k % n] = r4
+    return out
+
+
+def phase_draw(source: str, source_version: str, machine_id: str) -> int:
+    """apt's per-machine draw in 0..100 for one source package version."""
+    # std::seed_seq takes the chars of the seed string as (signed) char values
+    values = [b if b < 128 else (b - 256) & _U32 for b in f"{source}-{source_version}-{machine_id}".encode()]
+    x = _seed_seq(values, 4)[3] % _MINSTD_M or 1
+    # libstdc++ uniform_int_distribution over minstd_rand's range [1, m-1]
+    scaling = (_MINSTD_M - 2) // 101
+    while True:
+        x = (48271 * x) % _MINSTD_M
+        if x - 1 < 101 * scaling:
+            return (x - 1) // scaling
+
+
+def _is_security(info: PackageList) -> bool:
+    return "security" in os.path.basename(info.path) or info.archive.endswith("-security")
+
+
+class AptPolicy:
+    """Candidate versions as apt's policy picks them (pkgPolicy::GetCandidateVer).
+
+    Per-list priorities come from the Release flags (NotAutomatic,
+    ButAutomaticUpgrades), APT::Default-Release and the general pins;
+    package-specific pins override them per version. The candidate is the
+    version with the highest priority, the newest on a tie, and only a
+    priority of 1000 or more can pick something older than what is installed.
+    """
+
+    def __init__(self, pins: List[Pin], default_release: Optional[str] = None) -> None:
+        self.specific = [p for p in pins if p.packages is not None]
+        general = [p for p in pins if p.packages is None]
+        if default_release:
+            # Matched before the preferences, so it wins over any general pin
+            general.insert(0, _pin(None, f"release {default_release}", PRIORITY_DEFAULT_RELEASE))
+        self.general = general
+        self._list_priority: Dict[str, int] = {}
+
+    def list_priority(self, info: PackageList) -> int:
+        cached = self._list_priority.get(info.path)
+        if cached is not None:
+            return cached
+        prio = PRIORITY_DEFAULT
+        if info is STATUS_LIST:
+            prio = PRIORITY_INSTALLED
+        elif info.but_automatic_upgrades:
+            prio = PRIORITY_BUT_AUTOMATIC_UPGRADES
+        elif info.not_automatic:
+            prio = PRIORITY_NOT_AUTOMATIC
+        for pin in self.general:
+            if pin.matches_list(info):
+                prio = pin.priority
+                break
+        self._list_priority[info.path] = prio
+        return prio
+
+    def version_priority(self, version: str, lists: List[PackageList], pins: List[Pin]) -> int:
+        for pin in pins:
+            if pin.kind == "version":
+                hit = _matches(pin.terms[0][1], version)
+            else:
+                hit = any(pin.matches_list(info) for info in lists)
+            if hit:
+                return pin.priority
+        return max((self.list_priority(info) for info in lists), default=0)
+
+    def candidate(self, name: str, arch: str, installed: Optional[Version],
+                  available: Dict[str, List[PackageList]], sources: Dict[str, str]) -> Optional[str]:
+        """``sources`` maps each version to its source package, which src: pins match per version."""
+        versions = dict(available)
+        if installed is not None:
+            versions[installed.version] = versions.get(installed.version, []) + [STATUS_LIST]
+        best = None
+        best_prio = 0
+        for version in sorted(versions, key=functools.cmp_to_key(compare_versions), reverse=True):
+            pins = [p for p in self.specific if p.applies_to(name, arch, sources.get(version, name))]
+            prio = self.version_priority(version, versions[version], pins)
+            if prio > best_prio:
+                best, best_prio = version, prio
+            if installed is not None and version == installed.version and best_prio < 1000:
+                # Only a pin of 1000 or more may downgrade from here on
+                best_prio = 999
+        return best
+
+
+class AptIndex:
+    """Installed and available package versions, re-parsed only when files change."""
+
+    def __init__(self, status_path: str = DPKG_STATUS, lists_dir: str = APT_LISTS_DIR,
+                 etc_dir: str = APT_ETC_DIR, machine_id_path: str = MACHINE_ID) -> None:
+        self.status_path = status_path
+        self.lists_dir = lists_dir
+        self.etc_dir = etc_dir
+        self.machine_id_path = machine_id_path
+        self._files: Dict[str, Tuple[Tuple[int, int], Any]] = {}
+        self._lock = threading.Lock()
+        self.parsed_files = 0  # files (re)parsed by the last refresh
+
+    def list_files(self) -> List[str]:
+        """Packages lists in sources.list order, which decides whose fields win on duplicates."""
+        prefixes = source_prefixes(self.etc_dir)
+
+        def order(path: str) -> Tuple[int, str]:
+            name = os.path.basename(path)
+            return next((i for i, p in enumerate(prefixes) if name.startswith(p)), len(prefixes)), name
+
+        return sorted(glob.glob(os.path.join(self.lists_dir, "*_Packages")), key=order)
+
+    def release_files(self) -> List[str]:
+        return sorted(glob.glob(os.path.join(self.lists_dir, "*Release")))
+
+    def preference_files(self) -> List[str]:
+        main = os.path.join(self.etc_dir, "preferences")
+        return ([main] if os.path.isfile(main) else []) + _parts(os.path.join(self.etc_dir, "preferences.d"), ".pref")
+
+    def _load(self, path: str, parser) -> Any:
+        st = os.stat(path)
+        sig = (st.st_mtime_ns, st.st_size)
+        cached = self._files.get(path)
+        if cached and cached[0] == sig:
+            return cached[1]
+        data = parser(path)
+        self._files[path] = (sig, data)
+        self.parsed_files += 1
+        return data
+
+    def _machine_id(self, config: Dict[str, str]) -> str:
+        if config.get("Machine-ID"):
+            return config["Machine-ID"]
+        try:
+            with open(self.machine_id_path, "r", encoding="ascii", errors="replace") as f:
+                return f.read().strip()
+        except OSError:
+            return ""
+
+    def upgradable(self) -> Optional[Dict[str, Any]]:
+        """Upgradable, security and phase-deferred package names, or None when apt data is missing.
+
+        Raises ValueError for preferences it cannot evaluate, so the caller
+        can fall back to apt-get.
+        """
+        lists = self.list_files()
+        if not lists or not os.path.exists(self.status_path):
+            return None
+        releases = self.release_files()
+        prefs = self.preference_files()
+        with self._lock:
+            self.parsed_files = 0
+            installed = self._load(self.status_path, parse_status)
+            available = [(describe_list(p, releases), self._load(p, parse_packages)) for p in lists]
+            pins = [pin for path in prefs for pin in self._load(path, parse_preferences)]
+            for stale in set(self._files) - set(lists) - set(prefs) - {self.status_path}:
+                del self._files[stale]
+
+        config = read_apt_config(self.etc_dir)
+        policy = AptPolicy(pins, config.get("Default-Release"))
+        always_phased = _truthy(config.get("Always-Include-Phased-Updates"))
+        never_phased = _truthy(config.get("Never-Include-Phased-Updates"))
+        machine_id = self._machine_id(config)
+
+        def deferred(ver: Version) -> bool:
+            if ver.phased is None or ver.phased >= 100 or always_phased:
+                return False
+            return never_phased or bool(machine_id) and phase_draw(ver.source, ver.source_version, machine_id) > ver.phased
+
+        upgradable = []
+        security_names = []
+        phased_names = []
+        for (name, arch), current in installed.items():
+            keys = [(name, arch)] if arch == "all" else [(name, arch), (name, "all")]
+            versions: Dict[str, List[PackageList]] = {}
+            details: Dict[str, Version] = {}
+            for info, packages in available:
+                for key in keys:
+                    for ver in packages.get(key, ()):
+                        versions.setdefault(ver.version, []).append(info)
+                        # Like apt, the last list that phases a version sets its percentage
+                        if ver.phased is not None or ver.version not in details:
+                            details[ver.version] = ver
+            if not versions:
+                continue
+            sources = {current.version: current.source}
+            sources.update((v, d.source) for v, d in details.items())
+            cand = policy.candidate(name, arch, current, versions, sources)
+            if cand is None or cand not in details or compare_versions(cand, current.version) <= 0:
+                continue
+            secured = [v for v in versions if any(_is_security(info) for info in versions[v])]
+            # apt does not phase an update that supersedes a security update...
+            via_security = any(compare_versions(current.version, v) < 0 < compare_versions(cand, v) for v in secured)
+            # ...and also holds a package whose installed version is still being
+            # phased in and has not reached this machine, unless it replaced one
+            # from a security archive
+            installed_detail = details.get(current.version)
+            held = (installed_detail is not None and deferred(installed_detail)
+                    and not any(compare_versions(v, current.version) < 0 for v in secured))
+            if held or (not via_security and deferred(details[cand])):
+                phased_names.append(name)
+                continue
+            upgradable.append(name)
+            if via_security or any(_is_security(info) for info in versions[cand]):
+                security_names.append(name)
+        return {
+            "upgradable": sorted(set(upgradable)),
+            "security": sorted(set(security_names)),
+            "phased": sorted(set(phased_names)),
+        }
+
+
+APT_INDEX = AptIndex()
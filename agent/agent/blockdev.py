@@ -0,0 +1,173 @@
+import os
+from typing import Any, Dict, List, Optional
+
+SYS_ROOT = "/sys"
+PROC_ROOT = "/proc"
+
+# Swap on these never reaches a disk, so it does not need encrypting
+VOLATILE_PREFIXES = ("zram",)
+
+
+def _read(path: str) -> Optional[str]:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+def _unescape(field: str) -> str:
+    # mountinfo escapes space, tab, newline and backslash as octal
+    return (
+        field.replace("\\040", " ").replace("\\011", "\t").replace("\\012", "\n").replace("\\134", "\\")
+    )
+
+
+class BlockGraph:
+    """Block devices keyed by kernel name, with their device-mapper parents."""
+
+    def __init__(self, devices: Dict[str, Dict[str, Any]]) -> None:
+        self.devices = devices
+        self.by_devno = {d["dev"]: name for name, d in devices.items() if d.get("dev")}
+        self.by_dm_name = {d["dm_name"]: name for name, d in devices.items() if d.get("dm_name")}
+        self._encrypted: Dict[str, bool] = {}
+
+    @classmethod
+    def from_sysfs(cls, sys_root: str = SYS_ROOT) -> "BlockGraph":
+        devices: Dict[str, Dict[str, Any]] = {}
+        block_dir = os.path.join(sys_root, "block")
+        for name in sorted(os.listdir(block_dir)):
+            base = os.path.join(block_dir, name)
+            uuid = _read(os.path.join(base, "dm", "uuid"))
+            try:
+                slaves = sorted(os.listdir(os.path.join(base, "slaves")))
+            except OSError:
+                slaves = []
+            devices[name] = {
+                "dev": _read(os.path.join(base, "dev")),
+                "dm_uuid": uuid,
+                "dm_name": _read(os.path.join(base, "dm", "name")),
+                "parents": slaves,
+            }
+            # Partitions are subdirectories carrying a "partition" file
+            try:
+                children = os.listdir(base)
+            except OSError:
+                children = []
+            for child in sorted(children):
+                part = os.path.join(base, child)
+                if os.path.exists(os.path.join(part, "partition")):
+                    devices[child] = {
+                        "dev": _read(os.path.join(part, "dev")),
+                        "dm_uuid": None,
+                        "dm_name": None,
+                        "parents": [name],
+                        "partition": True,
+                    }
+        return cls(devices)
+
+    def resolve(self, devno: Optional[str] = None, source: Optional[str] = None) -> Optional[str]:
+        if devno and devno in self.by_devno:
+            return self.by_devno[devno]
+        if source and source.startswith("/dev/"):
+            if source.startswith("/dev/mapper/"):
+                return self.by_dm_name.get(source[len("/dev/mapper/"):])
+            name = os.path.basename(source)
+            if name in self.devices:
+                return name
+        return None
+
+    def is_encrypted(self, name: str) -> bool:
+        if name in self._encrypted:
+            return self._encrypted[name]
+        self._encrypted[name] = False  # guards against cycles in a broken tree
+        dev = self.devices.get(name) or {}
+        enc = (dev.get("dm_uuid") or "").upper().startswith("CRYPT-")
+        if not enc and not dev.get("partition"):
+            enc = any(self.is_encrypted(p) for p in dev.get("parents", []))
+        self._encrypted[name] = enc
+        return enc
+
+
+def read_mounts(proc_root: str = PROC_ROOT) -> List[Dict[str, str]]:
+    mounts = []
+    with open(os.path.join(proc_root, "self", "mountinfo"), "r", encoding="utf-8") as f:
+        for line in f:
+            fields = line.split()
+            if "-" not in fields:
+                continue
+            sep = fields.index("-")
+            if sep < 5 or len(fields) < sep + 3:
+                continue
+            mounts.append({
+                "devno": fields[2],
+                "mountpoint": _unescape(fields[4]),
+                "fstype": fields[sep + 1],
+                "source": _unescape(fields[sep + 2]),
+            })
+    return mounts
+
+
+def read_swaps(proc_root: str = PROC_ROOT) -> List[Dict[str, str]]:
+    swaps = []
+    try:
+        with open(os.path.join(proc_root, "swaps"), "r", encoding="utf-8") as f:
+            lines = f.read().splitlines()[1:]
+    except OSError:
+        return swaps
+    for line in lines:
+        fields = line.split()
+        if len(fields) >= 2:
+            swaps.append({"path": _unescape(fields[0]), "type": fields[1]})
+    return swaps
+
+
+def _mount_for(mounts: List[Dict[str, str]], path: str) -> Optional[Dict[str, str]]:
+    # Later entries shadow earlier ones at the same mountpoint
+    best = None
+    for m in mounts:
+        mp = m["mountpoint"]
+        if path == mp or path.startswith(mp.rstrip("/") + "/"):
+            if best is None or len(mp) >= len(best["mountpoint"]):
+                best = m
+    return best
+
+
+def _mount_coverage(graph: BlockGraph, mount: Dict[str, str]) -> Dict[str, Any]:
+    name = graph.resolve(mount["devno"], mount["source"])
+    return {
+        "mountpoint": mount["mountpoint"],
+        "device": name,
+        "fstype": mount["fstype"],
+        "encrypted": graph.is_encrypted(name) if name else None,
+    }
+
+
+def encryption_coverage(sys_root: str = SYS_ROOT, proc_root: str = PROC_ROOT, graph: Optional[BlockGraph] = None) -> Dict[str, Any]:
+    """Per-mount dm-crypt coverage for /, /home and swap."""
+    if graph is None:
+        graph = BlockGraph.from_sysfs(sys_root)
+    mounts = read_mounts(proc_root)
+    coverage: Dict[str, Any] = {}
+    for path in ("/", "/home"):
+        mount = _mount_for(mounts, path)
+        if mount is None:
+            continue
+        if path != "/" and mount["mountpoint"] == "/":
+            continue  # /home lives on the root filesystem
+        coverage[path] = _mount_coverage(graph, mount)
+
+    swap = []
+    for entry in read_swaps(proc_root):
+        if entry["type"] == "file":
+            mount = _mount_for(mounts, entry["path"])
+            enc = _mount_coverage(graph, mount)["encrypted"] if mount else None
+            swap.append({"path": entry["path"], "device": None, "encrypted": enc})
+            continue
+        name = graph.resolve(source=entry["path"])
+        if name and name.startswith(VOLATILE_PREFIXES):
+            swap.append({"path": entry["path"], "device": name, "encrypted": True, "volatile": True})
+        else:
+            swap.append({"path": entry["path"], "device": name, "encrypted": graph.is_encrypted(name) if name else None})
+    coverage["swap"] = swap
+    return coverage
@@ -1,13 +1,17 @@
 import json
 import os
-import platform
 import re
 import shutil
-import subprocess
-from typing import Any, Dict, Optional
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple
 
+from .facts import Facts, facts_for
+from .metrics import CHECK_STATS
 from .utils import run_cmd
 
+# The Linux readers (apt, rpm, dconf, blockdev, processes) are imported in the
+# branch that uses them, so other platforms and cached cycles never load them.
+
 
 def _bool_to_status(ok: Optional[bool]) -> str:
     if ok is True:
@@ -17,8 +21,22 @@ def _bool_to_status(ok: Optional[bool]) -> str:
     return "unknown"
 
 
-def check_disk_encryption() -> Dict[str, Any]:
-    os_name = platform.system()
+def _summarize_coverage(coverage: Dict[str, Any]) -> tuple[Optional[bool], str]:
+    entries = [(path, coverage[path]["encrypted"]) for path in ("/", "/home") if path in coverage]
+    entries += [(f"swap {s['path']}", s["encrypted"]) for s in coverage.get("swap", [])]
+    parts = []
+    for path, enc in entries:
+        parts.append(f"{path} {'encrypted' if enc else 'unknown' if enc is None else 'not encrypted'}")
+    root = coverage.get("/", {}).get("encrypted")
+    if root is None:
+        return None, "; ".join(parts) or "Root filesystem device not found"
+    known = [enc for _, enc in entries if enc is not None]
+    return all(known), "; ".join(parts)
+
+
+def check_disk_encryption(facts: Optional[Any] = None) -> Dict[str, Any]:
+    facts = facts_for(facts, ("os_name", "tool_paths", "block_graph"), "disk_encryption")
+    os_name = facts.get("os_name")
     result: Dict[str, Any] = {"ok": None, "summary": "", "data": {}}
     try:
         if os_name == "Windows":
@@ -52,8 +70,16 @@ def check_disk_encryption() -> Dict[str, Any]:
             else:
                 result["summary"] = f"fdesetup failed: {err.strip()}"
         elif os_name == "Linux":
+            if os.path.isdir("/sys/block") and os.path.exists("/proc/self/mountinfo"):
+                from .blockdev import encryption_coverage
+
+                coverage = encryption_coverage(graph=facts.get("block_graph"))
+                ok, summary = _summarize_coverage(coverage)
+                result["ok"] = ok
+                result["summary"] = summary
+                result["data"] = {"coverage": coverage}
             # Heuristics: check for any dm-crypt/crypt device via lsblk
-            if shutil.which("lsblk"):
+            elif facts.get("tool_paths")["lsblk"]:
                 code, out, err = run_cmd(["lsblk", "-o", "NAME,TYPE"])
                 if code == 0:
                     has_crypt = any("crypt" in line for line in out.lower().splitlines())
@@ -71,8 +97,9 @@ def check_disk_encryption() -> Dict[str, Any]:
     return result
 
 
-def check_os_updates(timeout: int = 45) -> Dict[str, Any]:
-    os_name = platform.system()
+def check_os_updates(facts: Optional[Any] = None, timeout: int = 45) -> Dict[str, Any]:
+    facts = facts_for(facts, ("os_name", "tool_paths"), "os_updates")
+    os_name = facts.get("os_name")
     result: Dict[str, Any] = {"ok": None, "summary": "", "data": {}}
     try:
         if os_name == "Windows":
@@ -101,10 +128,39 @@ def check_os_updates(timeout: int = 45) -> Dict[str, Any]:
                 result["summary"] = f"softwareupdate failed: {err.strip()}"
         elif os_name == "Linux":
             # Try apt
-            if shutil.which("apt-get"):
-                code, out, err = run_cmd(["apt-get", "-s", "upgrade"], timeout=timeout)
+            apt_index = None
+            tools = facts.get("tool_paths")
+            if tools["apt-get"]:
+                from .apt import APT_INDEX
+
+                try:
+                    apt_index = APT_INDEX.upgradable()
+                except Exception:
+                    apt_index = None
+            if apt_index is not None:
+                # In-process comparison of dpkg status against the cached apt lists
+                n = len(apt_index["upgradable"])
+                n_sec = len(apt_index["security"])
+                result["ok"] = n == 0
+                result["summary"] = "Up to date" if n == 0 else f"{n} updates available ({n_sec} security)"
+                result["data"] = {
+                    "pending_updates": n,
+                    "security_updates": n_sec,
+                    "packages": apt_index["upgradable"],
+                    "security_packages": apt_index["security"],
+                    # Held back by phased updates, as apt-get upgrade would leave them
+                    "phased_packages": apt_index["phased"],
+                }
+            elif tools["apt-get"]:
+                # The summary line is the last thing apt prints; stop reading there
+                summary_re = re.compile(r"(\d+) upgraded, (\d+) newly installed, (\d+) to remove, (\d+) not upgraded")
+                code, out, err = run_cmd(
+                    ["apt-get", "-s", "upgrade"],
+                    timeout=timeout,
+                    on_line=lambda line: summary_re.search(line) is not None,
+                )
                 if code == 0:
-                    m = re.search(r"(\d+) upgraded, (\d+) newly installed, (\d+) to remove, (\d+) not upgraded", out)
+                    m = summary_re.search(out)
                     has_updates = False
                     if m:
                         has_updates = any(int(m.group(i)) > 0 for i in range(1, 5))
@@ -112,8 +168,30 @@ def check_os_updates(timeout: int = 45) -> Dict[str, Any]:
                     result["summary"] = "Up to date" if not has_updates else "Updates available"
                 else:
                     result["summary"] = f"apt-get failed: {err.strip()}"
-            elif shutil.which("dnf") or shutil.which("yum"):
-                tool = "dnf" if shutil.which("dnf") else "yum"
+            elif tools["dnf"] or tools["yum"]:
+                tool = "dnf" if tools["dnf"] else "yum"
+                from .rpm import RPM_INDEX
+
+                try:
+                    rpm_index = RPM_INDEX.upgradable()
+                except Exception:
+                    rpm_index = None
+                if rpm_index is not None:
+                    # rpmdb vs already-cached repo metadata; never refreshes the cache
+                    n = len(rpm_index["upgradable"])
+                    # Whole days so the payload hash does not change every cycle
+                    age_days = rpm_index["metadata_age_s"] // 86400
+                    result["ok"] = n == 0
+                    result["summary"] = (
+                        "Up to date" if n == 0 else f"{n} updates available"
+                    ) + f" (repo cache {age_days}d old)"
+                    result["data"] = {
+                        "pending_updates": n,
+                        "packages": rpm_index["upgradable"],
+                        "metadata_age_days": age_days,
+                    }
+                    result["status"] = _bool_to_status(result["ok"])
+                    return result
                 code, out, err = run_cmd([tool, "-q", "check-update"], timeout=timeout)
                 # For yum/dnf, exit code 100 means updates available, 0 means none
                 if code == 100:
@@ -134,8 +212,33 @@ def check_os_updates(timeout: int = 45) -> Dict[str, Any]:
     return result
 
 
-def check_antivirus() -> Dict[str, Any]:
-    os_name = platform.system()
+PS_KNOWN_AV = {
+    "Darwin": ["symantec", "sophos", "sentinel", "carbonblack", "crowdstrike", "malwarebytes", "clamd"],
+    "Linux": ["clamd", "freshclam", "sophos", "savd", "csagent", "falcon-sensor", "sentinel-agent"],
+}
+
+
+def _match_known(line: str, known: List[str], present: List[str]) -> bool:
+    # Streaming parser for ps output: record hits and stop at the first one
+    name = line.lower()
+    present.extend(k for k in known if k in name and k not in present)
+    return bool(present)
+
+
+def ps_known_av(os_name: str) -> Optional[List[str]]:
+    """Legacy substring scan over ps output, used when the process table is unreadable."""
+    if not shutil.which("ps"):
+        return None
+    known = PS_KNOWN_AV.get(os_name, [])
+    cmd = ["ps", "-A", "-o", "comm="] if os_name == "Darwin" else ["ps", "-eo", "comm="]
+    present: List[str] = []
+    code, _, _ = run_cmd(cmd, on_line=lambda line: _match_known(line, known, present))
+    return present if code == 0 else None
+
+
+def check_antivirus(facts: Optional[Any] = None) -> Dict[str, Any]:
+    facts = facts_for(facts, ("os_name", "processes"), "antivirus")
+    os_name = facts.get("os_name")
     result: Dict[str, Any] = {"ok": None, "summary": "", "data": {}}
     try:
         if os_name == "Windows":
@@ -172,33 +275,21 @@ def check_antivirus() -> Dict[str, Any]:
                     result["summary"] = f"Parse error: {e}"
             else:
                 result["summary"] = "Unable to determine antivirus status"
-        elif os_name == "Darwin":
-            # Heuristic: list known AV daemons/processes
-            known = ["symantec", "sophos", "sentinel", "carbonblack", "crowdstrike", "malwarebytes", "clamd"]
-            code, out, err = run_cmd(["ps", "-A", "-o", "comm="])
-            if code == 0:
-                procs = out.lower()
-                present = [k for k in known if k in procs]
+        elif os_name in ("Darwin", "Linux"):
+            # Exact name/path match over the process table, no fork of ps
+            from .processes import DARWIN_AV_SIGNATURES, LINUX_AV_SIGNATURES, find_signatures
+
+            signatures = DARWIN_AV_SIGNATURES if os_name == "Darwin" else LINUX_AV_SIGNATURES
+            try:
+                present = find_signatures(signatures, facts.get("processes"))
+            except Exception:
+                present = ps_known_av(os_name)
+            if present is not None:
                 ok = len(present) > 0
                 result["ok"] = ok
                 result["summary"] = f"AV present: {', '.join(present)}" if ok else "No known AV detected"
             else:
-                result["summary"] = "ps failed"
-        elif os_name == "Linux":
-            # Heuristic: detect common AV services
-            known = ["clamd", "freshclam", "sophos", "savd", "csagent", "falcon-sensor", "sentinel-agent"]
-            if shutil.which("ps"):
-                code, out, err = run_cmd(["ps", "-eo", "comm="])
-                if code == 0:
-                    procs = out.lower()
-                    present = [k for k in known if k in procs]
-                    ok = len(present) > 0
-                    result["ok"] = ok
-                    result["summary"] = f"AV present: {', '.join(present)}" if ok else "No known AV detected"
-                else:
-                    result["summary"] = "ps failed"
-            else:
-                result["summary"] = "ps not available"
+                result["summary"] = "Process scan failed"
         else:
             result["summary"] = f"Unsupported OS: {os_name}"
     except Exception as e:
@@ -207,40 +298,73 @@ def check_antivirus() -> Dict[str, Any]:
     return result
 
 
-def check_sleep_settings() -> Dict[str, Any]:
-    os_name = platform.system()
+# powercfg setting "Sleep after" (alias STANDBYIDLE), in seconds
+STANDBYIDLE_GUID = "29f6c1db-86da-48c5-9fdb-f2b67b1f44da"
+_GUID_RE = re.compile(r"[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}")
+_HEX_VALUE_RE = re.compile(r":\s*0x([0-9a-fA-F]+)\s*$")
+
+
+def powercfg_indexes(out: str, setting_guid: str) -> Tuple[Optional[int], Optional[int]]:
+    """Current AC and DC index of one setting in `powercfg -q` output.
+
+    The setting's block runs from its GUID line to the next GUID line. The
+    labels are localized, so without the English ones the block's last two
+    hex values are taken; powercfg always prints AC before DC.
+    """
+    block: Optional[List[Tuple[str, int]]] = None
+    for line in out.splitlines():
+        guid = _GUID_RE.search(line)
+        if guid:
+            if block is not None:
+                break
+            if guid.group(0).lower() == setting_guid:
+                block = []
+            continue
+        if block is not None:
+            m = _HEX_VALUE_RE.search(line)
+            if m:
+                block.append((line, int(m.group(1), 16)))
+    if not block:
+        return None, None
+    ac = next((v for line, v in block if "Current AC Power Setting Index" in line), None)
+    dc = next((v for line, v in block if "Current DC Power Setting Index" in line), None)
+    if ac is None and dc is None and len(block) >= 2:
+        ac, dc = block[-2][1], block[-1][1]
+    return ac, dc
+
+
+def _minutes(seconds: Optional[int]) -> Optional[float]:
+    # Whole minutes stay ints, so existing consumers of the minute fields see the same values
+    if seconds is None:
+        return None
+    return seconds // 60 if seconds % 60 == 0 else round(seconds / 60, 2)
+
+
+def check_sleep_settings(facts: Optional[Any] = None) -> Dict[str, Any]:
+    facts = facts_for(facts, ("os_name",), "sleep_policy")
+    os_name = facts.get("os_name")
     result: Dict[str, Any] = {"ok": None, "summary": "", "data": {}}
     policy_minutes = 10
     try:
         if os_name == "Windows":
-            # Parse powercfg -q for "Sleep after" settings (AC/DC)
+            # "Sleep after" of the active scheme, AC and DC, in seconds
             code, out, err = run_cmd(["powercfg", "-q"], timeout=20)
             if code == 0:
-                ac = None
-                dc = None
-                # We look for a block containing "Sleep after" then lines with AC/DC indices
-                lines = out.splitlines()
-                for i, line in enumerate(lines):
-                    if "Sleep after" in line:
-                        # Next lines often contain AC/DC values in minutes
-                        for j in range(i + 1, min(i + 6, len(lines))):
-                            l = lines[j].strip()
-                            m = re.search(r"AC Power Setting Index: (\d+)", l)
-                            if m:
-                                ac = int(m.group(1))
-                            m = re.search(r"DC Power Setting Index: (\d+)", l)
-                            if m:
-                                dc = int(m.group(1))
-                        break
-                ok_vals = []
-                if ac is not None:
-                    ok_vals.append(ac <= policy_minutes and ac != 0)
-                if dc is not None:
-                    ok_vals.append(dc <= policy_minutes and dc != 0)
-                ok = None if not ok_vals else all(ok_vals)
+                ac, dc = powercfg_indexes(out, STANDBYIDLE_GUID)
+                limit = policy_minutes * 60
+                # 0 means never
+                vals = [v for v in (ac, dc) if v is not None]
+                ok = None if not vals else all(v != 0 and v <= limit for v in vals)
                 result["ok"] = ok
-                result["summary"] = f"Sleep AC={ac} DC={dc} minutes"
-                result["data"] = {"sleep_ac": ac, "sleep_dc": dc, "policy": policy_minutes}
+                result["summary"] = f"Sleep AC={_minutes(ac)} DC={_minutes(dc)} minutes"
+                # sleep_ac/sleep_dc/policy keep the original schema (minutes); the seconds are exact
+                result["data"] = {
+                    "sleep_ac": _minutes(ac),
+                    "sleep_dc": _minutes(dc),
+                    "policy": policy_minutes,
+                    "sleep_ac_s": ac,
+                    "sleep_dc_s": dc,
+                }
             else:
                 result["summary"] = f"powercfg failed: {err.strip()}"
         elif os_name == "Darwin":
@@ -266,28 +390,61 @@ def check_sleep_settings() -> Dict[str, Any]:
             else:
                 result["summary"] = f"pmset failed: {err.strip()}"
         elif os_name == "Linux":
-            # Heuristics: try gsettings for GNOME
-            if shutil.which("gsettings"):
-                # AC
-                code1, out1, _ = run_cmd(["gsettings", "get", "org.gnome.settings-daemon.plugins.power", "sleep-inactive-ac-timeout"], timeout=10)
-                # Battery
-                code2, out2, _ = run_cmd(["gsettings", "get", "org.gnome.settings-daemon.plugins.power", "sleep-inactive-battery-timeout"], timeout=10)
-                def parse_val(s: str) -> Optional[int]:
-                    s = s.strip()
-                    try:
-                        return int(s)
-                    except Exception:
-                        m = re.search(r"(\d+)", s)
-                        return int(m.group(1)) if m else None
-                ac = parse_val(out1) if code1 == 0 else None
-                dc = parse_val(out2) if code2 == 0 else None
-                vals = [v for v in [ac, dc] if v is not None]
-                ok = None if not vals else all((v != 0 and v <= policy_minutes * 60) for v in vals)  # gsettings returns seconds
-                result["ok"] = ok
-                result["summary"] = f"GNOME sleep AC={ac}s DC={dc}s"
-                result["data"] = {"sleep_ac_s": ac, "sleep_dc_s": dc, "policy_minutes": policy_minutes}
+            # Read dconf databases, logind.conf and unit links directly: no
+            # session bus needed and every local user is covered
+            from .dconf import (
+                SLEEP_IDLE_ACTIONS,
+                gnome_installed,
+                gnome_power_settings,
+                logind_idle,
+                masked_sleep_targets,
+            )
+
+            limit = policy_minutes * 60
+            logind = logind_idle()
+            masked = masked_sleep_targets()
+            users = gnome_power_settings() if gnome_installed() else {}
+
+            def effective(settings: Dict[str, Any], kind: str) -> Optional[int]:
+                if settings.get(f"sleep-inactive-{kind}-type") == "nothing":
+                    return 0
+                value = settings.get(f"sleep-inactive-{kind}-timeout")
+                return int(value) if isinstance(value, int) else None
+
+            per_user = {
+                user: {"sleep_ac_s": effective(st, "ac"), "sleep_dc_s": effective(st, "battery")}
+                for user, st in users.items()
+            }
+            idle_s = logind["idle_action_s"]
+            logind_ok = logind["idle_action"] in SLEEP_IDLE_ACTIONS and bool(idle_s) and idle_s <= limit
+            if masked:
+                ok = False
+            elif logind_ok:
+                ok = True
+            elif per_user:
+                vals = [v for u in per_user.values() for v in u.values()]
+                ok = all(v is not None and v != 0 and v <= limit for v in vals)  # 0 means never
             else:
-                result["summary"] = "Unknown desktop; sleep policy unknown"
+                ok = None
+
+            parts = []
+            if len(per_user) == 1:
+                only = next(iter(per_user.values()))
+                parts.append(f"GNOME sleep AC={only['sleep_ac_s']}s DC={only['sleep_dc_s']}s")
+            elif per_user:
+                over = [u for u, v in per_user.items() if not all(x and x <= limit for x in v.values())]
+                parts.append(f"GNOME sleep: {len(over)}/{len(per_user)} users over policy")
+            parts.append(f"logind IdleAction={logind['idle_action']}")
+            if masked:
+                parts.append(f"masked: {', '.join(masked)}")
+            result["ok"] = ok
+            result["summary"] = "; ".join(parts)
+            result["data"] = {
+                "users": per_user,
+                "logind": logind,
+                "masked_targets": masked,
+                "policy_minutes": policy_minutes,
+            }
         else:
             result["summary"] = f"Unsupported OS: {os_name}"
     except Exception as e:
@@ -296,14 +453,85 @@ def check_sleep_settings() -> Dict[str, Any]:
     return result
 
 
-def collect_all_checks(verbose: bool = False) -> Dict[str, Any]:
-    checks = {
-        "disk_encryption": check_disk_encryption(),
-        "os_updates": check_os_updates(),
-        "antivirus": check_antivirus(),
-        "sleep_policy": check_sleep_settings(),
+DEFAULT_CYCLE_DEADLINE = 60
+DEFAULT_MAX_WORKERS = 4
+
+
+class CheckSpec(NamedTuple):
+    func: Callable[[Any], Dict[str, Any]]
+    interval: int  # minutes a result stays fresh; 0 runs it every cycle
+    cost: int  # relative expense, expensive checks are started first
+    facts: Tuple[str, ...] = ()  # shared facts the check reads, see agent/facts.py
+
+
+CHECKS: Dict[str, CheckSpec] = {
+    "disk_encryption": CheckSpec(
+        check_disk_encryption, interval=24 * 60, cost=1, facts=("os_name", "tool_paths", "block_graph")
+    ),
+    "os_updates": CheckSpec(check_os_updates, interval=12 * 60, cost=10, facts=("os_name", "tool_paths")),
+    "antivirus": CheckSpec(check_antivirus, interval=0, cost=2, facts=("os_name", "processes")),
+    "sleep_policy": CheckSpec(check_sleep_settings, interval=60, cost=2, facts=("os_name",)),
+}
+
+
+def _timed_out_result(deadline: float) -> Dict[str, Any]:
+    return {
+        "ok": None,
+        "summary": f"Check did not finish within {deadline}s",
+        "data": {"reason": "timed_out"},
+        "status": "unknown",
     }
-    if verbose:
-        # Truncate verbose data to summaries
-        pass
+
+
+def _error_result(e: Exception) -> Dict[str, Any]:
+    return {"ok": None, "summary": f"error: {e}", "data": {}, "status": "unknown"}
+
+
+def is_timed_out(result: Dict[str, Any]) -> bool:
+    return (result.get("data") or {}).get("reason") == "timed_out"
+
+
+def is_unknown(result: Dict[str, Any]) -> bool:
+    """The check could not determine a state: it failed, errored or timed out."""
+    return result.get("ok") is None
+
+
+def collect_all_checks(
+    verbose: bool = False,
+    deadline: float = DEFAULT_CYCLE_DEADLINE,
+    max_workers: int = DEFAULT_MAX_WORKERS,
+    names: Optional[Iterable[str]] = None,
+    facts: Optional[Facts] = None,
+) -> Dict[str, Any]:
+    # Run every probe on a bounded pool; whatever misses the cycle deadline is
+    # reported as unknown instead of holding back the rest of the report.
+    selected = list(CHECKS) if names is None else [n for n in names if n in CHECKS]
+    if not selected:
+        return {}
+    selected.sort(key=lambda n: CHECKS[n].cost, reverse=True)
+    if facts is None:
+        facts = Facts()
+    workers = max(1, min(int(max_workers), len(selected)))
+    pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="cm-check")
+    try:
+        futures = {
+            name: pool.submit(CHECK_STATS.run, name, CHECKS[name].func, facts.view(CHECKS[name].facts, name))
+            for name in selected
+        }
+        done, _ = wait(futures.values(), timeout=deadline)
+    finally:
+        # Do not wait for stragglers; their own command timeouts bound them.
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    checks: Dict[str, Any] = {}
+    for name, fut in futures.items():
+        if fut not in done:
+            checks[name] = _timed_out_result(deadline)
+            if verbose:
+                print(f"Check {name} timed out after {deadline}s")
+            continue
+        try:
+            checks[name] = fut.result()
+        except Exception as e:
+            checks[name] = _error_result(e)
     return checks
@@ -0,0 +1,385 @@
+import configparser
+import glob
+import os
+import re
+import struct
+import threading
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+DCONF_PROFILE = "/etc/dconf/profile/user"
+DCONF_DB_DIR = "/etc/dconf/db"
+PASSWD = "/etc/passwd"
+LOGIND_CONF = "/etc/systemd/logind.conf"
+LOGIND_DROPIN_DIRS = ["/usr/lib/systemd/logind.conf.d", "/run/systemd/logind.conf.d", "/etc/systemd/logind.conf.d"]
+SYSTEMD_UNIT_DIR = "/etc/systemd/system"
+# Searched in order like GLib's XDG_DATA_DIRS default; the first compiled schema with the id wins
+SCHEMA_DIRS = ["/usr/local/share/glib-2.0/schemas", "/usr/share/glib-2.0/schemas"]
+POWER_SCHEMA_ID = "org.gnome.settings-daemon.plugins.power"
+
+POWER_PATH = "/org/gnome/settings-daemon/plugins/power/"
+# Upstream schema defaults, used when no compiled schema is found
+POWER_DEFAULTS = {
+    "sleep-inactive-ac-timeout": 1200,
+    "sleep-inactive-battery-timeout": 1200,
+    "sleep-inactive-ac-type": "suspend",
+    "sleep-inactive-battery-type": "suspend",
+}
+SLEEP_TARGETS = ["sleep.target", "suspend.target", "hibernate.target", "hybrid-sleep.target"]
+SLEEP_IDLE_ACTIONS = {"suspend", "hibernate", "hybrid-sleep", "suspend-then-hibernate"}
+
+
+# GVDB (GVariant database) reader
+
+class GvdbError(ValueError):
+    pass
+
+
+_SIGNATURE_LE = b"GVariant"
+_SIGNATURE_BE = b"raVGtnai"
+
+
+class GvdbTable:
+    """A parsed GVDB hash table: full key -> (type, raw bytes or nested table)."""
+
+    def __init__(self, data: bytes, start: int, end: int, byteswapped: bool) -> None:
+        self.data = data
+        self.swapped = byteswapped
+        self.items: Dict[str, Tuple[str, Any]] = {}
+        self._parse(start, end)
+
+    def _u32(self, off: int) -> int:
+        return struct.unpack_from(">I" if self.swapped else "<I", self.data, off)[0]
+
+    def _u16(self, off: int) -> int:
+        return struct.unpack_from(">H" if self.swapped else "<H", self.data, off)[0]
+
+    def _parse(self, start: int, end: int) -> None:
+        if end > len(self.data) or end - start < 8:
+            raise GvdbError("hash table out of range")
+        n_bloom = self._u32(start) & ((1 << 27) - 1)
+        n_buckets = self._u32(start + 4)
+        items_start = start + 8 + 4 * n_bloom + 4 * n_buckets
+        if items_start > end:
+            raise GvdbError("hash table header out of range")
+        n_items = (end - items_start) // 24
+        raw = []
+        for i in range(n_items):
+            off = items_start + 24 * i
+            parent = self._u32(off + 4)
+            key_start = self._u32(off + 8)
+            key_size = self._u16(off + 12)
+            typ = chr(self.data[off + 14])
+            vstart = self._u32(off + 16)
+            vend = self._u32(off + 20)
+            key = self.data[key_start:key_start + key_size].decode("utf-8", errors="replace")
+            raw.append((parent, key, typ, vstart, vend))
+
+        def full_key(i: int, depth: int = 0) -> str:
+            parent, key = raw[i][0], raw[i][1]
+            if parent == 0xFFFFFFFF or parent >= len(raw) or depth > 64:
+                return key
+            return full_key(parent, depth + 1) + key
+
+        for i, (_, _, typ, vstart, vend) in enumerate(raw):
+            key = full_key(i)
+            if typ == "v":
+                self.items[key] = ("v", self.data[vstart:vend])
+            elif typ == "H":
+                self.items[key] = ("H", GvdbTable(self.data, vstart, vend, self.swapped))
+
+    def get_value(self, key: str) -> Any:
+        item = self.items.get(key)
+        if not item or item[0] != "v":
+            return None
+        return decode_variant(item[1], self.swapped)
+
+    def get_table(self, key: str) -> Optional["GvdbTable"]:
+        item = self.items.get(key)
+        return item[1] if item and item[0] == "H" else None
+
+    def keys(self) -> List[str]:
+        return list(self.items)
+
+
+_BASIC = {"b": "?", "y": "B", "n": "h", "q": "H", "i": "i", "u": "I", "x": "q", "t": "Q", "d": "d"}
+
+
+def decode_variant(raw: bytes, byteswapped: bool = False) -> Any:
+    """Decode a serialized 'v' GVariant holding a basic type; None otherwise."""
+    sep = raw.rfind(b"\0")
+    if sep < 0:
+        return None
+    typ = raw[sep + 1:].decode("ascii", errors="replace")
+    body = raw[:sep]
+    if typ in ("s", "o", "g"):
+        return body.rstrip(b"\0").decode("utf-8", errors="replace")
+    fmt = _BASIC.get(typ)
+    if fmt is None:
+        return None
+    size = struct.calcsize(fmt)
+    if len(body) < size:
+        return None
+    return struct.unpack_from((">" if byteswapped else "<") + fmt, body, 0)[0]
+
+
+def schema_default(table: GvdbTable, key: str) -> Any:
+    """A key's default from a compiled GSettings schema table, None if not a basic type.
+
+    gschemas.compiled stores each key as a tuple whose first member is the
+    default, with any vendor override already applied.
+    """
+    item = table.items.get(key)
+    if not item or item[0] != "v":
+        return None
+    raw = item[1]
+    sep = raw.rfind(b"\0")
+    if sep < 0:
+        return None
+    typ = raw[sep + 1:].decode("ascii", errors="replace")
+    if not typ.startswith("(") or len(typ) < 3:
+        return None
+    first = typ[1]
+    if first in ("s", "o", "g"):
+        end = raw.find(b"\0")
+        return raw[:end].decode("utf-8", errors="replace")
+    return decode_variant(raw[:sep] + b"\0" + first.encode(), table.swapped)
+
+
+def parse_gvdb(data: bytes) -> GvdbTable:
+    if len(data) < 24:
+        raise GvdbError("file too short")
+    sig = data[:8]
+    if sig == _SIGNATURE_LE:
+        swapped = False
+    elif sig == _SIGNATURE_BE:
+        swapped = True
+    else:
+        raise GvdbError("bad signature")
+    fmt = ">II" if swapped else "<II"
+    start, end = struct.unpack_from(fmt, data, 16)
+    return GvdbTable(data, start, end, swapped)
+
+
+_DB_CACHE: Dict[str, Tuple[Tuple[int, int], Optional[GvdbTable]]] = {}
+_DB_LOCK = threading.Lock()
+
+
+def load_db(path: str) -> Optional[GvdbTable]:
+    """Parse a dconf database, reusing the previous parse while mtime/size match."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    sig = (st.st_mtime_ns, st.st_size)
+    with _DB_LOCK:
+        cached = _DB_CACHE.get(path)
+        if cached and cached[0] == sig:
+            return cached[1]
+    try:
+        with open(path, "rb") as f:
+            table: Optional[GvdbTable] = parse_gvdb(f.read())
+    except (OSError, GvdbError, struct.error):
+        table = None
+    with _DB_LOCK:
+        _DB_CACHE[path] = (sig, table)
+    return table
+
+
+def power_schema(schema_dirs: Optional[List[str]] = None) -> Optional[GvdbTable]:
+    for d in schema_dirs if schema_dirs is not None else SCHEMA_DIRS:
+        compiled = load_db(os.path.join(d, "gschemas.compiled"))
+        schema = compiled.get_table(POWER_SCHEMA_ID) if compiled else None
+        if schema is not None:
+            return schema
+    return None
+
+
+def power_defaults(schema_dirs: Optional[List[str]] = None) -> Dict[str, Any]:
+    """The power keys' defaults as installed, including distro gschema overrides."""
+    defaults = dict(POWER_DEFAULTS)
+    schema = power_schema(schema_dirs)
+    if schema is not None:
+        for key in defaults:
+            value = schema_default(schema, key)
+            if value is not None:
+                defaults[key] = value
+    return defaults
+
+
+# dconf profile resolution
+
+def read_profile(path: str = DCONF_PROFILE) -> List[Tuple[str, str]]:
+    """Return (kind, name) sources in priority order; kind is 'user' or 'system'."""
+    sources: List[Tuple[str, str]] = []
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            lines = f.read().splitlines()
+    except OSError:
+        return [("user", "user")]
+    for line in lines:
+        line = line.split("#", 1)[0].strip()
+        if line.startswith("user-db:"):
+            sources.append(("user", line[len("user-db:"):]))
+        elif line.startswith("system-db:"):
+            sources.append(("system", line[len("system-db:"):]))
+        elif line.startswith("file-db:"):
+            sources.append(("file", line[len("file-db:"):]))
+    return sources or [("user", "user")]
+
+
+def _source_path(kind: str, name: str, home: Optional[str], db_dir: str) -> Optional[str]:
+    if kind == "user":
+        return os.path.join(home, ".config", "dconf", name) if home else None
+    if kind == "file":
+        return name
+    return os.path.join(db_dir, name)
+
+
+def _locks(table: GvdbTable) -> Set[str]:
+    locks = table.get_table(".locks")
+    return set(locks.keys()) if locks else set()
+
+
+def read_key(key: str, tables: List[Optional[GvdbTable]]) -> Any:
+    """Read a key across sources, honouring locks in lower-priority databases."""
+    start = 0
+    # A lock in source i hides every source above it (lower index). As in
+    # dconf-engine the search starts at the lowest-priority end, so when
+    # several databases lock the key the last one in the profile wins.
+    for i in range(len(tables) - 1, 0, -1):
+        table = tables[i]
+        if table is not None and key in _locks(table):
+            start = i
+            break
+    for table in tables[start:]:
+        if table is None:
+            continue
+        value = table.get_value(key)
+        if value is not None:
+            return value
+    return None
+
+
+def local_users(passwd: str = PASSWD) -> List[Tuple[str, str]]:
+    users = []
+    try:
+        with open(passwd, "r", encoding="utf-8") as f:
+            lines = f.read().splitlines()
+    except OSError:
+        return users
+    for line in lines:
+        parts = line.split(":")
+        if len(parts) < 7:
+            continue
+        try:
+            uid = int(parts[2])
+        except ValueError:
+            continue
+        if 1000 <= uid < 65534:
+            users.append((parts[0], parts[5]))
+    return users
+
+
+def gnome_power_settings(
+    profile: str = DCONF_PROFILE,
+    db_dir: str = DCONF_DB_DIR,
+    passwd: str = PASSWD,
+    schema_dirs: Optional[List[str]] = None,
+) -> Dict[str, Dict[str, Any]]:
+    """Effective GNOME sleep settings per local user with a dconf database.
+
+    Falls back to a single "(system)" entry when no user has one.
+    """
+    sources = read_profile(profile)
+    defaults = power_defaults(schema_dirs)
+    system_tables = {
+        (kind, name): load_db(_source_path(kind, name, None, db_dir))
+        for kind, name in sources
+        if kind != "user"
+    }
+
+    def resolve(home: Optional[str]) -> Dict[str, Any]:
+        tables = []
+        for kind, name in sources:
+            if kind == "user":
+                path = _source_path(kind, name, home, db_dir)
+                tables.append(load_db(path) if path else None)
+            else:
+                tables.append(system_tables[(kind, name)])
+        settings = {}
+        for key, default in defaults.items():
+            value = read_key(POWER_PATH + key, tables)
+            settings[key] = default if value is None else value
+        return settings
+
+    user_db = next((name for kind, name in sources if kind == "user"), None)
+    results: Dict[str, Dict[str, Any]] = {}
+    for user, home in local_users(passwd):
+        if user_db and os.path.exists(os.path.join(home, ".config", "dconf", user_db)):
+            results[user] = resolve(home)
+    if not results:
+        results["(system)"] = resolve(None)
+    return results
+
+
+def gnome_installed(db_dir: str = DCONF_DB_DIR, schema_dirs: Optional[List[str]] = None) -> bool:
+    return power_schema(schema_dirs) is not None or bool(glob.glob(os.path.join(db_dir, "*")))
+
+
+# logind and systemd sleep targets
+
+def logind_idle(conf: str = LOGIND_CONF, dropin_dirs: Optional[List[str]] = None) -> Dict[str, Any]:
+    parser = configparser.ConfigParser(strict=False, interpolation=None)
+    files = [conf]
+    dropins: Dict[str, str] = {}
+    # Drop-ins override by file name, later directories win, applied in name order
+    for d in dropin_dirs if dropin_dirs is not None else LOGIND_DROPIN_DIRS:
+        for path in glob.glob(os.path.join(d, "*.conf")):
+            dropins[os.path.basename(path)] = path
+    files += [dropins[name] for name in sorted(dropins)]
+    parser.read(files, encoding="utf-8")
+    action = parser.get("Login", "IdleAction", fallback="ignore").strip() or "ignore"
+    sec = parse_timespan(parser.get("Login", "IdleActionSec", fallback="30min"))
+    return {"idle_action": action, "idle_action_s": sec}
+
+
+# systemd.time(7) units; "m" is minutes and "M" months
+_TIMESPAN_UNITS = {
+    "usec": 1e-6, "us": 1e-6, "\u00b5s": 1e-6,
+    "msec": 1e-3, "ms": 1e-3,
+    "seconds": 1, "second": 1, "sec": 1, "s": 1, "": 1,
+    "minutes": 60, "minute": 60, "min": 60, "m": 60,
+    "hours": 3600, "hour": 3600, "hr": 3600, "h": 3600,
+    "days": 86400, "day": 86400, "d": 86400,
+    "weeks": 604800, "week": 604800, "w": 604800,
+    "months": 2629800, "month": 2629800, "M": 2629800,
+    "years": 31557600, "year": 31557600, "y": 31557600,
+}
+_TIMESPAN_PART = re.compile(r"\s*(\d+(?:\.\d*)?|\.\d+)\s*([^\d\s.]*)")
+
+
+def parse_timespan(value: str) -> Optional[int]:
+    """Whole seconds in a systemd time span such as "30", "5min30s" or "1h 30min"; None if invalid."""
+    value = value.strip()
+    if not value:
+        return None
+    total = 0.0
+    pos = 0
+    while pos < len(value):
+        m = _TIMESPAN_PART.match(value, pos)
+        if not m or m.group(2) not in _TIMESPAN_UNITS:
+            return None
+        if not m.group(2) and m.end() < len(value) and m.end() == m.end(1):
+            return None  # "1.5.5s": a bare number must end at a space
+        total += float(m.group(1)) * _TIMESPAN_UNITS[m.group(2)]
+        pos = m.end()
+    return int(total)
+
+
+def masked_sleep_targets(unit_dir: str = SYSTEMD_UNIT_DIR) -> List[str]:
+    masked = []
+    for target in SLEEP_TARGETS:
+        path = os.path.join(unit_dir, target)
+        if os.path.islink(path) and os.readlink(path) == "/dev/null":
+            masked.append(target)
+    return masked
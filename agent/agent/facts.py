@@ -0,0 +1,187 @@
+import os
+import platform
+import shutil
+import socket
+import threading
+from typing import Any, Callable, Dict, Iterable, NamedTuple, Optional, Tuple
+
+from .recorder import MISSING, RECORDER
+from .utils import _linux_machine_id, _macos_platform_uuid, _windows_machine_guid
+
+
+class FactProvider(NamedTuple):
+    func: Callable[["Facts"], Any]
+    stable: bool  # kept across cycles until one of ``paths`` changes
+    paths: Any  # tuple of paths, or a callable returning one
+
+
+PROVIDERS: Dict[str, FactProvider] = {}
+
+# Stable facts shared by every cycle: name -> (path signature, value)
+_STABLE: Dict[str, Tuple[Any, Any]] = {}
+_STABLE_LOCK = threading.Lock()
+
+
+def fact(name: str, stable: bool = False, paths: Iterable[str] = ()) -> Callable:
+    def register(func: Callable[["Facts"], Any]) -> Callable[["Facts"], Any]:
+        PROVIDERS[name] = FactProvider(func, stable, paths if callable(paths) else tuple(paths))
+        return func
+
+    return register
+
+
+def _path_signature(paths: Iterable[str]) -> Tuple[Any, ...]:
+    sig = []
+    for path in paths:
+        try:
+            st = os.stat(path)
+            sig.append((st.st_mtime_ns, st.st_size))
+        except OSError:
+            sig.append(None)
+    return tuple(sig)
+
+
+class Facts:
+    """Raw system data for one collection cycle, each fact computed at most once."""
+
+    def __init__(self) -> None:
+        self._values: Dict[str, Any] = {}
+        self._locks: Dict[str, threading.Lock] = {}
+        self._guard = threading.Lock()
+
+    def get(self, name: str) -> Any:
+        if name in self._values:
+            return self._values[name]
+        provider = PROVIDERS[name]
+        with self._guard:
+            lock = self._locks.setdefault(name, threading.Lock())
+        # Concurrent checks asking for the same fact wait for the first one
+        with lock:
+            if name not in self._values:
+                self._values[name] = self._compute(name, provider)
+        return self._values[name]
+
+    def _compute(self, name: str, provider: FactProvider) -> Any:
+        if RECORDER.replaying:
+            value = RECORDER.fact(name)
+            if value is not MISSING:
+                return value
+        value = self._compute_live(name, provider)
+        if RECORDER.recording:
+            RECORDER.save_fact(name, value)
+        return value
+
+    def _compute_live(self, name: str, provider: FactProvider) -> Any:
+        if not provider.stable:
+            return provider.func(self)
+        paths = provider.paths() if callable(provider.paths) else provider.paths
+        sig = _path_signature(paths)
+        with _STABLE_LOCK:
+            cached = _STABLE.get(name)
+        if cached and cached[0] == sig:
+            return cached[1]
+        value = provider.func(self)
+        with _STABLE_LOCK:
+            _STABLE[name] = (sig, value)
+        return value
+
+    def view(self, names: Iterable[str], owner: str = "check") -> "FactView":
+        return FactView(self, names, owner)
+
+
+class FactView:
+    """The subset of facts a check declared; asking for anything else is an error."""
+
+    def __init__(self, facts: Facts, names: Iterable[str], owner: str) -> None:
+        self._facts = facts
+        self._names = frozenset(names)
+        self._owner = owner
+        unknown = self._names - set(PROVIDERS)
+        if unknown:
+            raise KeyError(f"{owner} declares unknown facts: {', '.join(sorted(unknown))}")
+
+    def get(self, name: str) -> Any:
+        if name not in self._names:
+            raise KeyError(f"{self._owner} did not declare fact {name!r}")
+        return self._facts.get(name)
+
+
+def facts_for(facts: Optional[Any], names: Iterable[str], owner: str) -> Any:
+    # Checks called directly (outside collect_all_checks) get a fresh cycle
+    return facts if facts is not None else Facts().view(names, owner)
+
+
+# Providers
+
+@fact("os_name", stable=True)
+def _os_name(_: Facts) -> str:
+    return platform.system()
+
+
+@fact("hostname")
+def _hostname(_: Facts) -> str:
+    return socket.gethostname()
+
+
+@fact("machine_id", stable=True, paths=("/etc/machine-id", "/var/lib/dbus/machine-id"))
+def _machine_id(facts: Facts) -> str:
+    os_name = facts.get("os_name")
+    mid = None
+    if os_name == "Windows":
+        mid = _windows_machine_guid()
+    elif os_name == "Darwin":
+        mid = _macos_platform_uuid()
+    elif os_name == "Linux":
+        mid = _linux_machine_id()
+    if not mid:
+        mid = f"{facts.get('hostname')}-{platform.platform()}"
+    return mid
+
+
+@fact("identity")
+def _identity(facts: Facts) -> Dict[str, str]:
+    return {"machine_id": facts.get("machine_id"), "hostname": facts.get("hostname"), "os": facts.get("os_name")}
+
+
+@fact("os_release", stable=True, paths=("/etc/os-release", "/usr/lib/os-release"))
+def _os_release(_: Facts) -> Dict[str, str]:
+    for path in ("/etc/os-release", "/usr/lib/os-release"):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                lines = f.read().splitlines()
+        except OSError:
+            continue
+        release = {}
+        for line in lines:
+            key, sep, value = line.partition("=")
+            if sep and not key.startswith("#"):
+                release[key.strip()] = value.strip().strip("\"'")
+        return release
+    return {}
+
+
+TOOLS = ["apt-get", "dnf", "yum", "lsblk", "ps", "softwareupdate", "fdesetup", "pmset", "manage-bde", "powercfg", "powershell"]
+
+
+def _path_dirs() -> Tuple[str, ...]:
+    return tuple(d for d in os.environ.get("PATH", "").split(os.pathsep) if d)
+
+
+@fact("tool_paths", stable=True, paths=_path_dirs)
+def _tool_paths(_: Facts) -> Dict[str, Optional[str]]:
+    # Directory mtimes change when tools are installed or removed
+    return {tool: shutil.which(tool) for tool in TOOLS}
+
+
+@fact("processes")
+def _processes(_: Facts):
+    from .processes import iter_processes
+
+    return list(iter_processes())
+
+
+@fact("block_graph")
+def _block_graph(_: Facts):
+    from .blockdev import BlockGraph
+
+    return BlockGraph.from_sysfs()
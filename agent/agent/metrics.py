@@ -0,0 +1,181 @@
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+TEXTFILE_NAME = "compliance_monitor_agent.prom"
+COUNTERS = ("cycles", "reports", "rejected_reports", "skipped", "upload_errors", "check_errors", "check_timeouts")
+
+
+class CheckStats:
+    """Wall time, CPU time and subprocesses of each check run during a cycle.
+
+    A check runs entirely on one pool thread (run_cmd drives its event loop
+    on the calling thread), so thread CPU time and a thread-local attribution
+    of commands give per-check numbers even with checks running concurrently.
+    CPU spent inside the spawned commands is only known for the whole cycle,
+    see children_cpu_seconds().
+
+    Entries are tagged with the cycle they started in: a check abandoned at
+    its deadline that returns during a later cycle is dropped, not reported
+    as part of that cycle.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._cycle = 0
+        self._checks: Dict[str, Tuple[int, Dict[str, Any]]] = {}
+
+    def run(self, name: str, func: Callable[..., Any], *args: Any) -> Any:
+        with self._lock:
+            cycle = self._cycle
+        local = self._local
+        local.processes = 0
+        local.cmd_seconds = 0.0
+        local.active = True
+        wall = time.perf_counter()
+        cpu = time.thread_time()
+        try:
+            return func(*args)
+        finally:
+            local.active = False
+            entry = {
+                "wall_ms": round((time.perf_counter() - wall) * 1000, 1),
+                "cpu_ms": round((time.thread_time() - cpu) * 1000, 1),
+                "processes": local.processes,
+                "cmd_ms": round(local.cmd_seconds * 1000, 1),
+            }
+            with self._lock:
+                if cycle == self._cycle:
+                    self._checks[name] = (cycle, entry)
+
+    def add_command(self, seconds: float) -> None:
+        local = self._local
+        if getattr(local, "active", False):
+            local.processes += 1
+            local.cmd_seconds += seconds
+
+    def snapshot(self, reset: bool = False) -> Dict[str, Dict[str, Any]]:
+        """This cycle's entries; ``reset`` also starts the next cycle."""
+        with self._lock:
+            snap = {name: entry for name, (cycle, entry) in self._checks.items() if cycle == self._cycle}
+            if reset:
+                self._checks = {}
+                self._cycle += 1
+        return snap
+
+
+CHECK_STATS = CheckStats()
+
+
+class UploadTimings:
+    """Upload attempts made during a cycle, as returned by TransportClient.take_attempts()."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._totals = {"attempts": 0, "failed": 0, "latency_ms": 0.0, "max_latency_ms": 0.0}
+
+    def add(self, attempts: List[Dict[str, Any]]) -> None:
+        with self._lock:
+            for a in attempts:
+                self._totals["attempts"] += 1
+                status = a.get("status")
+                if a.get("error") or status is None or status >= 400:
+                    self._totals["failed"] += 1
+                self._totals["latency_ms"] += a["latency_ms"]
+                self._totals["max_latency_ms"] = max(self._totals["max_latency_ms"], a["latency_ms"])
+
+    def snapshot(self, reset: bool = False) -> Dict[str, Any]:
+        with self._lock:
+            snap = dict(self._totals, latency_ms=round(self._totals["latency_ms"], 1))
+            if reset:
+                self._totals = {"attempts": 0, "failed": 0, "latency_ms": 0.0, "max_latency_ms": 0.0}
+        return snap
+
+
+UPLOAD_TIMINGS = UploadTimings()
+
+
+def children_cpu_seconds() -> Optional[float]:
+    """User+system CPU of all reaped child processes so far; None where unsupported."""
+    if resource is None:
+        return None
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+def payload_block(cycle: Dict[str, Any], counters: Dict[str, int]) -> Dict[str, Any]:
+    """The optional ``agent_metrics`` block sent with reports."""
+    return {
+        "checks": cycle["checks"],
+        "build_ms": cycle["build_ms"],
+        "hash_ms": cycle["hash_ms"],
+        "commands": cycle["commands"],
+        "children_cpu_ms": cycle["children_cpu_ms"],
+        # Uploads of this cycle are not done yet when the payload is built
+        "last_upload": cycle.get("last_upload"),
+        "counters": dict(counters),
+    }
+
+
+def _value(value: float) -> str:
+    return str(value) if isinstance(value, int) else repr(round(float(value), 6))
+
+
+def _labels(**labels: str) -> str:
+    inner = ",".join(f'{k}="{v}"' for k, v in labels.items())
+    return "{" + inner + "}" if inner else ""
+
+
+def render_textfile(cycle: Dict[str, Any], counters: Dict[str, int]) -> str:
+    """Prometheus text exposition of the last cycle plus the running counters."""
+    lines: List[str] = []
+
+    def metric(name: str, kind: str, help_text: str, samples: List[tuple]) -> None:
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for labels, value in samples:
+            lines.append(f"{name}{_labels(**labels)} {_value(value)}")
+
+    checks = cycle["checks"]
+    metric("cm_agent_check_duration_seconds", "gauge", "Wall time of each check run in the last cycle.",
+           [({"check": n}, c["wall_ms"] / 1000) for n, c in sorted(checks.items())])
+    metric("cm_agent_check_cpu_seconds", "gauge", "Agent CPU time of each check run in the last cycle.",
+           [({"check": n}, c["cpu_ms"] / 1000) for n, c in sorted(checks.items())])
+    metric("cm_agent_check_subprocesses", "gauge", "Commands spawned by each check in the last cycle.",
+           [({"check": n}, c["processes"]) for n, c in sorted(checks.items())])
+    metric("cm_agent_build_duration_seconds", "gauge", "Time to build the last payload, checks included.",
+           [({}, cycle["build_ms"] / 1000)])
+    metric("cm_agent_hash_duration_seconds", "gauge", "Time to hash the last payload.", [({}, cycle["hash_ms"] / 1000)])
+    if cycle["children_cpu_ms"] is not None:
+        metric("cm_agent_subprocess_cpu_seconds", "gauge", "CPU time of commands spawned in the last cycle.",
+               [({}, cycle["children_cpu_ms"] / 1000)])
+    metric("cm_agent_subprocesses", "gauge", "Commands spawned in the last cycle.", [({}, cycle["commands"]["processes"])])
+    upload = cycle["upload"]
+    metric("cm_agent_upload_attempts", "gauge", "Upload attempts in the last cycle.",
+           [({"result": "ok"}, upload["attempts"] - upload["failed"]), ({"result": "failed"}, upload["failed"])])
+    metric("cm_agent_upload_duration_seconds", "gauge", "Total upload latency in the last cycle.",
+           [({}, upload["latency_ms"] / 1000)])
+    metric("cm_agent_upload_bytes", "gauge", "Report bytes uploaded in the last cycle.",
+           [({"encoding": "raw"}, upload["raw_bytes"]), ({"encoding": "sent"}, upload["sent_bytes"])])
+    metric("cm_agent_outbox_pending", "gauge", "Reports queued and not yet acknowledged.", [({}, cycle["outbox_pending"])])
+    for name in COUNTERS:
+        metric(f"cm_agent_{name}_total", "counter", f"Cumulative {name.replace('_', ' ')}.", [({}, counters.get(name, 0))])
+    metric("cm_agent_last_cycle_timestamp_seconds", "gauge", "When the last cycle finished.", [({}, int(cycle["finished"]))])
+    return "\n".join(lines) + "\n"
+
+
+def write_textfile(path: str, text: str) -> None:
+    """Atomically replace the textfile so node_exporter never reads half of it."""
+    if os.path.isdir(path):
+        path = os.path.join(path, TEXTFILE_NAME)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp, path)
@@ -0,0 +1,220 @@
+import json
+import os
+import time
+import uuid
+import zlib
+from collections import deque
+from itertools import islice
+from typing import Any, Dict, List, Optional
+
+SEGMENT_FILENAME = "outbox.seg"
+META_FILENAME = "outbox.meta.json"
+REJECTED_FILENAME = "outbox.rejected"
+REJECTED_MAX_BYTES = 1024 * 1024
+DEFAULT_MAX_BYTES = 10 * 1024 * 1024
+DEFAULT_MAX_AGE = 30 * 24 * 3600
+
+
+def _encode(record: Dict[str, Any]) -> bytes:
+    body = json.dumps(record, separators=(",", ":")).encode("utf-8")
+    return b"%08x " % zlib.crc32(body) + body + b"\n"
+
+
+def _decode(line: bytes) -> Optional[Dict[str, Any]]:
+    if len(line) < 10 or not line.endswith(b"\n") or line[8:9] != b" ":
+        return None
+    body = line[9:-1]
+    try:
+        if int(line[:8], 16) != zlib.crc32(body):
+            return None
+        return json.loads(body)
+    except ValueError:
+        return None
+
+
+def _fsync_dir(path: str) -> None:
+    if os.name == "nt":
+        return
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+class Outbox:
+    """Crash-safe append-only queue of reports waiting to be delivered.
+
+    Each record is one CRC-prefixed JSON line, fsync'd on append. A torn
+    tail left by a crash fails its CRC and is cut off on the next open.
+    Every record carries the agent instance id it is sent under, so a lost
+    or damaged metadata file cannot make the server take a resend for a new
+    report. Records that need no delivery (acknowledged, dead-lettered or
+    dropped by the caps) are tracked by sequence number in a small metadata
+    file; the segment is compacted once they outweigh the pending ones.
+    Records the server refuses for good are moved to a dead-letter file.
+    """
+
+    def __init__(self, directory: str, max_bytes: int = DEFAULT_MAX_BYTES, max_age: int = DEFAULT_MAX_AGE) -> None:
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.seg_path = os.path.join(directory, SEGMENT_FILENAME)
+        self.meta_path = os.path.join(directory, META_FILENAME)
+        self.rejected_path = os.path.join(directory, REJECTED_FILENAME)
+        os.makedirs(directory, exist_ok=True)
+        self._records = deque()  # pending records, oldest first
+        self._sizes = deque()  # encoded size of each pending record
+        self._bytes = 0  # sum of _sizes
+        self._seg_bytes = 0  # size of the segment file, settled records included
+        meta = self._load_meta()
+        records = self._read_segment()
+        if meta is None:
+            # Resume the instance the surviving records were queued under and
+            # resend all of them; the server drops the ones it already has.
+            instance = next((r["instance"] for r in reversed(records) if "instance" in r), None)
+            meta = {"instance": instance or uuid.uuid4().hex}
+        meta.setdefault("next_seq", 1)
+        meta.setdefault("acked", 0)
+        meta.setdefault("dropped", 0)
+        meta.setdefault("rejected", 0)
+        self.meta = meta
+        for rec in records:
+            if rec["seq"] > meta["acked"]:
+                self._push(rec)
+        top = max((r["seq"] for r in records), default=0)
+        self.meta["next_seq"] = max(self.meta["next_seq"], top + 1)
+
+    def _load_meta(self) -> Optional[Dict[str, Any]]:
+        try:
+            with open(self.meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return None
+        # The instance id lets the server tell a reinstalled agent from a replay
+        if not isinstance(meta, dict) or not isinstance(meta.get("instance"), str):
+            return None
+        return meta
+
+    def _write_meta(self) -> None:
+        tmp = self.meta_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.meta, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.meta_path)
+        _fsync_dir(self.directory)
+
+    def _read_segment(self) -> List[Dict[str, Any]]:
+        records = []
+        good = 0
+        try:
+            with open(self.seg_path, "rb") as f:
+                for line in f:
+                    rec = _decode(line)
+                    if rec is None:
+                        break
+                    records.append(rec)
+                    good += len(line)
+        except OSError:
+            return records
+        if good != os.path.getsize(self.seg_path):
+            with open(self.seg_path, "r+b") as f:
+                f.truncate(good)
+                f.flush()
+                os.fsync(f.fileno())
+        self._seg_bytes = good
+        return records
+
+    def _push(self, rec: Dict[str, Any]) -> None:
+        size = len(_encode(rec))
+        self._records.append(rec)
+        self._sizes.append(size)
+        self._bytes += size
+
+    def _pop(self) -> Dict[str, Any]:
+        self._bytes -= self._sizes.popleft()
+        return self._records.popleft()
+
+    def _compact(self) -> None:
+        # Rewrite the segment with only the pending records once the settled
+        # ones take more space than they do; that keeps appends and acks cheap
+        settled = self._seg_bytes - self._bytes
+        if not settled or (self._records and settled <= self._bytes):
+            return
+        tmp = self.seg_path + ".tmp"
+        with open(tmp, "wb") as f:
+            for rec in self._records:
+                f.write(_encode(rec))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.seg_path)
+        _fsync_dir(self.directory)
+        self._seg_bytes = self._bytes
+
+    @property
+    def instance(self) -> str:
+        return self.meta["instance"]
+
+    def append(self, payload: Dict[str, Any], version: str, now: Optional[float] = None) -> int:
+        now = time.time() if now is None else now
+        seq = self.meta["next_seq"]
+        rec = {"seq": seq, "ts": int(now), "version": version, "instance": self.instance, "payload": payload}
+        line = _encode(rec)
+        with open(self.seg_path, "ab") as f:
+            f.write(line)
+            f.flush()
+            os.fsync(f.fileno())
+        self._seg_bytes += len(line)
+        self._push(rec)
+        self.meta["next_seq"] = seq + 1
+        self._enforce_caps(now)
+        self._write_meta()
+        return seq
+
+    def _enforce_caps(self, now: float) -> None:
+        # Oldest reports go first, when too old or when the outbox outgrows its size cap
+        dropped = 0
+        while self._records and (self._bytes > self.max_bytes or now - self._records[0]["ts"] > self.max_age):
+            self.meta["acked"] = self._pop()["seq"]
+            dropped += 1
+        if dropped:
+            self.meta["dropped"] += dropped
+            self._compact()
+
+    def pending(self, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        return list(islice(self._records, limit or None))
+
+    def ack(self, seq: int) -> None:
+        if seq <= self.meta["acked"]:
+            return
+        self.meta["acked"] = seq
+        while self._records and self._records[0]["seq"] <= seq:
+            self._pop()
+        self._write_meta()
+        self._compact()
+
+    def reject(self, record: Dict[str, Any], status: Optional[int], error: Optional[str] = None,
+               now: Optional[float] = None) -> None:
+        """Dead-letter the oldest pending record so the ones behind it can be sent."""
+        now = time.time() if now is None else now
+        line = _encode(dict(record, rejected_at=int(now), status=status, error=error))
+        try:
+            if os.path.getsize(self.rejected_path) + len(line) > REJECTED_MAX_BYTES:
+                os.replace(self.rejected_path, self.rejected_path + ".1")
+        except OSError:
+            pass
+        with open(self.rejected_path, "ab") as f:
+            f.write(line)
+            f.flush()
+            os.fsync(f.fileno())
+        self.meta["rejected"] += 1
+        self.ack(record["seq"])
+
+    def __len__(self) -> int:
+        return len(self._records)
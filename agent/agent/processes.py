@@ -0,0 +1,136 @@
+import os
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+PROC_ROOT = "/proc"
+
+
+class SignatureSet:
+    """Exact process-name and install-path signatures for known products."""
+
+    def __init__(self, names: Dict[str, str], path_prefixes: Optional[Dict[str, str]] = None) -> None:
+        # Matching is case-insensitive; keys are lowercased once up front
+        self.names = {name.lower(): label for name, label in names.items()}
+        self.prefixes: List[Tuple[str, str]] = sorted(
+            ((prefix.lower(), label) for prefix, label in (path_prefixes or {}).items()),
+            key=lambda item: len(item[0]),
+            reverse=True,
+        )
+
+    def match(self, name: Optional[str], exe: Optional[str]) -> Optional[str]:
+        if name:
+            label = self.names.get(name.lower())
+            if label:
+                return label
+        if exe:
+            exe_l = exe.lower()
+            label = self.names.get(os.path.basename(exe_l))
+            if label:
+                return label
+            for prefix, label in self.prefixes:
+                if exe_l.startswith(prefix):
+                    return label
+        return None
+
+
+def _read_first_line(path: str) -> Optional[str]:
+    try:
+        with open(path, "rb") as f:
+            return f.readline().decode("utf-8", errors="replace").rstrip("\n")
+    except OSError:
+        return None
+
+
+def iter_proc_processes(proc_root: str = PROC_ROOT) -> Iterator[Tuple[Optional[str], Optional[str]]]:
+    """Yield (comm, exe) for each process by walking procfs directly."""
+    with os.scandir(proc_root) as entries:
+        for entry in entries:
+            if not entry.name.isdigit():
+                continue
+            base = entry.path
+            comm = _read_first_line(os.path.join(base, "comm"))
+            try:
+                exe = os.readlink(os.path.join(base, "exe"))
+            except OSError:
+                # Kernel threads and other users' processes without privileges
+                exe = None
+            if comm is None and exe is None:
+                continue
+            if exe and exe.endswith(" (deleted)"):
+                exe = exe[: -len(" (deleted)")]
+            yield comm, exe
+
+
+def iter_psutil_processes() -> Iterator[Tuple[Optional[str], Optional[str]]]:
+    import psutil
+
+    for proc in psutil.process_iter(["name", "exe"], ad_value=None):
+        info = proc.info
+        yield info.get("name"), info.get("exe")
+
+
+def iter_processes(proc_root: str = PROC_ROOT) -> Iterator[Tuple[Optional[str], Optional[str]]]:
+    if os.path.isdir(os.path.join(proc_root, "self")):
+        return iter_proc_processes(proc_root)
+    return iter_psutil_processes()
+
+
+def find_signatures(signatures: SignatureSet, processes: Optional[Iterable[Tuple[Optional[str], Optional[str]]]] = None) -> List[str]:
+    if processes is None:
+        processes = iter_processes()
+    found = set()
+    for name, exe in processes:
+        label = signatures.match(name, exe)
+        if label:
+            found.add(label)
+    return sorted(found)
+
+
+LINUX_AV_SIGNATURES = SignatureSet(
+    names={
+        "clamd": "clamd",
+        "freshclam": "freshclam",
+        "savd": "sophos",
+        "sophos-spl": "sophos",
+        "sophosav": "sophos",
+        "csagent": "crowdstrike",
+        "falcon-sensor": "crowdstrike",
+        "falcond": "crowdstrike",
+        "sentinel-agent": "sentinelone",
+        "s1-agent": "sentinelone",
+        "wdavdaemon": "defender",
+    },
+    path_prefixes={
+        "/opt/sophos-spl/": "sophos",
+        "/opt/sophos-av/": "sophos",
+        "/opt/crowdstrike/": "crowdstrike",
+        "/opt/sentinelone/": "sentinelone",
+        "/opt/microsoft/mdatp/": "defender",
+    },
+)
+
+DARWIN_AV_SIGNATURES = SignatureSet(
+    names={
+        "clamd": "clamd",
+        "sophosscand": "sophos",
+        "sophosantivirus": "sophos",
+        "sentinelagent": "sentinelone",
+        "sentineld": "sentinelone",
+        "falcond": "crowdstrike",
+        "com.crowdstrike.falcon.agent": "crowdstrike",
+        "cbdefense": "carbonblack",
+        "rtprotectiondaemon": "malwarebytes",
+        "symdaemon": "symantec",
+        "wdavdaemon": "defender",
+    },
+    path_prefixes={
+        "/library/application support/symantec/": "symantec",
+        "/library/sophos anti-virus/": "sophos",
+        "/library/sentinel/": "sentinelone",
+        "/library/cs/": "crowdstrike",
+        "/applications/falcon.app/": "crowdstrike",
+        "/applications/vmware carbon black cloud/": "carbonblack",
+        "/library/application support/malwarebytes/": "malwarebytes",
+        "/applications/malwarebytes.app/": "malwarebytes",
+        "/applications/microsoft defender.app/": "defender",
+    },
+)
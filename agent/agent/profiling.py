@@ -0,0 +1,257 @@
+import cProfile
+import io
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Any, Callable, Dict, List, Optional
+
+MODES = ("sample", "cprofile")
+DEFAULT_INTERVAL = 0.005
+DEFAULT_MAX_BYTES = 50 * 1024 * 1024
+PROFILE_PREFIX = "cycle-"
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class StackSampler:
+    """Wall-clock sampler over every thread, collecting collapsed stacks.
+
+    A background thread snapshots sys._current_frames() every ``interval``
+    seconds, so check worker threads are covered and the profiled code runs
+    unmodified. Blocked threads show up where they wait.
+    """
+
+    def __init__(self, interval: float = DEFAULT_INTERVAL) -> None:
+        self.interval = interval
+        self.samples: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _run(self) -> None:
+        me = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_label(frame))
+                    frame = frame.f_back
+                stack.append(names.get(ident, f"thread-{ident}"))
+                self.samples[";".join(reversed(stack))] += 1
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._run, name="cm-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def collapsed(self) -> str:
+        """One ``frame;frame;frame count`` line per stack, as flamegraph.pl and speedscope read."""
+        return "".join(f"{stack} {count}\n" for stack, count in self.samples.most_common())
+
+    def summary(self, top: int = 30) -> str:
+        total = sum(self.samples.values())
+        own: Counter = Counter()
+        for stack, count in self.samples.items():
+            own[stack.rsplit(";", 1)[-1]] += count
+        lines = [f"{total} samples every {self.interval * 1000:g} ms", "", "  samples      %  innermost frame"]
+        for frame, count in own.most_common(top):
+            lines.append(f"{count:>9} {100 * count / max(total, 1):>6.1f}  {frame}")
+        return "\n".join(lines) + "\n"
+
+
+def _func_label(func) -> str:
+    filename, lineno, name = func
+    if filename == "~":  # built-ins
+        return name
+    return f"{name} ({os.path.basename(filename)}:{lineno})"
+
+
+def collapsed_from_stats(stats: pstats.Stats, max_depth: int = 64) -> str:
+    """Collapsed stacks from a pstats call graph, weighted in microseconds.
+
+    pstats keeps caller/callee edges, not whole stacks, so a function's time
+    is split between its callees in proportion to the time spent along each
+    edge. Recursive calls are cut at the first repeat.
+    """
+    children: Dict[Any, List[Any]] = {}
+    for func, (_, _, _, _, callers) in stats.stats.items():
+        for caller, edge in callers.items():
+            if isinstance(edge, tuple):  # (cc, nc, tt, ct) from cProfile
+                children.setdefault(caller, []).append((func, edge[3]))
+    folded: Counter = Counter()
+
+    def walk(func, seconds: float, path: List[str], seen: set) -> None:
+        _, _, tt, ct, _ = stats.stats[func]
+        path = path + [_func_label(func)]
+        if ct <= 0:
+            return
+        nested = [(c, edge) for c, edge in children.get(func, []) if c not in seen] if len(path) < max_depth else []
+        own = seconds * (ct - sum(edge for _, edge in nested)) / ct
+        if own > 0:
+            folded[";".join(path)] += own
+        for callee, edge in nested:
+            walk(callee, seconds * edge / ct, path, seen | {callee})
+
+    for func, (_, _, _, ct, callers) in stats.stats.items():
+        if not callers:
+            walk(func, ct, [], {func})
+    lines = [(stack, round(seconds * 1e6)) for stack, seconds in folded.most_common()]
+    return "".join(f"{stack} {us}\n" for stack, us in lines if us > 0)
+
+
+class ThreadProfiles:
+    """Deterministic cProfile of the calling thread and every thread started while active.
+
+    Up to Python 3.11 cProfile hooks a single thread, so each new thread gets
+    its own profile through threading.setprofile. From 3.12 cProfile runs on
+    sys.monitoring, which is process-wide: one profile already sees every
+    thread and a second one cannot be enabled.
+    """
+
+    PER_THREAD = sys.version_info < (3, 12)
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._profiles: List[cProfile.Profile] = []
+
+    def _new_profile(self) -> cProfile.Profile:
+        profile = cProfile.Profile()
+        with self._lock:
+            self._profiles.append(profile)
+        return profile
+
+    def _thread_hook(self, *_: Any) -> None:
+        # Runs on the first profiling event of a new thread; hand over to cProfile.
+        # A failure here must not kill the thread, it would just go unprofiled.
+        sys.setprofile(None)
+        try:
+            self._new_profile().enable()
+        except ValueError:
+            pass
+
+    def start(self) -> None:
+        if self.PER_THREAD:
+            threading.setprofile(self._thread_hook)
+        self._main = self._new_profile()
+        self._main.enable()
+
+    def stop(self) -> pstats.Stats:
+        self._main.disable()
+        if self.PER_THREAD:
+            threading.setprofile(None)
+        with self._lock:
+            profiles = [p for p in self._profiles if p is not self._main]
+        stats = pstats.Stats(self._main)
+        for profile in profiles:
+            try:
+                stats.add(profile)
+            except (TypeError, ValueError):
+                pass  # a thread that recorded nothing
+        return stats
+
+
+class CycleProfiler:
+    """Profiles agent cycles into ``directory``, keeping it under ``max_bytes``.
+
+    Both modes write ``cycle-<time>.folded`` (collapsed stacks; concatenate
+    several for one flame graph) and a ``.txt`` summary; ``cprofile`` also
+    writes a ``.pstats`` file for pstats/snakeviz.
+    """
+
+    def __init__(self, mode: str, directory: str, max_bytes: int = DEFAULT_MAX_BYTES,
+                 interval: float = DEFAULT_INTERVAL) -> None:
+        if mode not in MODES:
+            raise ValueError(f"CM_PROFILE must be one of {', '.join(MODES)}")
+        self.mode = mode
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.interval = interval
+        os.makedirs(directory, exist_ok=True)
+
+    def run(self, func: Callable[..., Any], *args: Any) -> Any:
+        now = time.time()
+        stamp = f"{time.strftime('%Y%m%d-%H%M%S', time.localtime(now))}.{int(now * 1000) % 1000:03d}"
+        base = os.path.join(self.directory, f"{PROFILE_PREFIX}{stamp}-{os.getpid()}")
+        if self.mode == "sample":
+            return self._run_sampled(base, func, *args)
+        profiles = ThreadProfiles()
+        try:
+            profiles.start()
+        except ValueError:
+            # Another profiler (sys.monitoring tool) is already active
+            return self._run_sampled(base, func, *args)
+        started = time.perf_counter()
+        try:
+            return func(*args)
+        finally:
+            stats = profiles.stop()
+            elapsed = time.perf_counter() - started
+            try:
+                stats.dump_stats(f"{base}.pstats")
+            except OSError:
+                pass
+            self._write(f"{base}.folded", collapsed_from_stats(stats))
+            out = io.StringIO()
+            stats.stream = out
+            stats.sort_stats("cumulative").print_stats(40)
+            self._write(f"{base}.txt", f"cycle took {elapsed:.3f}s\n{out.getvalue()}")
+            self.rotate()
+
+    def _run_sampled(self, base: str, func: Callable[..., Any], *args: Any) -> Any:
+        started = time.perf_counter()
+        sampler = StackSampler(self.interval)
+        sampler.start()
+        try:
+            return func(*args)
+        finally:
+            sampler.stop()
+            elapsed = time.perf_counter() - started
+            self._write(f"{base}.folded", sampler.collapsed())
+            self._write(f"{base}.txt", f"cycle took {elapsed:.3f}s\n{sampler.summary()}")
+            self.rotate()
+
+    def _write(self, path: str, text: str) -> None:
+        try:
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(text)
+        except OSError:
+            pass
+
+    def rotate(self) -> None:
+        """Delete the oldest cycles' profiles until the directory fits the cap."""
+        cycles: Dict[str, List[Any]] = {}  # file name without extension -> [size, mtime, paths]
+        for name in os.listdir(self.directory):
+            if not name.startswith(PROFILE_PREFIX):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            entry = cycles.setdefault(os.path.splitext(name)[0], [0, 0.0, []])
+            entry[0] += st.st_size
+            entry[1] = max(entry[1], st.st_mtime)
+            entry[2].append(path)
+        total = sum(size for size, _, _ in cycles.values())
+        for base in sorted(cycles, key=lambda b: (cycles[b][1], b)):
+            if total <= self.max_bytes:
+                break
+            size, _, paths = cycles[base]
+            for path in paths:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            total -= size
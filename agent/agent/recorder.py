@@ -0,0 +1,114 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+FACTS_FILENAME = "facts.json"
+# Facts that are plain data and decide which probe a check runs; the rest
+# (process table, block devices) are read live even when replaying
+RECORDED_FACTS = ("os_name", "hostname", "machine_id", "identity", "os_release", "tool_paths")
+MISSING = object()
+
+
+def fixture_name(cmd: List[str]) -> str:
+    """File name for a command's fixture: readable prefix plus a hash of the exact argv."""
+    slug = re.sub(r"[^A-Za-z0-9._-]+", "_", " ".join(cmd)).strip("_")[:60]
+    digest = hashlib.sha1(json.dumps(cmd).encode("utf-8")).hexdigest()[:10]
+    return f"{slug}-{digest}.json"
+
+
+def _write_json(path: str, data: Any) -> None:
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=1)
+    os.replace(tmp, path)
+
+
+class CommandRecorder:
+    """Captures run_cmd output into fixture files, or serves it back instead of spawning.
+
+    In record mode every command writes ``<name>.json`` holding argv, exit
+    code, stdout, stderr and duration, and the facts in RECORDED_FACTS go to
+    facts.json. In replay mode run_cmd and those facts are answered from the
+    directory, so a recording made on Windows or macOS runs on any machine.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.mode: Optional[str] = None
+        self.directory: Optional[str] = None
+        self._facts: Dict[str, Any] = {}
+
+    def configure(self, mode: Optional[str], directory: Optional[str] = None) -> None:
+        if mode not in (None, "record", "replay"):
+            raise ValueError(f"unknown recorder mode: {mode}")
+        with self._lock:
+            self.mode = mode if directory else None
+            self.directory = directory
+            self._facts = {}
+            if self.mode == "record":
+                os.makedirs(directory, exist_ok=True)
+            elif self.mode == "replay":
+                try:
+                    with open(os.path.join(directory, FACTS_FILENAME), "r", encoding="utf-8") as f:
+                        self._facts = json.load(f)
+                except (OSError, ValueError):
+                    self._facts = {}
+
+    @property
+    def recording(self) -> bool:
+        return self.mode == "record"
+
+    @property
+    def replaying(self) -> bool:
+        return self.mode == "replay"
+
+    def save(self, cmd: List[str], code: int, out: str, err: str, duration: float) -> None:
+        fixture = {
+            "cmd": list(cmd),
+            "code": code,
+            "stdout": out,
+            "stderr": err,
+            "duration_ms": round(duration * 1000, 2),
+            "recorded_at": int(time.time()),
+        }
+        try:
+            _write_json(os.path.join(self.directory, fixture_name(cmd)), fixture)
+        except OSError:
+            pass
+
+    def replay(self, cmd: List[str], on_line: Optional[Callable[[str], bool]] = None) -> Tuple[int, str, str]:
+        try:
+            with open(os.path.join(self.directory, fixture_name(cmd)), "r", encoding="utf-8") as f:
+                fixture = json.load(f)
+        except (OSError, ValueError):
+            # Same shape as a command that is not installed
+            return 127, "", f"no recorded output for: {' '.join(cmd)}"
+        out = fixture.get("stdout", "")
+        if on_line is not None:
+            # Feed lines the way the live reader does, stopping where it would
+            pos = 0
+            for line in out.split("\n"):
+                pos += len(line) + 1
+                if on_line(line):
+                    return 0, out[:pos], fixture.get("stderr", "")
+        return fixture.get("code", 1), out, fixture.get("stderr", "")
+
+    def fact(self, name: str) -> Any:
+        return self._facts.get(name, MISSING)
+
+    def save_fact(self, name: str, value: Any) -> None:
+        if name not in RECORDED_FACTS:
+            return
+        with self._lock:
+            self._facts[name] = value
+            try:
+                _write_json(os.path.join(self.directory, FACTS_FILENAME), self._facts)
+            except (OSError, TypeError, ValueError):
+                pass
+
+
+RECORDER = CommandRecorder()
@@ -0,0 +1,469 @@
+import bz2
+import configparser
+import fnmatch
+import glob
+import gzip
+import lzma
+import os
+import re
+import shutil
+import sqlite3
+import struct
+import tempfile
+import threading
+import time
+import xml.etree.ElementTree as ET
+from typing import Any, Dict, List, Optional, Tuple
+
+RPMDB_PATHS = ["/var/lib/rpm/rpmdb.sqlite", "/usr/lib/sysimage/rpm/rpmdb.sqlite"]
+REPO_CACHE_GLOBS = [
+    "/var/cache/dnf/*/repodata",
+    "/var/cache/libdnf5/*/repodata",
+    "/var/cache/yum/*/*/*",
+]
+MAIN_CONFS = ["/etc/dnf/dnf.conf", "/etc/yum.conf"]
+REPO_CONF_DIRS = ["/etc/yum.repos.d", "/etc/distro.repos.d"]
+VERSIONLOCK_LISTS = ["/etc/dnf/plugins/versionlock.list", "/etc/yum/pluginconf.d/versionlock.list"]
+
+TAG_NAME = 1000
+TAG_VERSION = 1001
+TAG_RELEASE = 1002
+TAG_EPOCH = 1003
+TAG_ARCH = 1022
+_WANTED_TAGS = {TAG_NAME, TAG_VERSION, TAG_RELEASE, TAG_EPOCH, TAG_ARCH}
+
+Evr = Tuple[int, str, str]
+# Per-repo package filters: (exclude globs, include globs); no includes means all
+RepoFilter = Tuple[Tuple[str, ...], Tuple[str, ...]]
+
+# dnf names its cache directories "<repoid>-<16 hex digits>"
+_CACHE_SUFFIX = re.compile(r"-[0-9a-f]{16}$")
+
+
+# rpm version comparison (rpmvercmp)
+
+def _segments(s: str) -> List[str]:
+    out = []
+    i = 0
+    while i < len(s):
+        c = s[i]
+        if c in "~^":
+            out.append(c)
+            i += 1
+        elif c.isdigit():
+            j = i
+            while j < len(s) and s[j].isdigit():
+                j += 1
+            out.append(s[i:j])
+            i = j
+        elif c.isalpha() and c.isascii():
+            j = i
+            while j < len(s) and s[j].isalpha() and s[j].isascii():
+                j += 1
+            out.append(s[i:j])
+            i = j
+        else:
+            i += 1  # separators only delimit segments
+    return out
+
+
+def rpmvercmp(a: str, b: str) -> int:
+    if a == b:
+        return 0
+    sa, sb = _segments(a), _segments(b)
+    i = 0
+    while True:
+        x = sa[i] if i < len(sa) else None
+        y = sb[i] if i < len(sb) else None
+        # Tilde sorts before anything, even the end of the string
+        if x == "~" or y == "~":
+            if x != "~":
+                return 1
+            if y != "~":
+                return -1
+            i += 1
+            continue
+        # Caret sorts after the end of the string but before anything else
+        if x == "^" or y == "^":
+            if x is None:
+                return -1
+            if y is None:
+                return 1
+            if x != "^":
+                return 1
+            if y != "^":
+                return -1
+            i += 1
+            continue
+        if x is None or y is None:
+            if x is None and y is None:
+                return 0
+            return -1 if x is None else 1
+        if x.isdigit() != y.isdigit():
+            return 1 if x.isdigit() else -1
+        if x.isdigit():
+            xi, yi = x.lstrip("0"), y.lstrip("0")
+            if len(xi) != len(yi):
+                return 1 if len(xi) > len(yi) else -1
+            x, y = xi, yi
+        if x != y:
+            return 1 if x > y else -1
+        i += 1
+
+
+def compare_evr(a: Evr, b: Evr) -> int:
+    if a[0] != b[0]:
+        return 1 if a[0] > b[0] else -1
+    return rpmvercmp(a[1], b[1]) or rpmvercmp(a[2], b[2])
+
+
+# Installed packages from the sqlite rpmdb
+
+def parse_header(blob: bytes) -> Dict[int, Any]:
+    """Decode the tags we need from an rpm header blob (no lead/magic)."""
+    il, dl = struct.unpack_from(">ii", blob, 0)
+    data_start = 8 + il * 16
+    tags: Dict[int, Any] = {}
+    for n in range(il):
+        tag, typ, offset, count = struct.unpack_from(">iiii", blob, 8 + n * 16)
+        if tag not in _WANTED_TAGS:
+            continue
+        pos = data_start + offset
+        if typ == 4:  # INT32
+            tags[tag] = struct.unpack_from(">i", blob, pos)[0]
+        elif typ in (6, 8, 9):  # STRING, STRING_ARRAY, I18NSTRING: first string
+            end = blob.index(b"\0", pos)
+            tags[tag] = blob[pos:end].decode("utf-8", errors="replace")
+    return tags
+
+
+def _connect_ro(path: str) -> sqlite3.Connection:
+    try:
+        conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+        conn.execute("SELECT 1 FROM sqlite_master LIMIT 1")
+        return conn
+    except sqlite3.Error:
+        # Without write access to the -shm file WAL databases need immutable mode
+        return sqlite3.connect(f"file:{path}?mode=ro&immutable=1", uri=True)
+
+
+def read_installed(path: str) -> Dict[Tuple[str, str], Evr]:
+    installed: Dict[Tuple[str, str], Evr] = {}
+    conn = _connect_ro(path)
+    try:
+        for (blob,) in conn.execute("SELECT blob FROM Packages"):
+            tags = parse_header(bytes(blob))
+            name = tags.get(TAG_NAME)
+            if not name or name == "gpg-pubkey":
+                continue
+            key = (name, tags.get(TAG_ARCH) or "noarch")
+            evr = (int(tags.get(TAG_EPOCH) or 0), tags.get(TAG_VERSION, ""), tags.get(TAG_RELEASE, ""))
+            # Install-only packages (kernels) keep several versions; the newest counts
+            prev = installed.get(key)
+            if prev is None or compare_evr(evr, prev) > 0:
+                installed[key] = evr
+    finally:
+        conn.close()
+    return installed
+
+
+# Available packages from cached repo metadata
+
+def _open_maybe_compressed(path: str):
+    if path.endswith(".gz"):
+        return gzip.open(path, "rb")
+    if path.endswith(".bz2"):
+        return bz2.open(path, "rb")
+    if path.endswith(".xz"):
+        return lzma.open(path, "rb")
+    if path.endswith(".zst"):
+        import zstandard  # optional; skipped by the caller when missing
+
+        return zstandard.ZstdDecompressor().stream_reader(open(path, "rb"), closefd=True)
+    return open(path, "rb")
+
+
+def _merge(best: Dict[Tuple[str, str], Evr], key: Tuple[str, str], evr: Evr) -> None:
+    prev = best.get(key)
+    if prev is None or compare_evr(evr, prev) > 0:
+        best[key] = evr
+
+
+def read_primary_xml(path: str) -> Dict[Tuple[str, str], Evr]:
+    best: Dict[Tuple[str, str], Evr] = {}
+    with _open_maybe_compressed(path) as f:
+        for _, elem in ET.iterparse(f, events=("end",)):
+            if not elem.tag.endswith("}package") and elem.tag != "package":
+                continue
+            name = arch = None
+            evr: Optional[Evr] = None
+            for child in elem:
+                tag = child.tag.rsplit("}", 1)[-1]
+                if tag == "name":
+                    name = child.text
+                elif tag == "arch":
+                    arch = child.text
+                elif tag == "version":
+                    evr = (int(child.get("epoch") or 0), child.get("ver") or "", child.get("rel") or "")
+            if name and arch and evr and arch != "src":
+                _merge(best, (name, arch), evr)
+            elem.clear()
+    return best
+
+
+def read_primary_sqlite(path: str) -> Dict[Tuple[str, str], Evr]:
+    best: Dict[Tuple[str, str], Evr] = {}
+    tmp = None
+    if path.endswith((".bz2", ".xz", ".gz", ".zst")):
+        fd, tmp = tempfile.mkstemp(suffix=".sqlite")
+        with os.fdopen(fd, "wb") as out, _open_maybe_compressed(path) as src:
+            shutil.copyfileobj(src, out)
+        path = tmp
+    try:
+        conn = _connect_ro(path)
+        try:
+            for name, arch, epoch, ver, rel in conn.execute("SELECT name, arch, epoch, version, release FROM packages"):
+                if arch == "src":
+                    continue
+                _merge(best, (name, arch), (int(epoch or 0), ver or "", rel or ""))
+        finally:
+            conn.close()
+    finally:
+        if tmp:
+            os.unlink(tmp)
+    return best
+
+
+def _zstd_available() -> bool:
+    try:
+        import zstandard  # noqa: F401
+
+        return True
+    except ImportError:
+        return False
+
+
+def _primary_file(repodata: str) -> Optional[str]:
+    # Prefer sqlite (yum) over xml (dnf); zstd needs the optional module
+    candidates = sorted(glob.glob(os.path.join(repodata, "*primary.sqlite*")))
+    candidates += sorted(glob.glob(os.path.join(repodata, "gen", "primary_db.sqlite")))
+    candidates += sorted(glob.glob(os.path.join(repodata, "*primary.xml*")))
+    for path in candidates:
+        if path.endswith(".zst") and not _zstd_available():
+            continue
+        return path
+    return None
+
+
+def _stat_sig(path: str) -> Optional[Tuple[int, int]]:
+    try:
+        st = os.stat(path)
+        return st.st_mtime_ns, st.st_size
+    except OSError:
+        return None
+
+
+# Repo configuration (which cached repos dnf/yum would actually use)
+
+def _truthy(value: str) -> bool:
+    return value.strip().lower() in ("1", "yes", "true", "on")
+
+
+def _globs(value: str) -> Tuple[str, ...]:
+    return tuple(g for g in re.split(r"[\s,]+", value) if g)
+
+
+def _read_ini(path: str) -> Optional[configparser.RawConfigParser]:
+    parser = configparser.RawConfigParser(strict=False)
+    try:
+        with open(path, encoding="utf-8", errors="replace") as f:
+            parser.read_file(f)
+    except OSError:
+        return None
+    return parser
+
+
+def read_repo_config(main_confs: List[str], conf_dirs: List[str]) -> Dict[str, RepoFilter]:
+    """Enabled repo ids with their exclude/include globs, the global ones merged in.
+
+    Raises configparser.Error on a file dnf itself would refuse to load.
+    """
+    main_exclude: Tuple[str, ...] = ()
+    for path in main_confs:
+        main = _read_ini(path)
+        if main is None:
+            continue
+        if main.has_section("main"):
+            section = main["main"]
+            main_exclude = _globs(section.get("exclude", "") + " " + section.get("excludepkgs", ""))
+            if section.get("reposdir"):
+                conf_dirs = list(_globs(section["reposdir"]))
+        break  # only the first config that exists is read, as dnf/yum do
+
+    repos: Dict[str, RepoFilter] = {}
+    for conf_dir in conf_dirs:
+        for path in sorted(glob.glob(os.path.join(conf_dir, "*.repo"))):
+            parser = _read_ini(path)
+            if parser is None:
+                continue
+            for repo_id in parser.sections():
+                section = parser[repo_id]
+                if not _truthy(section.get("enabled", "1")):
+                    continue
+                exclude = _globs(section.get("exclude", "") + " " + section.get("excludepkgs", ""))
+                repos[repo_id] = (main_exclude + exclude, _globs(section.get("includepkgs", "")))
+    return repos
+
+
+def _versionlocked(paths: List[str]) -> bool:
+    for path in paths:
+        try:
+            with open(path, encoding="utf-8", errors="replace") as f:
+                if any(line.strip() and not line.lstrip().startswith("#") for line in f):
+                    return True
+        except OSError:
+            continue
+    return False
+
+
+def _repo_id(repodata: str) -> str:
+    path = repodata.rstrip("/")
+    if os.path.basename(path) == "repodata":
+        path = os.path.dirname(path)
+    return _CACHE_SUFFIX.sub("", os.path.basename(path))
+
+
+def _filtered(key: Tuple[str, str], evr: Evr, globs: Tuple[str, ...]) -> bool:
+    # dnf matches package specs against the name and the NEVRA forms built from it
+    name, arch = key
+    forms = (name, f"{name}.{arch}", f"{name}-{evr[1]}", f"{name}-{evr[1]}-{evr[2]}", f"{name}-{evr[1]}-{evr[2]}.{arch}")
+    return any(fnmatch.fnmatchcase(form, g) for g in globs for form in forms)
+
+
+def apply_filter(available: Dict[Tuple[str, str], Evr], repo_filter: RepoFilter) -> Dict[Tuple[str, str], Evr]:
+    exclude, include = repo_filter
+    if not exclude and not include:
+        return available
+    return {
+        key: evr
+        for key, evr in available.items()
+        if not _filtered(key, evr, exclude) and (not include or _filtered(key, evr, include))
+    }
+
+
+class RpmIndex:
+    """Installed vs cached-repo versions, without any metadata refresh.
+
+    Only repos enabled in the yum/dnf configuration count, with their exclude
+    and includepkgs filters. Setups this cannot model (no repo files,
+    versionlock, modular repos, an enabled repo that was never cached) give
+    None so the caller falls back to ``dnf check-update``.
+    """
+
+    def __init__(
+        self,
+        rpmdb_paths: Optional[List[str]] = None,
+        cache_globs: Optional[List[str]] = None,
+        main_confs: Optional[List[str]] = None,
+        repo_conf_dirs: Optional[List[str]] = None,
+        versionlock_lists: Optional[List[str]] = None,
+    ) -> None:
+        self.rpmdb_paths = rpmdb_paths or RPMDB_PATHS
+        self.cache_globs = cache_globs or REPO_CACHE_GLOBS
+        self.main_confs = main_confs or MAIN_CONFS
+        self.repo_conf_dirs = repo_conf_dirs or REPO_CONF_DIRS
+        self.versionlock_lists = versionlock_lists or VERSIONLOCK_LISTS
+        self._lock = threading.Lock()
+        self._sig = None
+        self._result: Optional[Dict[str, Any]] = None
+        self._repos: Dict[str, Tuple[Tuple[int, int], Dict[Tuple[str, str], Evr]]] = {}
+
+    def rpmdb_path(self) -> Optional[str]:
+        for path in self.rpmdb_paths:
+            if os.path.exists(path):
+                return path
+        return None
+
+    def enabled_repos(self) -> Optional[Dict[str, RepoFilter]]:
+        if _versionlocked(self.versionlock_lists):
+            return None
+        try:
+            return read_repo_config(self.main_confs, self.repo_conf_dirs) or None
+        except configparser.Error:
+            return None
+
+    def repo_primaries(self, enabled: Dict[str, RepoFilter]) -> Optional[Dict[str, str]]:
+        """Primary metadata file per enabled repo's cache directory, or None."""
+        newest: Dict[str, Tuple[float, str, str]] = {}
+        for pattern in self.cache_globs:
+            for repodata in sorted(glob.glob(pattern)):
+                repo_id = _repo_id(repodata)
+                if repo_id not in enabled:
+                    continue
+                primary = _primary_file(repodata)
+                if not primary:
+                    continue
+                if glob.glob(os.path.join(repodata, "*modules.yaml*")):
+                    return None  # module streams filter packages in ways we do not follow
+                # A changed baseurl leaves the old cache directory behind; use the newest
+                repomd = _stat_sig(os.path.join(repodata, "repomd.xml"))
+                mtime = repomd[0] / 1e9 if repomd else os.path.getmtime(primary)
+                if repo_id not in newest or mtime > newest[repo_id][0]:
+                    newest[repo_id] = (mtime, repodata, primary)
+        if set(newest) != set(enabled):
+            return None
+        return {repodata: primary for _, repodata, primary in newest.values()}
+
+    def upgradable(self) -> Optional[Dict[str, Any]]:
+        """Upgradable package names and cache age, or None when this cannot be told offline."""
+        db = self.rpmdb_path()
+        enabled = self.enabled_repos() if db else None
+        repos = self.repo_primaries(enabled) if enabled else None
+        if not db or not repos:
+            return None
+        sig = tuple(
+            [(p, _stat_sig(p)) for p in (db, db + "-wal")]
+            + [(p, _stat_sig(p)) for p in sorted(repos.values())]
+            + sorted(enabled.items())
+        )
+        with self._lock:
+            if sig != self._sig or self._result is None:
+                self._result = self._compute(db, repos, enabled)
+                self._sig = sig
+            result = dict(self._result)
+
+        ages = []
+        for repodata in repos:
+            repomd = _stat_sig(os.path.join(repodata, "repomd.xml"))
+            mtime = repomd[0] / 1e9 if repomd else os.path.getmtime(repos[repodata])
+            ages.append(max(0, int(time.time() - mtime)))
+        # Report the stalest repo so an old cache is never hidden by a fresh one
+        result["metadata_age_s"] = max(ages)
+        return result
+
+    def _compute(self, db: str, repos: Dict[str, str], enabled: Dict[str, RepoFilter]) -> Dict[str, Any]:
+        installed = read_installed(db)
+        candidate: Dict[Tuple[str, str], Evr] = {}
+        for repodata, primary in repos.items():
+            sig = _stat_sig(primary)
+            cached = self._repos.get(repodata)
+            if cached and cached[0] == sig:
+                available = cached[1]
+            else:
+                reader = read_primary_sqlite if ".sqlite" in os.path.basename(primary) else read_primary_xml
+                available = reader(primary)
+                self._repos[repodata] = (sig, available)
+            for key, evr in apply_filter(available, enabled[_repo_id(repodata)]).items():
+                _merge(candidate, key, evr)
+        for stale in set(self._repos) - set(repos):
+            del self._repos[stale]
+
+        upgradable = set()
+        for (name, arch), evr in installed.items():
+            keys = [(name, arch)] if arch == "noarch" else [(name, arch), (name, "noarch")]
+            if any(k in candidate and compare_evr(candidate[k], evr) > 0 for k in keys):
+                upgradable.add(name)
+        return {"upgradable": sorted(upgradable), "repos": len(repos)}
+
+
+RPM_INDEX = RpmIndex()
@@ -0,0 +1,62 @@
+from typing import Any, Dict, List, Optional
+
+from .checks import CHECKS, collect_all_checks, is_unknown
+
+
+def check_intervals(overrides: Optional[Dict[str, int]] = None) -> Dict[str, int]:
+    intervals = {name: spec.interval for name, spec in CHECKS.items()}
+    for name, minutes in (overrides or {}).items():
+        if name in intervals and minutes is not None:
+            intervals[name] = max(0, int(minutes))
+    return intervals
+
+
+def due_checks(cache: Dict[str, Any], now: int, intervals: Dict[str, int]) -> List[str]:
+    due = []
+    for name in CHECKS:
+        entry = cache.get(name)
+        if not entry or "result" not in entry:
+            due.append(name)
+            continue
+        if now - int(entry.get("ts", 0)) >= intervals.get(name, 0) * 60:
+            due.append(name)
+    return due
+
+
+def collect_due_checks(
+    cache: Dict[str, Any],
+    now: int,
+    intervals: Dict[str, int],
+    force: bool = False,
+    verbose: bool = False,
+    **collect_kwargs: Any,
+) -> Dict[str, Any]:
+    """Run the checks whose cached result has expired and merge in the rest.
+
+    ``cache`` maps check name to ``{"ts": ..., "result": ...}`` and is updated
+    in place. Unknown results (timed out, failed or errored) are not cached,
+    so one transient failure does not hide the real state for a whole interval.
+    """
+    names = list(CHECKS) if force else due_checks(cache, now, intervals)
+    if verbose:
+        cached = [n for n in CHECKS if n not in names]
+        print(f"Running checks: {', '.join(names) or 'none'}; cached: {', '.join(cached) or 'none'}")
+
+    fresh = collect_all_checks(verbose=verbose, names=names, **collect_kwargs)
+    for name, result in fresh.items():
+        if is_unknown(result):
+            cache.pop(name, None)
+        else:
+            cache[name] = {"ts": now, "result": result}
+
+    checks: Dict[str, Any] = {}
+    for name in CHECKS:
+        if name in fresh:
+            checks[name] = fresh[name]
+        elif name in cache:
+            checks[name] = cache[name]["result"]
+    # Drop entries for checks that no longer exist
+    for name in list(cache):
+        if name not in CHECKS:
+            del cache[name]
+    return checks
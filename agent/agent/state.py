@@ -2,17 +2,21 @@ import json
 import os
 from typing import Any, Dict, Optional
 
-from platformdirs import user_data_dir
-
 APP_NAME = "compliance_monitor"
 APP_AUTHOR = "cm"
 STATE_FILENAME = "agent_state.json"
 
 
+def data_dir() -> str:
+    from platformdirs import user_data_dir
+
+    path = user_data_dir(APP_NAME, APP_AUTHOR)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
 def _state_path() -> str:
-    data_dir = user_data_dir(APP_NAME, APP_AUTHOR)
-    os.makedirs(data_dir, exist_ok=True)
-    return os.path.join(data_dir, STATE_FILENAME)
+    return os.path.join(data_dir(), STATE_FILENAME)
 
 
 def load_last_state() -> Optional[Dict[str, Any]]:
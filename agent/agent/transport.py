@@ -1,16 +1,280 @@
+import gzip
 import json
-from typing import Any, Dict
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
 
 import requests
+from requests.adapters import HTTPAdapter
 
-DEFAULT_TIMEOUT = 15
+DEFAULT_CONNECT_TIMEOUT = 5
+DEFAULT_READ_TIMEOUT = 15
+DEFAULT_MAX_RETRIES = 4
+DEFAULT_BACKOFF_BASE = 1.0
+DEFAULT_BACKOFF_MAX = 60.0
+DEFAULT_COMPRESS_MIN_BYTES = 1024
 
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+# Client errors about the endpoint or credentials rather than the report: it stays queued
+KEEP_QUEUED_STATUSES = {401, 403, 404, 408, 429}
 
-def post_update(endpoint: str, api_key: str, payload: Dict[str, Any], verify_tls: bool = True) -> None:
-    headers = {
-        "Content-Type": "application/json",
-        "Accept": "application/json",
-        "X-API-Key": api_key,
-    }
-    resp = requests.post(endpoint, data=json.dumps(payload), headers=headers, timeout=DEFAULT_TIMEOUT, verify=verify_tls)
-    resp.raise_for_status()
+
+class ResyncRequired(Exception):
+    """The server could not apply a delta report and wants the full payload."""
+
+
+class UploadResult(NamedTuple):
+    body: Dict[str, Any]
+    accept_encoding: List[str]  # request codecs the server advertised
+    raw_bytes: int
+    sent_bytes: int
+    encoding: str
+    batch_max: int = 0  # reports per /batch request the server accepts; 0 if unsupported
+
+
+class UploadStats:
+    """Thread-safe raw vs on-the-wire byte counters for uploads."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._counts = {"uploads": 0, "raw_bytes": 0, "sent_bytes": 0}
+
+    def add(self, raw_bytes: int, sent_bytes: int) -> None:
+        with self._lock:
+            self._counts["uploads"] += 1
+            self._counts["raw_bytes"] += raw_bytes
+            self._counts["sent_bytes"] += sent_bytes
+
+    def snapshot(self, reset: bool = False) -> Dict[str, int]:
+        with self._lock:
+            snap = dict(self._counts)
+            if reset:
+                for key in self._counts:
+                    self._counts[key] = 0
+        return snap
+
+
+UPLOAD_STATS = UploadStats()
+
+
+def _zstd_compress(data: bytes) -> Optional[bytes]:
+    try:
+        import zstandard
+    except ImportError:
+        return None
+    return zstandard.ZstdCompressor(level=3).compress(data)
+
+
+def encode_body(data: bytes, accepted: Optional[List[str]], min_bytes: int = DEFAULT_COMPRESS_MIN_BYTES) -> Tuple[bytes, str]:
+    """Compress with the best codec the server accepts; small bodies go as-is."""
+    if not accepted or min_bytes < 0 or len(data) < min_bytes:
+        return data, "identity"
+    if "zstd" in accepted:
+        packed = _zstd_compress(data)
+        if packed is not None and len(packed) < len(data):
+            return packed, "zstd"
+    if "gzip" in accepted:
+        packed = gzip.compress(data, compresslevel=6)
+        if len(packed) < len(data):
+            return packed, "gzip"
+    return data, "identity"
+
+
+def _parse_accept_encoding(value: Optional[str]) -> List[str]:
+    codecs = []
+    for part in (value or "").split(","):
+        name = part.split(";", 1)[0].strip().lower()
+        if name and name != "identity":
+            codecs.append(name)
+    return codecs
+
+
+def error_status(error: BaseException) -> Optional[int]:
+    """HTTP status of a failed upload; None for network errors."""
+    if isinstance(error, requests.HTTPError) and error.response is not None:
+        return error.response.status_code
+    return None
+
+
+def rejects_report(status: Optional[int]) -> bool:
+    """Whether the server refused a report for good, so resending it cannot help."""
+    return status is not None and 400 <= status < 500 and status not in KEEP_QUEUED_STATUSES
+
+
+def retry_after_seconds(value: Optional[str]) -> Optional[float]:
+    """Parse a Retry-After header given as delta-seconds or an HTTP date."""
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, when.timestamp() - time.time())
+
+
+class TransportClient:
+    """Pooled keep-alive session with retry, backoff and per-attempt timing."""
+
+    def __init__(
+        self,
+        connect_timeout: float = DEFAULT_CONNECT_TIMEOUT,
+        read_timeout: float = DEFAULT_READ_TIMEOUT,
+        max_retries: int = DEFAULT_MAX_RETRIES,
+        backoff_base: float = DEFAULT_BACKOFF_BASE,
+        backoff_max: float = DEFAULT_BACKOFF_MAX,
+    ) -> None:
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max(0, int(max_retries))
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.session = requests.Session()
+        # Retries are handled here so Retry-After and jitter apply uniformly
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=2, max_retries=0)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self._lock = threading.Lock()
+        self._attempts: List[Dict[str, Any]] = []
+
+    def _record(self, attempt: int, started: float, status: Optional[int], error: Optional[str]) -> None:
+        entry = {
+            "attempt": attempt,
+            "latency_ms": round((time.perf_counter() - started) * 1000, 1),
+            "status": status,
+        }
+        if error:
+            entry["error"] = error
+        with self._lock:
+            self._attempts.append(entry)
+            del self._attempts[:-100]  # bounded if nobody drains it
+
+    def take_attempts(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            attempts, self._attempts = self._attempts, []
+        return attempts
+
+    def _backoff(self, attempt: int) -> float:
+        # Full jitter: uniform in [0, min(max, base * 2^attempt)]
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def post(self, url: str, data: bytes, headers: Dict[str, str], verify_tls: bool = True) -> requests.Response:
+        attempt = 0
+        while True:
+            started = time.perf_counter()
+            try:
+                resp = self.session.post(url, data=data, headers=headers, timeout=self.timeout, verify=verify_tls)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                self._record(attempt, started, None, type(e).__name__)
+                if attempt >= self.max_retries:
+                    raise
+                time.sleep(self._backoff(attempt))
+                attempt += 1
+                continue
+            self._record(attempt, started, resp.status_code, None)
+            if resp.status_code not in RETRY_STATUSES or attempt >= self.max_retries:
+                return resp
+            delay = None
+            if resp.status_code in (429, 503):
+                delay = retry_after_seconds(resp.headers.get("Retry-After"))
+            if delay is None:
+                delay = self._backoff(attempt)
+            time.sleep(min(delay, self.backoff_max))
+            attempt += 1
+
+    def _post_json(
+        self,
+        endpoint: str,
+        api_key: str,
+        payload: Any,
+        verify_tls: bool,
+        accept_encoding: Optional[List[str]],
+        compress_min_bytes: int,
+    ) -> Tuple[requests.Response, int, int, str]:
+        raw = json.dumps(payload, separators=(",", ":")).encode("utf-8")
+        data, encoding = encode_body(raw, accept_encoding, compress_min_bytes)
+        headers = {
+            "Content-Type": "application/json",
+            "Accept": "application/json",
+            "X-API-Key": api_key,
+        }
+        if encoding != "identity":
+            headers["Content-Encoding"] = encoding
+        resp = self.post(endpoint, data, headers, verify_tls=verify_tls)
+        UPLOAD_STATS.add(len(raw), len(data))
+        return resp, len(raw), len(data), encoding
+
+    def _result(self, resp: requests.Response, raw_bytes: int, sent_bytes: int, encoding: str) -> UploadResult:
+        resp.raise_for_status()
+        try:
+            body = resp.json()
+        except ValueError:
+            body = {}
+        try:
+            batch_max = int(resp.headers.get("X-Report-Batch-Max") or 0)
+        except ValueError:
+            batch_max = 0
+        return UploadResult(
+            body=body if isinstance(body, dict) else {},
+            accept_encoding=_parse_accept_encoding(resp.headers.get("Accept-Encoding")),
+            raw_bytes=raw_bytes,
+            sent_bytes=sent_bytes,
+            encoding=encoding,
+            batch_max=batch_max,
+        )
+
+    def post_update(
+        self,
+        endpoint: str,
+        api_key: str,
+        payload: Dict[str, Any],
+        verify_tls: bool = True,
+        accept_encoding: Optional[List[str]] = None,
+        compress_min_bytes: int = DEFAULT_COMPRESS_MIN_BYTES,
+    ) -> UploadResult:
+        resp, raw_bytes, sent_bytes, encoding = self._post_json(
+            endpoint, api_key, payload, verify_tls, accept_encoding, compress_min_bytes
+        )
+        if resp.status_code == 409 and payload.get("delta"):
+            raise ResyncRequired(resp.text)
+        return self._result(resp, raw_bytes, sent_bytes, encoding)
+
+    def post_batch(
+        self,
+        endpoint: str,
+        api_key: str,
+        reports: List[Dict[str, Any]],
+        verify_tls: bool = True,
+        accept_encoding: Optional[List[str]] = None,
+        compress_min_bytes: int = DEFAULT_COMPRESS_MIN_BYTES,
+    ) -> UploadResult:
+        """Send several reports in one request; ``body["results"]`` has one entry per report."""
+        resp, raw_bytes, sent_bytes, encoding = self._post_json(
+            endpoint, api_key, {"reports": reports}, verify_tls, accept_encoding, compress_min_bytes
+        )
+        return self._result(resp, raw_bytes, sent_bytes, encoding)
+
+    def close(self) -> None:
+        self.session.close()
+
+
+_default_client: Optional[TransportClient] = None
+
+
+def post_update(
+    endpoint: str,
+    api_key: str,
+    payload: Dict[str, Any],
+    verify_tls: bool = True,
+    accept_encoding: Optional[List[str]] = None,
+    compress_min_bytes: int = DEFAULT_COMPRESS_MIN_BYTES,
+) -> UploadResult:
+    global _default_client
+    if _default_client is None:
+        _default_client = TransportClient()
+    return _default_client.post_update(endpoint, api_key, payload, verify_tls, accept_encoding, compress_min_bytes)
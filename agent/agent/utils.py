@@ -1,20 +1,185 @@
 import json
-import platform
-import socket
+import locale
+import os
+import signal
 import subprocess
 import sys
-from typing import Dict, Optional
+import threading
+import time
+from typing import TYPE_CHECKING, Callable, Dict, List, Optional
 
-import psutil
+from .metrics import CHECK_STATS
+from .recorder import RECORDER
 
+if TYPE_CHECKING:
+    import asyncio
+
+DEFAULT_MAX_OUTPUT = 4 * 1024 * 1024
+_READ_CHUNK = 64 * 1024
+
+
+class CmdStats:
+    """Thread-safe counters for commands spawned during a collection cycle."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._counts = {"processes": 0, "kills": 0, "bytes_read": 0}
+
+    def add(self, key: str, n: int = 1) -> None:
+        with self._lock:
+            self._counts[key] += n
+
+    def snapshot(self, reset: bool = False) -> Dict[str, int]:
+        with self._lock:
+            snap = dict(self._counts)
+            if reset:
+                for key in self._counts:
+                    self._counts[key] = 0
+        return snap
+
+
+CMD_STATS = CmdStats()
+
+
+def _kill_tree(proc: "asyncio.subprocess.Process") -> None:
+    try:
+        if os.name == "nt":
+            if proc.returncode is not None:
+                return
+            subprocess.run(
+                ["taskkill", "/F", "/T", "/PID", str(proc.pid)],
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+                timeout=10,
+            )
+        else:
+            # start_new_session makes the child a group leader, so pgid == pid.
+            # The group outlives its leader, so this also reaches grandchildren
+            # still holding the pipes after the child itself has exited.
+            os.killpg(proc.pid, signal.SIGKILL)
+    except ProcessLookupError:
+        return
+    except Exception:
+        pass
+    try:
+        proc.kill()
+    except Exception:
+        pass
+    CMD_STATS.add("kills")
+
+
+async def _run_cmd_async(
+    cmd: List[str],
+    timeout: float,
+    on_line: Optional[Callable[[str], bool]],
+    max_bytes: int,
+) -> tuple[int, str, str]:
+    import asyncio
+
+    kwargs = {}
+    if os.name == "nt":
+        kwargs["creationflags"] = subprocess.CREATE_NEW_PROCESS_GROUP
+    else:
+        kwargs["start_new_session"] = True
+    proc = await asyncio.create_subprocess_exec(
+        *cmd,
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        **kwargs,
+    )
+    CMD_STATS.add("processes")
+
+    encoding = locale.getpreferredencoding(False)
+    out_buf = bytearray()
+    err_buf = bytearray()
+    state = {"total": 0, "stopped": False, "truncated": False}
+
+    def stop(truncated: bool = False) -> None:
+        # Killing the group closes both pipes, which ends the other reader too.
+        state["truncated"] = state["truncated"] or truncated
+        if not state["stopped"]:
+            state["stopped"] = True
+            _kill_tree(proc)
+
+    async def pump(stream: asyncio.StreamReader, buf: bytearray, parse: bool) -> None:
+        pending = b""
+        while not state["stopped"]:
+            chunk = await stream.read(_READ_CHUNK)
+            if not chunk:
+                break
+            CMD_STATS.add("bytes_read", len(chunk))
+            state["total"] += len(chunk)
+            if state["total"] > max_bytes:
+                stop(truncated=True)
+                break
+            buf.extend(chunk)
+            if parse:
+                pending += chunk
+                *lines, pending = pending.split(b"\n")
+                for raw in lines:
+                    if on_line(raw.decode(encoding, errors="replace").rstrip("\r")):
+                        stop()
+                        break
+        if parse and pending and not state["stopped"]:
+            if on_line(pending.decode(encoding, errors="replace").rstrip("\r")):
+                stop()
+
+    async def communicate() -> int:
+        await asyncio.gather(pump(proc.stdout, out_buf, on_line is not None), pump(proc.stderr, err_buf, False))
+        return await proc.wait()
+
+    def text(buf: bytearray) -> str:
+        return buf.decode(encoding, errors="replace").replace("\r\n", "\n")
 
-def run_cmd(cmd: list[str], timeout: int = 15) -> tuple[int, str, str]:
     try:
-        p = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
-        out, err = p.communicate(timeout=timeout)
-        return p.returncode, out or "", err or ""
+        code = await asyncio.wait_for(communicate(), timeout=timeout)
+    except asyncio.TimeoutError:
+        _kill_tree(proc)
+        await proc.wait()
+        # Read the killed group's pipes to EOF so their transport closes
+        # while the loop still runs
+        try:
+            await asyncio.wait_for(asyncio.gather(proc.stdout.read(), proc.stderr.read()), timeout=1)
+        except asyncio.TimeoutError:
+            pass
+        return 1, text(out_buf), f"timed out after {timeout}s"
+
+    if state["truncated"]:
+        return 1, text(out_buf), f"output exceeded {max_bytes} bytes"
+    if state["stopped"]:
+        # The caller's parser saw what it needed; report success.
+        return 0, text(out_buf), text(err_buf)
+    return code, text(out_buf), text(err_buf)
+
+
+def run_cmd(
+    cmd: List[str],
+    timeout: float = 15,
+    on_line: Optional[Callable[[str], bool]] = None,
+    max_bytes: int = DEFAULT_MAX_OUTPUT,
+) -> tuple[int, str, str]:
+    """Run a command, killing its whole process group on timeout.
+
+    When on_line is given, stdout is fed to it line by line; returning True
+    stops the command early. With the recorder in replay mode nothing is
+    spawned and the recorded output is returned instead.
+    """
+    if RECORDER.replaying:
+        return RECORDER.replay(cmd, on_line)
+    # asyncio is a large import; load it with the first command
+    import asyncio
+
+    start = time.perf_counter()
+    try:
+        result = asyncio.run(_run_cmd_async(cmd, timeout, on_line, max_bytes))
     except Exception as e:
-        return 1, "", str(e)
+        result = (1, "", str(e))
+    duration = time.perf_counter() - start
+    CHECK_STATS.add_command(duration)
+    if RECORDER.recording:
+        RECORDER.save(cmd, *result, duration)
+    return result
 
 
 # Machine identity
@@ -54,18 +219,7 @@ def _linux_machine_id() -> Optional[str]:
 
 
 def get_machine_identity() -> Dict[str, str]:
-    os_name = platform.system()
-    hostname = socket.gethostname()
-    mid = None
-    if os_name == "Windows":
-        mid = _windows_machine_guid()
-    elif os_name == "Darwin":
-        mid = _macos_platform_uuid()
-    elif os_name == "Linux":
-        mid = _linux_machine_id()
-
-    if not mid:
-        # Fallback to MAC addresses + hostname
-        macs = sorted([nic.address for nic in psutil.net_if_addrs().get("Ethernet", [])])
-        mid = f"{hostname}-{platform.platform()}"
-    return {"machine_id": mid, "hostname": hostname, "os": os_name}
+    # Identity is a cached fact; machine-id is only re-read when it changes
+    from .facts import Facts
+
+    return Facts().get("identity")
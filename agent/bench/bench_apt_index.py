@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+Compare the in-process apt upgradability index with `apt-get -s upgrade`.
+
+Usage: python bench/bench_apt_index.py [--lists DIR] [--status FILE] [--repeat 5]
+
+Point --lists/--status at a recorded copy of /var/lib/apt/lists and
+/var/lib/dpkg/status to benchmark against real-world data. The apt-get
+simulation is only timed when the live system paths are used.
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from agent.apt import APT_LISTS_DIR, DPKG_STATUS, AptIndex  # noqa: E402
+from agent.utils import run_cmd  # noqa: E402
+
+
+def ms(samples):
+    return f"median {statistics.median(samples):8.1f} ms  min {min(samples):8.1f} ms"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--lists", default=APT_LISTS_DIR)
+    parser.add_argument("--status", default=DPKG_STATUS)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    cold = []
+    result = None
+    for _ in range(args.repeat):
+        index = AptIndex(args.status, args.lists)
+        start = time.perf_counter()
+        result = index.upgradable()
+        cold.append((time.perf_counter() - start) * 1000)
+    if result is None:
+        print("No apt lists or dpkg status found")
+        sys.exit(1)
+
+    warm = []
+    for _ in range(args.repeat):
+        start = time.perf_counter()
+        index.upgradable()
+        warm.append((time.perf_counter() - start) * 1000)
+
+    files = index.list_files()
+    size = sum(os.path.getsize(p) for p in files) + os.path.getsize(args.status)
+    print(f"Lists: {len(files)} files, {size / 1e6:.1f} MB including dpkg status")
+    print(f"Upgradable: {len(result['upgradable'])}, security: {len(result['security'])}, phased: {len(result['phased'])}")
+    print(f"index cold (parse all)   {ms(cold)}")
+    print(f"index warm (unchanged)   {ms(warm)}")
+
+    if args.lists == APT_LISTS_DIR and args.status == DPKG_STATUS:
+        sim = []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            run_cmd(["apt-get", "-s", "upgrade"], timeout=120)
+            sim.append((time.perf_counter() - start) * 1000)
+        print(f"apt-get -s upgrade       {ms(sim)}")
+        print(f"speedup cold {statistics.median(sim) / statistics.median(cold):.1f}x, "
+              f"warm {statistics.median(sim) / max(statistics.median(warm), 0.001):.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+"""
+Time the check parsers on replayed command output, on any OS.
+
+Usage: python bench/bench_parsers.py [--lines 10000] [--repeat 20]
+                                     [--fixtures DIR ...] [--save DIR] [--json FILE]
+
+Without --fixtures, large synthetic outputs are generated in the shape the
+tools print (a --lines long `powercfg -q`, `softwareupdate -l`, `pmset -g
+custom`, `ps` listing, plus `manage-bde`, `fdesetup` and Defender JSON) and
+each check is run against them through the command recorder's replay mode.
+--fixtures replays directories recorded on real machines with
+CM_CMD_RECORD=DIR. --save keeps the generated fixtures, --json writes the
+timings for comparison in CI.
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from agent.checks import CHECKS, ps_known_av  # noqa: E402
+from agent.facts import TOOLS, Facts  # noqa: E402
+from agent.recorder import FACTS_FILENAME, RECORDER, fixture_name  # noqa: E402
+
+DEFENDER_CMD = ["powershell", "-NoProfile", "-Command", "Get-MpComputerStatus | ConvertTo-Json -Compress"]
+PS_CMD = ["ps", "-eo", "comm="]
+
+
+def guid(n):
+    return f"{n:08x}-{n % 0xffff:04x}-4{n % 0xfff:03x}-a{n % 0xfff:03x}-{n * 7919 % (1 << 48):012x}"
+
+
+def powercfg_q(lines):
+    # Settings in subgroups as powercfg prints them; "Sleep after" comes last
+    # so the parser has to walk the whole output
+    out = ["Power Scheme GUID: 381b4222-f694-41f0-9685-ff5bb260df2e  (Balanced)", "  GUID Alias: SCHEME_BALANCED"]
+    n = 0
+    while len(out) < lines - 12:
+        if n % 20 == 0:
+            out += [f"  Subgroup GUID: {guid(n)}  (Subgroup {n // 20})", f"    GUID Alias: SUB_{n // 20}"]
+        out += [
+            f"    Power Setting GUID: {guid(n + 1)}  (Setting {n})",
+            f"      GUID Alias: SETTING{n}",
+            "      Minimum Possible Setting: 0x00000000",
+            "      Maximum Possible Setting: 0xffffffff",
+            "      Possible Settings increment: 0x00000001",
+            "      Possible Settings units: Seconds",
+            f"    Current AC Power Setting Index: 0x{n:08x}",
+            f"    Current DC Power Setting Index: 0x{n:08x}",
+            "",
+        ]
+        n += 1
+    out += [
+        "  Subgroup GUID: 238c9fa8-0aad-41ed-83f4-97be242c8f20  (Sleep)",
+        "    GUID Alias: SUB_SLEEP",
+        "    Power Setting GUID: 29f6c1db-86da-48c5-9fdb-f2b67b1f44da  (Sleep after)",
+        "      GUID Alias: STANDBYIDLE",
+        "      Minimum Possible Setting: 0x00000000",
+        "      Maximum Possible Setting: 0xffffffff",
+        "      Possible Settings increment: 0x00000001",
+        "      Possible Settings units: Seconds",
+        "    Current AC Power Setting Index: 0x00000258",
+        "    Current DC Power Setting Index: 0x0000012c",
+        "",
+    ]
+    return "\n".join(out) + "\n"
+
+
+def manage_bde():
+    return """BitLocker Drive Encryption: Configuration Tool version 10.0.19041
+Copyright (C) 2013 Microsoft Corporation. All rights reserved.
+
+Volume C: [Windows]
+[OS Volume]
+
+    Size:                 475.69 GB
+    BitLocker Version:    2.0
+    Conversion Status:    Fully Encrypted
+    Percentage Encrypted: 100.0%
+    Encryption Method:    XTS-AES 128
+    Protection Status:    Protection On
+    Lock Status:          Unlocked
+    Identification Field: Unknown
+    Key Protectors:
+        TPM
+        Numerical Password
+"""
+
+
+def defender_json():
+    status = {f"Setting{i}": i % 2 == 0 for i in range(120)}
+    status.update({
+        "AMEngineVersion": "1.1.23110.2",
+        "AntispywareEnabled": True,
+        "AntivirusEnabled": True,
+        "AntivirusSignatureLastUpdated": "/Date(1700000000000)/",
+        "RealTimeProtectionEnabled": True,
+        "ComputerID": guid(42),
+    })
+    return json.dumps(status, separators=(",", ":"))
+
+
+def softwareupdate_l(lines):
+    out = ["Software Update Tool", "", "Finding available software", "Software Update found the following new or updated software:"]
+    for n in range(max(1, lines // 2)):
+        out += [f"* Label: Package{n}-1.{n}", f"\tTitle: Package {n}, Version: 1.{n}, Size: {n * 13}KiB, Recommended: YES, "]
+    return "\n".join(out) + "\n"
+
+
+def pmset_custom(lines):
+    out = ["Battery Power:"]
+    for n in range(max(0, lines // 2 - 4)):
+        out.append(f" setting{n:<20} {n}")
+    out += [" displaysleep         2", " sleep                1", "AC Power:", " displaysleep         10", " sleep                10"]
+    return "\n".join(out) + "\n"
+
+
+def ps_listing(lines):
+    return "\n".join(f"worker-{n}" for n in range(lines)) + "\nclamd\n"
+
+
+SCENARIOS = {
+    "Windows": lambda lines: {
+        ("manage-bde", "-status", "C:"): manage_bde(),
+        ("powercfg", "-q"): powercfg_q(lines),
+        tuple(DEFENDER_CMD): defender_json(),
+    },
+    "Darwin": lambda lines: {
+        ("fdesetup", "status"): "FileVault is On.\n",
+        ("softwareupdate", "-l"): softwareupdate_l(lines),
+        ("pmset", "-g", "custom"): pmset_custom(lines),
+    },
+    "Linux": lambda lines: {tuple(PS_CMD): ps_listing(lines)},
+}
+# Checks whose probes are fully served from the fixtures above
+SCENARIO_CHECKS = {
+    "Windows": ["disk_encryption", "antivirus", "sleep_policy"],
+    "Darwin": ["disk_encryption", "os_updates", "sleep_policy"],
+    "Linux": [],
+}
+
+
+def write_scenario(directory, os_name, lines):
+    os.makedirs(directory, exist_ok=True)
+    for cmd, stdout in SCENARIOS[os_name](lines).items():
+        fixture = {"cmd": list(cmd), "code": 0, "stdout": stdout, "stderr": "", "duration_ms": 0}
+        with open(os.path.join(directory, fixture_name(list(cmd))), "w", encoding="utf-8") as f:
+            json.dump(fixture, f)
+    with open(os.path.join(directory, FACTS_FILENAME), "w", encoding="utf-8") as f:
+        json.dump({"os_name": os_name, "tool_paths": {tool: f"/usr/bin/{tool}" for tool in TOOLS}}, f)
+
+
+def timed(func, repeat):
+    samples = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples, result
+
+
+def bench_directory(label, directory, names, repeat):
+    RECORDER.configure("replay", directory)
+    rows = []
+    try:
+        for name in names:
+            spec = CHECKS[name]
+            samples, result = timed(lambda: spec.func(Facts().view(spec.facts, name)), repeat)
+            rows.append((f"{label}/{name}", samples, result.get("status")))
+        if RECORDER.fact("os_name") == "Linux" and os.path.exists(os.path.join(directory, fixture_name(PS_CMD))):
+            samples, present = timed(lambda: ps_known_av("Linux"), repeat)
+            rows.append((f"{label}/ps_known_av", samples, "ok" if present else "issue"))
+    finally:
+        RECORDER.configure(None)
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--lines", type=int, default=10000, help="length of the large generated outputs")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--fixtures", action="append", default=[], help="recorded fixture directory")
+    parser.add_argument("--save", help="write the generated fixtures here instead of a temp dir")
+    parser.add_argument("--json", help="write timings to this file")
+    args = parser.parse_args()
+
+    rows = []
+    if args.fixtures:
+        for directory in args.fixtures:
+            rows += bench_directory(os.path.basename(os.path.normpath(directory)), directory, list(CHECKS), args.repeat)
+    else:
+        root = args.save or tempfile.mkdtemp(prefix="cm-parsers-")
+        for os_name in SCENARIOS:
+            directory = os.path.join(root, os_name.lower())
+            write_scenario(directory, os_name, args.lines)
+            rows += bench_directory(os_name, directory, SCENARIO_CHECKS[os_name], args.repeat)
+
+    results = {}
+    for label, samples, status in rows:
+        results[label] = {"median_ms": round(statistics.median(samples), 3), "min_ms": round(min(samples), 3), "status": status}
+        print(f"{label:<28} median {statistics.median(samples):8.3f} ms  min {min(samples):8.3f} ms  ({status})")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"lines": args.lines, "repeat": args.repeat, "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Compare antivirus process detection backends: procfs walk, psutil and ps.
+
+Usage: python bench/bench_process_scan.py [--spawn 5000] [--repeat 20]
+
+--spawn starts that many idle processes first so the comparison runs on a
+host with a realistically large process table.
+"""
+import argparse
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from agent.checks import ps_known_av  # noqa: E402
+from agent.processes import (  # noqa: E402
+    DARWIN_AV_SIGNATURES,
+    LINUX_AV_SIGNATURES,
+    find_signatures,
+    iter_proc_processes,
+    iter_psutil_processes,
+)
+
+
+def timed(fn, repeat):
+    samples = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return result, samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--spawn", type=int, default=0, help="idle processes to start before measuring")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    os_name = platform.system()
+    signatures = DARWIN_AV_SIGNATURES if os_name == "Darwin" else LINUX_AV_SIGNATURES
+    children = []
+    try:
+        for _ in range(args.spawn):
+            children.append(subprocess.Popen(["sleep", "600"], stdin=subprocess.DEVNULL))
+
+        backends = [("psutil", lambda: find_signatures(signatures, iter_psutil_processes()))]
+        if os.path.isdir("/proc/self"):
+            backends.insert(0, ("procfs", lambda: find_signatures(signatures, iter_proc_processes())))
+            total = sum(1 for _ in iter_proc_processes())
+        else:
+            total = sum(1 for _ in iter_psutil_processes())
+        backends.append(("ps", lambda: ps_known_av(os_name)))
+
+        print(f"Processes: {total}, repeat: {args.repeat}")
+        print(f"{'backend':<8} {'median ms':>10} {'min ms':>10} {'max ms':>10}  result")
+        for name, fn in backends:
+            result, samples = timed(fn, args.repeat)
+            print(
+                f"{name:<8} {statistics.median(samples):>10.2f} {min(samples):>10.2f} "
+                f"{max(samples):>10.2f}  {result}"
+            )
+    finally:
+        for child in children:
+            child.kill()
+        for child in children:
+            child.wait()
+
+
+if __name__ == "__main__":
+    main()
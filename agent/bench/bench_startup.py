@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+Measure agent startup: `python -X importtime` totals and cold start to a first report.
+
+Usage: python bench/bench_startup.py [--repeat 10] [--budget-ms 100]
+                                     [--exe dist/compliance-monitor-agent] [--json FILE]
+
+Each run is a fresh interpreter. The import total is the cumulative time of
+`import main` as reported by -X importtime (interpreter start-up and site
+are excluded), and the heaviest modules below it are listed. The cold start
+runs the agent once in dry-run mode against an empty command replay
+directory, so it measures start-up plus fact gathering without waiting on
+probe commands; --exe does the same for a PyInstaller build.
+
+--budget-ms makes the script exit non-zero when the median import total
+exceeds it, for use in CI.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+AGENT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+
+def importtime(python):
+    """Parse one -X importtime run into {module: (self_us, cumulative_us)}, in output order."""
+    proc = subprocess.run(
+        [python, "-X", "importtime", "-c", "import main"],
+        cwd=AGENT_DIR,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    modules = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        self_us, cumulative, name = line[len("import time:"):].split("|", 2)
+        if not self_us.strip().isdigit():
+            continue  # header line
+        modules[name.strip()] = (int(self_us), int(cumulative))
+    return modules
+
+
+def cold_start(cmd, replay_dir):
+    env = dict(
+        os.environ,
+        CM_ONCE="true",
+        CM_DRY_RUN="true",
+        CM_VERBOSE="false",
+        CM_CMD_REPLAY=replay_dir,
+    )
+    start = time.perf_counter()
+    subprocess.run(cmd, cwd=AGENT_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=False)
+    return (time.perf_counter() - start) * 1000
+
+
+def ms(samples):
+    return f"median {statistics.median(samples):8.1f} ms  min {min(samples):8.1f} ms"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--python", default=sys.executable)
+    parser.add_argument("--exe", help="also time a built executable")
+    parser.add_argument("--top", type=int, default=15, help="heaviest modules to list")
+    parser.add_argument("--budget-ms", type=float, help="fail if the median import total exceeds this")
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+
+    totals = []
+    runs = []
+    for _ in range(args.repeat):
+        modules = importtime(args.python)
+        totals.append(modules["main"][1] / 1000)
+        runs.append(modules)
+
+    # Heaviest modules by cumulative time, median over runs. Lines come out in
+    # completion order, so main's imports are the ones between site and main.
+    order = list(runs[0])
+    first = order.index("site") + 1 if "site" in order else 0
+    ours = order[first:order.index("main")]
+    heavy = sorted(
+        ((statistics.median(r[n][1] for r in runs if n in r) / 1000, n) for n in ours),
+        reverse=True,
+    )[: args.top]
+
+    with tempfile.TemporaryDirectory(prefix="cm-startup-") as replay_dir:
+        source = [cold_start([args.python, "main.py"], replay_dir) for _ in range(args.repeat)]
+        exe = [cold_start([os.path.abspath(args.exe)], replay_dir) for _ in range(args.repeat)] if args.exe else []
+
+    rows = [("import main (-X importtime)", totals), ("cold start, python main.py", source)]
+    if exe:
+        rows.append((f"cold start, {os.path.basename(args.exe)}", exe))
+    width = max(len(label) for label, _ in rows) + 3
+    for label, samples in rows:
+        print(f"{label:<{width}}{ms(samples)}")
+    print(f"\nHeaviest imports (cumulative, median of {args.repeat}):")
+    for cumulative, name in heavy:
+        print(f"  {cumulative:8.1f} ms  {name}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({
+                "python": sys.version.split()[0],
+                "import_main_ms": {"median": statistics.median(totals), "min": min(totals)},
+                "cold_start_ms": {"median": statistics.median(source), "min": min(source)},
+                "exe_cold_start_ms": {"median": statistics.median(exe), "min": min(exe)} if exe else None,
+                "heaviest": [{"module": n, "cumulative_ms": c} for c, n in heavy],
+            }, f, indent=2)
+
+    if args.budget_ms is not None and statistics.median(totals) > args.budget_ms:
+        print(f"\nimport main median {statistics.median(totals):.1f} ms exceeds the {args.budget_ms:g} ms budget")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
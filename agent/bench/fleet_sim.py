@@ -0,0 +1,319 @@
+#!/usr/bin/env python3
+"""
+Simulate a fleet of agents against a local server and measure it.
+
+Usage: python bench/fleet_sim.py [--machines 2000] [--duration 60] [--interval 30]
+                                 [--spawn-server | --url URL --server-pid PID]
+                                 [--out results.json]
+
+Each simulated machine sends reports in the agent's payload shape through
+the agent's own transport (compression, deltas via build_delta), about once
+per --interval seconds with jitter. On each cycle a check changes with
+probability --change-rate. A probe thread times the list, detail, stats and
+export endpoints while the ingest load runs.
+
+--spawn-server starts `node index.js` from ../server on a scratch data
+directory, so RSS is sampled from that process. Results (latency
+percentiles, throughput, RSS over time) are written as JSON for comparing
+runs across versions.
+"""
+import argparse
+import heapq
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import psutil
+import requests
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from agent.checks import CHECKS  # noqa: E402
+from agent.transport import ResyncRequired, TransportClient  # noqa: E402
+from main import build_delta, stable_hash  # noqa: E402
+
+SERVER_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "server")
+
+OS_MIX = [("Windows", 0.6), ("Darwin", 0.25), ("Linux", 0.15)]
+# Probability of ok / issue / unknown per check, roughly what a real fleet reports
+STATUS_MIX = {
+    "disk_encryption": (0.85, 0.10, 0.05),
+    "os_updates": (0.60, 0.35, 0.05),
+    "antivirus": (0.90, 0.05, 0.05),
+    "sleep_policy": (0.75, 0.20, 0.05),
+}
+
+
+def pick(rng, weights):
+    r = rng.random()
+    for value, weight in weights:
+        r -= weight
+        if r < 0:
+            return value
+    return weights[-1][0]
+
+
+def check_result(rng, name):
+    ok, issue, _ = STATUS_MIX.get(name, (0.8, 0.15, 0.05))
+    status = pick(rng, [("ok", ok), ("issue", issue), ("unknown", 1.0)])
+    data = {}
+    if name == "os_updates":
+        data["pending_updates"] = 0 if status == "ok" else rng.randint(1, 40)
+    elif name == "disk_encryption":
+        data["percentage_encrypted"] = 100 if status == "ok" else rng.choice([0, 45, 80])
+    return {"status": status, "summary": f"simulated {name}: {status}", "data": data}
+
+
+class Machine:
+    def __init__(self, index, rng):
+        self.id = f"sim-{index:06d}"
+        self.os = pick(rng, OS_MIX)
+        self.hostname = f"SIM-{self.os[:3].upper()}-{index:06d}"
+        self.checks = {name: check_result(rng, name) for name in CHECKS}
+        self.last = {}  # acked_hash, acked_payload, server_* as in the agent state
+
+    def cycle(self, rng, change_rate):
+        if rng.random() < change_rate:
+            name = rng.choice(list(self.checks))
+            self.checks[name] = check_result(rng, name)
+        return {
+            "machine_id": self.id,
+            "hostname": self.hostname,
+            "os": self.os,
+            "timestamp": int(time.time()),
+            "checks": dict(self.checks),
+        }
+
+
+def percentiles(samples):
+    if not samples:
+        return {"count": 0}
+    ordered = sorted(samples)
+
+    def at(p):
+        return round(ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))], 2)
+
+    return {
+        "count": len(ordered),
+        "p50_ms": at(50),
+        "p95_ms": at(95),
+        "p99_ms": at(99),
+        "max_ms": round(ordered[-1], 2),
+    }
+
+
+class Simulator:
+    def __init__(self, args):
+        self.args = args
+        self.rng = random.Random(args.seed)
+        self.machines = [Machine(i, self.rng) for i in range(args.machines)]
+        now = time.monotonic()
+        # First reports are spread over one interval, like agents starting up
+        self.due = [(now + self.rng.uniform(0, args.interval), i) for i in range(args.machines)]
+        heapq.heapify(self.due)
+        self.lock = threading.Lock()
+        self.stop = threading.Event()
+        self.ingest = []  # (monotonic time, latency ms, ok)
+        self.probes = {"list": [], "detail": [], "stats": [], "export": []}
+        self.rss = []  # (seconds since start, bytes)
+        self.started = now
+        self.report_url = args.url.rstrip("/") + "/api/report"
+
+    def next_machine(self):
+        with self.lock:
+            due, i = heapq.heappop(self.due)
+            jitter = self.rng.uniform(0.5, 1.5)
+            heapq.heappush(self.due, (max(due, time.monotonic()) + self.args.interval * jitter, i))
+        return due, self.machines[i]
+
+    def worker(self):
+        client = TransportClient(max_retries=0)
+        rng = random.Random()
+        while not self.stop.is_set():
+            due, machine = self.next_machine()
+            delay = due - time.monotonic()
+            if delay > 0 and self.stop.wait(delay):
+                break
+            payload = machine.cycle(rng, self.args.change_rate)
+            version = stable_hash(payload["checks"])
+            if version == machine.last.get("acked_hash"):
+                continue  # unchanged, the agent would not report
+            body = build_delta(payload, version, machine.last) or dict(payload, version=version)
+            start = time.perf_counter()
+            ok = True
+            try:
+                encodings = machine.last.get("server_encodings")
+                try:
+                    result = client.post_update(self.report_url, self.args.api_key, body, accept_encoding=encodings)
+                except ResyncRequired:
+                    full = dict(payload, version=version)
+                    result = client.post_update(self.report_url, self.args.api_key, full, accept_encoding=encodings)
+                machine.last = {
+                    "acked_hash": version,
+                    "acked_payload": payload,
+                    "server_delta": bool(result.body.get("delta")),
+                    "server_encodings": result.accept_encoding,
+                }
+            except requests.RequestException:
+                ok = False
+            with self.lock:
+                self.ingest.append((time.monotonic(), (time.perf_counter() - start) * 1000, ok))
+        client.close()
+
+    def probe(self):
+        session = requests.Session()
+        headers = {"X-API-Key": self.args.api_key}
+        base = self.args.url.rstrip("/")
+        while not self.stop.wait(self.args.probe_interval):
+            machine = self.rng.choice(self.machines)
+            targets = [
+                ("list", f"{base}/api/machines?limit=1000"),
+                ("detail", f"{base}/api/machines/{machine.id}?limit=200"),
+                ("stats", f"{base}/api/stats"),
+                ("export", f"{base}/api/export.csv"),
+            ]
+            for name, url in targets:
+                start = time.perf_counter()
+                try:
+                    resp = session.get(url, headers=headers, timeout=60)
+                    resp.content  # the export is only done once fully read
+                    if resp.ok:
+                        self.probes[name].append((time.perf_counter() - start) * 1000)
+                except requests.RequestException:
+                    pass
+
+    def sample_rss(self, pid):
+        try:
+            proc = psutil.Process(pid)
+        except psutil.Error:
+            return
+        while not self.stop.wait(1.0):
+            try:
+                self.rss.append((round(time.monotonic() - self.started, 1), proc.memory_info().rss))
+            except psutil.Error:
+                return
+
+    def run(self, server_pid=None):
+        threads = [threading.Thread(target=self.worker, daemon=True) for _ in range(self.args.workers)]
+        threads.append(threading.Thread(target=self.probe, daemon=True))
+        if server_pid:
+            threads.append(threading.Thread(target=self.sample_rss, args=(server_pid,), daemon=True))
+        for t in threads:
+            t.start()
+        end = self.started + self.args.duration
+        last_print = self.started
+        while time.monotonic() < end:
+            time.sleep(0.5)
+            if self.args.verbose and time.monotonic() - last_print >= 5:
+                last_print = time.monotonic()
+                print(f"  {int(last_print - self.started):>4}s  {len(self.ingest)} reports sent")
+        self.stop.set()
+        for t in threads:
+            t.join(timeout=self.args.interval + 5)
+        return time.monotonic() - self.started
+
+    def results(self, elapsed):
+        latencies = [ms for _, ms, ok in self.ingest if ok]
+        errors = sum(1 for _, _, ok in self.ingest if not ok)
+        # Per-second ingest throughput and p95, to spot degradation over the run
+        timeline = {}
+        for t, ms, ok in self.ingest:
+            if ok:
+                timeline.setdefault(int(t - self.started), []).append(ms)
+        return {
+            "ingest": dict(percentiles(latencies), errors=errors, reports_per_s=round(len(latencies) / elapsed, 1)),
+            "endpoints": {name: percentiles(samples) for name, samples in self.probes.items()},
+            "ingest_timeline": [
+                {"t": second, "reports": len(samples), "p95_ms": percentiles(samples)["p95_ms"]}
+                for second, samples in sorted(timeline.items())
+            ],
+            "server_rss": [{"t": t, "bytes": rss} for t, rss in self.rss],
+        }
+
+
+def spawn_server(api_key, port):
+    data_dir = tempfile.mkdtemp(prefix="cm-sim-")
+    env = dict(os.environ, PORT=str(port), API_KEY=api_key, DATA_DIR=data_dir, DB_PATH=os.path.join(data_dir, "db.json"))
+    proc = subprocess.Popen(["node", "index.js"], cwd=SERVER_DIR, env=env, stdout=subprocess.DEVNULL)
+    url = f"http://127.0.0.1:{port}"
+    for _ in range(100):
+        if proc.poll() is not None:
+            raise SystemExit(f"server exited with code {proc.returncode}")
+        try:
+            if requests.get(url + "/health", timeout=1).ok:
+                return proc, url, data_dir
+        except requests.RequestException:
+            pass
+        time.sleep(0.1)
+    proc.kill()
+    raise SystemExit("server did not become healthy")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://127.0.0.1:3000")
+    parser.add_argument("--api-key", default=os.getenv("CM_API_KEY", "dev_local"))
+    parser.add_argument("--machines", type=int, default=2000)
+    parser.add_argument("--duration", type=float, default=60, help="seconds")
+    parser.add_argument("--interval", type=float, default=30, help="mean seconds between a machine's reports")
+    parser.add_argument("--change-rate", type=float, default=0.2, help="chance a check changes per cycle")
+    parser.add_argument("--workers", type=int, default=32, help="concurrent connections")
+    parser.add_argument("--probe-interval", type=float, default=5, help="seconds between endpoint probes")
+    parser.add_argument("--server-pid", type=int, help="sample RSS of an already running server")
+    parser.add_argument("--spawn-server", action="store_true", help="run ../server on a scratch data dir")
+    parser.add_argument("--port", type=int, default=3300, help="port for --spawn-server")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--out", default=None, help="results JSON (default fleet-sim-<time>.json)")
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+
+    server = None
+    server_pid = args.server_pid
+    if args.spawn_server:
+        server, args.url, data_dir = spawn_server(args.api_key, args.port)
+        server_pid = server.pid
+        print(f"Server pid {server.pid} on {args.url}, data in {data_dir}")
+
+    try:
+        sim = Simulator(args)
+        print(f"Simulating {args.machines} machines for {args.duration:.0f}s against {args.url}")
+        elapsed = sim.run(server_pid)
+        results = sim.results(elapsed)
+        try:
+            resp = requests.get(args.url.rstrip("/") + "/api/ingest/stats", headers={"X-API-Key": args.api_key}, timeout=5)
+            results["server_ingest_stats"] = resp.json() if resp.ok else None
+        except (requests.RequestException, ValueError):
+            results["server_ingest_stats"] = None
+    finally:
+        if server:
+            server.terminate()
+            server.wait(timeout=10)
+
+    results["run"] = {
+        "started": int(time.time() - elapsed),
+        "elapsed_s": round(elapsed, 1),
+        "args": {k: v for k, v in vars(args).items() if k not in ("api_key", "out")},
+    }
+    out = args.out or f"fleet-sim-{time.strftime('%Y%m%d-%H%M%S')}.json"
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+
+    ing = results["ingest"]
+    print(f"{'endpoint':<8} {'count':>7} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for name, stats in [("ingest", ing)] + list(results["endpoints"].items()):
+        if stats.get("count"):
+            print(f"{name:<8} {stats['count']:>7} {stats['p50_ms']:>8} {stats['p95_ms']:>8} {stats['p99_ms']:>8}")
+    print(f"Ingest: {ing['reports_per_s']} reports/s, {ing['errors']} errors")
+    if results["server_rss"]:
+        peak = max(s["bytes"] for s in results["server_rss"])
+        print(f"Server RSS peak: {peak / 1048576:.1f} MiB")
+    print(f"Results written to {out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,6 +2,7 @@
 """
 Build script for creating cross-platform executables of the Compliance Monitor Agent
 """
+import argparse
 import os
 import sys
 import shutil
@@ -46,7 +47,7 @@ def clean_build_dirs():
                 print(f"Warning: Could not remove {dir_name}/: {e}")
     
     # Also clean .spec files
-    for spec_file in ["compliance-monitor-agent.spec"]:
+    for spec_file in [p["spec"] for p in BUILD_PROFILES.values()]:
         if os.path.exists(spec_file):
             try:
                 os.remove(spec_file)
@@ -56,9 +57,73 @@ def clean_build_dirs():
     
     return True
 
-def create_pyinstaller_spec():
-    """Create PyInstaller spec file for the agent"""
-    spec_content = '''# -*- mode: python ; coding: utf-8 -*-
+# Every agent module, including the ones only imported inside functions
+HIDDEN_IMPORTS = [
+    'agent.apt',
+    'agent.blockdev',
+    'agent.checks',
+    'agent.dconf',
+    'agent.facts',
+    'agent.metrics',
+    'agent.outbox',
+    'agent.processes',
+    'agent.profiling',
+    'agent.recorder',
+    'agent.rpm',
+    'agent.scheduler',
+    'agent.state',
+    'agent.transport',
+    'agent.utils',
+]
+
+# Build profiles. "startup" trades the single self-contained file for a fast
+# cold start: a onedir build is not unpacked to a temp dir on every launch,
+# without UPX no DLL is decompressed at load, bytecode is built with -OO, and
+# stdlib packages the agent never uses are left out. Both profiles leave out
+# IPython, which python-dotenv's optional IPython extension would pull in
+# (with jedi and parso) although the agent never loads it.
+BUILD_PROFILES = {
+    "default": {
+        "spec": "compliance-monitor-agent.spec",
+        "onefile": True,
+        "upx": True,
+        "optimize": 0,
+        "excludes": ['IPython'],
+    },
+    "startup": {
+        "spec": "compliance-monitor-agent-startup.spec",
+        "onefile": False,
+        "upx": False,
+        "optimize": 2,
+        "excludes": ['IPython', 'tkinter', 'unittest', 'pydoc', 'doctest', 'lib2to3', 'test', 'distutils'],
+    },
+}
+
+def spec_source(profile):
+    """PyInstaller spec for a build profile"""
+    settings = BUILD_PROFILES[profile]
+    upx = str(settings["upx"])
+    hidden = "".join(f"\n        '{name}'," for name in HIDDEN_IMPORTS)
+    excludes = "".join(f"'{name}', " for name in settings["excludes"]).rstrip(", ")
+    if settings["onefile"]:
+        exe_inputs = "pyz,\n    a.scripts,\n    a.binaries,\n    a.zipfiles,\n    a.datas,\n    [],"
+        collect = ""
+    else:
+        exe_inputs = "pyz,\n    a.scripts,\n    [],\n    exclude_binaries=True,"
+        collect = f"""
+coll = COLLECT(
+    exe,
+    a.binaries,
+    a.zipfiles,
+    a.datas,
+    strip=False,
+    upx={upx},
+    upx_exclude=[],
+    name='compliance-monitor-agent',
+)
+"""
+    return f"""# -*- mode: python ; coding: utf-8 -*-
+# Build profile: {profile} (generated by build.py)
 
 block_cipher = None
 
@@ -67,36 +132,28 @@ a = Analysis(
     pathex=[],
     binaries=[],
     datas=[],
-    hiddenimports=[
-        'agent.checks',
-        'agent.state', 
-        'agent.transport',
-        'agent.utils'
+    hiddenimports=[{hidden}
     ],
     hookspath=[],
-    hooksconfig={},
+    hooksconfig={{}},
     runtime_hooks=[],
-    excludes=[],
+    excludes=[{excludes}],
     win_no_prefer_redirects=False,
     win_private_assemblies=False,
     cipher=block_cipher,
     noarchive=False,
+    optimize={settings["optimize"]},
 )
 
 pyz = PYZ(a.pure, a.zipped_data, cipher=block_cipher)
 
 exe = EXE(
-    pyz,
-    a.scripts,
-    a.binaries,
-    a.zipfiles,
-    a.datas,
-    [],
+    {exe_inputs}
     name='compliance-monitor-agent',
     debug=False,
     bootloader_ignore_signals=False,
     strip=False,
-    upx=True,
+    upx={upx},
     upx_exclude=[],
     runtime_tmpdir=None,
     console=True,
@@ -106,27 +163,30 @@ exe = EXE(
     codesign_identity=None,
     entitlements_file=None,
 )
-'''
-    
+{collect}"""
+
+def create_pyinstaller_spec(profile="default"):
+    """Create PyInstaller spec file for the agent"""
+    spec_file = BUILD_PROFILES[profile]["spec"]
     try:
-        with open("compliance-monitor-agent.spec", "w") as f:
-            f.write(spec_content)
-        print("Created PyInstaller spec file")
+        with open(spec_file, "w") as f:
+            f.write(spec_source(profile))
+        print(f"Created PyInstaller spec file {spec_file}")
         return True
     except Exception as e:
         print(f"Failed to create spec file: {e}")
         return False
 
-def build_executable():
+def build_executable(profile="default"):
     """Build the executable using PyInstaller"""
     print("Building executable...")
     return run_command([
         sys.executable, "-m", "PyInstaller", 
         "--clean",
-        "compliance-monitor-agent.spec"
+        BUILD_PROFILES[profile]["spec"]
     ])
 
-def create_distribution_package():
+def create_distribution_package(profile="default"):
     """Create a distribution package with executable and config files"""
     os_name = platform.system().lower()
     arch = platform.machine().lower()
@@ -145,10 +205,17 @@ def create_distribution_package():
     if os_name == "windows":
         exe_name += ".exe"
     
-    exe_path = Path("dist") / exe_name
-    if exe_path.exists():
-        shutil.copy2(exe_path, dist_dir / exe_name)
-        print(f"Copied executable to {dist_dir}")
+    if BUILD_PROFILES[profile]["onefile"]:
+        exe_path = Path("dist") / exe_name
+        if exe_path.exists():
+            shutil.copy2(exe_path, dist_dir / exe_name)
+            print(f"Copied executable to {dist_dir}")
+    else:
+        # onedir: the executable plus its _internal directory
+        app_dir = Path("dist") / "compliance-monitor-agent"
+        if app_dir.exists():
+            shutil.copytree(app_dir, dist_dir, dirs_exist_ok=True)
+            print(f"Copied application directory to {dist_dir}")
     
     # Create sample config file
     config_content = '''# Compliance Monitor Agent Configuration
@@ -196,8 +263,9 @@ REM Create installation directory
 set INSTALL_DIR=C:\\Program Files\\Compliance Monitor
 if not exist "%INSTALL_DIR%" mkdir "%INSTALL_DIR%"
 
-REM Copy executable
+REM Copy executable (and its _internal directory for startup-profile builds)
 copy compliance-monitor-agent.exe "%INSTALL_DIR%\\"
+if exist _internal xcopy /E /I /Y _internal "%INSTALL_DIR%\\_internal"
 
 REM Copy config template
 copy config.env.example "%INSTALL_DIR%\\"
@@ -249,8 +317,15 @@ echo "Installing Compliance Monitor Agent..."
 INSTALL_DIR="/usr/local/bin"
 CONFIG_DIR="$HOME/.compliance-monitor"
 
-# Copy executable
-sudo cp compliance-monitor-agent "$INSTALL_DIR/"
+# Copy executable; startup-profile builds bring an _internal directory and
+# are installed under /usr/local/lib with a link in $INSTALL_DIR
+if [ -d _internal ]; then
+    sudo mkdir -p /usr/local/lib/compliance-monitor-agent
+    sudo cp -R compliance-monitor-agent _internal /usr/local/lib/compliance-monitor-agent/
+    sudo ln -sf /usr/local/lib/compliance-monitor-agent/compliance-monitor-agent "$INSTALL_DIR/compliance-monitor-agent"
+else
+    sudo cp compliance-monitor-agent "$INSTALL_DIR/"
+fi
 sudo chmod +x "$INSTALL_DIR/compliance-monitor-agent"
 
 # Create config directory
@@ -308,8 +383,15 @@ echo "Installing Compliance Monitor Agent..."
 INSTALL_DIR="/usr/local/bin"
 CONFIG_DIR="/etc/compliance-monitor"
 
-# Copy executable
-sudo cp compliance-monitor-agent "$INSTALL_DIR/"
+# Copy executable; startup-profile builds bring an _internal directory and
+# are installed under /usr/local/lib with a link in $INSTALL_DIR
+if [ -d _internal ]; then
+    sudo mkdir -p /usr/local/lib/compliance-monitor-agent
+    sudo cp -R compliance-monitor-agent _internal /usr/local/lib/compliance-monitor-agent/
+    sudo ln -sf /usr/local/lib/compliance-monitor-agent/compliance-monitor-agent "$INSTALL_DIR/compliance-monitor-agent"
+else
+    sudo cp compliance-monitor-agent "$INSTALL_DIR/"
+fi
 sudo chmod +x "$INSTALL_DIR/compliance-monitor-agent"
 
 # Create config directory
@@ -354,8 +436,14 @@ echo "3. Check status: sudo systemctl status compliance-monitor-agent"
 
 def main():
     """Main build process"""
+    parser = argparse.ArgumentParser(description="Build the Compliance Monitor Agent executable")
+    parser.add_argument("--profile", choices=sorted(BUILD_PROFILES), default="default",
+                        help="default: single UPX-packed file; startup: onedir build tuned for cold start")
+    args = parser.parse_args()
+
     print("=== Compliance Monitor Agent Build Process ===")
     print(f"Platform: {platform.system()} {platform.machine()}")
+    print(f"Profile: {args.profile}")
     print()
     
     # Check if we're in the right directory
@@ -366,9 +454,9 @@ def main():
     steps = [
         ("Installing build dependencies", install_build_dependencies),
         ("Cleaning build directories", clean_build_dirs),
-        ("Creating PyInstaller spec", create_pyinstaller_spec),
-        ("Building executable", build_executable),
-        ("Creating distribution package", create_distribution_package),
+        ("Creating PyInstaller spec", lambda: create_pyinstaller_spec(args.profile)),
+        ("Building executable", lambda: build_executable(args.profile)),
+        ("Creating distribution package", lambda: create_distribution_package(args.profile)),
     ]
     
     for step_name, step_func in steps:
@@ -0,0 +1,70 @@
+# -*- mode: python ; coding: utf-8 -*-
+# Build profile: startup (generated by build.py)
+
+block_cipher = None
+
+a = Analysis(
+    ['main.py'],
+    pathex=[],
+    binaries=[],
+    datas=[],
+    hiddenimports=[
+        'agent.apt',
+        'agent.blockdev',
+        'agent.checks',
+        'agent.dconf',
+        'agent.facts',
+        'agent.metrics',
+        'agent.outbox',
+        'agent.processes',
+        'agent.profiling',
+        'agent.recorder',
+        'agent.rpm',
+        'agent.scheduler',
+        'agent.state',
+        'agent.transport',
+        'agent.utils',
+    ],
+    hookspath=[],
+    hooksconfig={},
+    runtime_hooks=[],
+    excludes=['IPython', 'tkinter', 'unittest', 'pydoc', 'doctest', 'lib2to3', 'test', 'distutils'],
+    win_no_prefer_redirects=False,
+    win_private_assemblies=False,
+    cipher=block_cipher,
+    noarchive=False,
+    optimize=2,
+)
+
+pyz = PYZ(a.pure, a.zipped_data, cipher=block_cipher)
+
+exe = EXE(
+    pyz,
+    a.scripts,
+    [],
+    exclude_binaries=True,
+    name='compliance-monitor-agent',
+    debug=False,
+    bootloader_ignore_signals=False,
+    strip=False,
+    upx=False,
+    upx_exclude=[],
+    runtime_tmpdir=None,
+    console=True,
+    disable_windowed_traceback=False,
+    argv_emulation=False,
+    target_arch=None,
+    codesign_identity=None,
+    entitlements_file=None,
+)
+
+coll = COLLECT(
+    exe,
+    a.binaries,
+    a.zipfiles,
+    a.datas,
+    strip=False,
+    upx=False,
+    upx_exclude=[],
+    name='compliance-monitor-agent',
+)
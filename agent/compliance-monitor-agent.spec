@@ -1,4 +1,5 @@
 # -*- mode: python ; coding: utf-8 -*-
+# Build profile: default (generated by build.py)
 
 block_cipher = None
 
@@ -8,19 +9,31 @@ a = Analysis(
     binaries=[],
     datas=[],
     hiddenimports=[
+        'agent.apt',
+        'agent.blockdev',
         'agent.checks',
-        'agent.state', 
+        'agent.dconf',
+        'agent.facts',
+        'agent.metrics',
+        'agent.outbox',
+        'agent.processes',
+        'agent.profiling',
+        'agent.recorder',
+        'agent.rpm',
+        'agent.scheduler',
+        'agent.state',
         'agent.transport',
-        'agent.utils'
+        'agent.utils',
     ],
     hookspath=[],
     hooksconfig={},
     runtime_hooks=[],
-    excludes=[],
+    excludes=['IPython'],
     win_no_prefer_redirects=False,
     win_private_assemblies=False,
     cipher=block_cipher,
     noarchive=False,
+    optimize=0,
 )
 
 pyz = PYZ(a.pure, a.zipped_data, cipher=block_cipher)
@@ -5,13 +5,30 @@ import random
 import sys
 import time
 from datetime import datetime, timezone
+from typing import TYPE_CHECKING, Any, Dict, Optional, Tuple
 
 from dotenv import load_dotenv
 
-from agent.checks import collect_all_checks
-from agent.state import load_last_state, save_last_state
-from agent.transport import post_update
-from agent.utils import get_machine_identity
+from agent.checks import CHECKS, is_timed_out
+from agent.facts import Facts
+from agent.metrics import (
+    CHECK_STATS,
+    COUNTERS,
+    UPLOAD_TIMINGS,
+    children_cpu_seconds,
+    payload_block,
+    render_textfile,
+    write_textfile,
+)
+from agent.outbox import Outbox
+from agent.recorder import RECORDER
+from agent.scheduler import check_intervals, collect_due_checks
+from agent.state import data_dir, load_last_state, save_last_state
+from agent.utils import CMD_STATS
+
+if TYPE_CHECKING:
+    # requests (and certifi, urllib3) load on the first upload, not at startup
+    from agent.transport import TransportClient, UploadResult
 
 
 class Config:
@@ -30,9 +47,74 @@ class Config:
         self.dry_run = os.getenv("CM_DRY_RUN", "false").lower() == "true"
         self.verbose = os.getenv("CM_VERBOSE", "false").lower() == "true"
         self.insecure = os.getenv("CM_INSECURE", "false").lower() == "true"
+        self.cycle_deadline = float(os.getenv("CM_CYCLE_DEADLINE", "60"))
+        self.max_workers = int(os.getenv("CM_MAX_WORKERS", "4"))
+        self.compress_min_bytes = int(os.getenv("CM_COMPRESS_MIN_BYTES", "1024"))
+        self.connect_timeout = float(os.getenv("CM_CONNECT_TIMEOUT", "5"))
+        self.read_timeout = float(os.getenv("CM_READ_TIMEOUT", "15"))
+        self.max_retries = int(os.getenv("CM_MAX_RETRIES", "4"))
+        self.outbox_max_bytes = int(os.getenv("CM_OUTBOX_MAX_BYTES", str(10 * 1024 * 1024)))
+        self.outbox_max_age = int(float(os.getenv("CM_OUTBOX_MAX_AGE_DAYS", "30")) * 86400)
+        self.outbox_batch = int(os.getenv("CM_OUTBOX_BATCH", "50"))
+        # Command fixture directories: capture probe output, or serve it back
+        self.cmd_record = os.getenv("CM_CMD_RECORD")
+        self.cmd_replay = os.getenv("CM_CMD_REPLAY")
+        # Cycle metrics: a Prometheus textfile and/or an agent_metrics block in reports
+        self.metrics_textfile = os.getenv("CM_METRICS_TEXTFILE")
+        self.payload_metrics = os.getenv("CM_PAYLOAD_METRICS", "false").lower() == "true"
+        # Cycle profiling: sample (all threads, collapsed stacks) or cprofile
+        profile = os.getenv("CM_PROFILE", "").strip().lower()
+        self.profile = {"": None, "false": None, "true": "sample"}.get(profile, profile)
+        self.profile_dir = os.getenv("CM_PROFILE_DIR")
+        self.profile_interval_ms = float(os.getenv("CM_PROFILE_INTERVAL_MS", "5"))
+        self.profile_max_bytes = int(os.getenv("CM_PROFILE_MAX_BYTES", str(50 * 1024 * 1024)))
+        # Per-check cache TTL in minutes, e.g. CM_INTERVAL_OS_UPDATES=720
+        overrides = {}
+        for name in CHECKS:
+            value = os.getenv(f"CM_INTERVAL_{name.upper()}")
+            if value:
+                overrides[name] = int(value)
+        self.check_intervals = check_intervals(overrides)
+        self._transport = None
+        self._outbox = None
+        self._profiler = None
+
+    def transport(self) -> "TransportClient":
+        """One pooled client for the life of the process"""
+        if self._transport is None:
+            from agent.transport import TransportClient
+
+            self._transport = TransportClient(
+                connect_timeout=self.connect_timeout,
+                read_timeout=self.read_timeout,
+                max_retries=self.max_retries,
+            )
+        return self._transport
+
+    def outbox(self) -> Outbox:
+        if self._outbox is None:
+            self._outbox = Outbox(data_dir(), max_bytes=self.outbox_max_bytes, max_age=self.outbox_max_age)
+        return self._outbox
+    
+    def profiler(self):
+        if self._profiler is None:
+            # Imported here so runs without CM_PROFILE never load cProfile
+            from agent.profiling import CycleProfiler
+
+            self._profiler = CycleProfiler(
+                self.profile,
+                self.profile_dir or os.path.join(data_dir(), "profiles"),
+                max_bytes=self.profile_max_bytes,
+                interval=self.profile_interval_ms / 1000,
+            )
+        return self._profiler
     
     def validate(self):
         """Validate required configuration"""
+        if self.profile not in (None, "sample", "cprofile"):
+            raise ValueError("CM_PROFILE must be sample, cprofile, true or false")
+        if self.cmd_record and self.cmd_replay:
+            raise ValueError("CM_CMD_RECORD and CM_CMD_REPLAY cannot be used together")
         if not self.once and not self.dry_run:
             if not self.endpoint:
                 raise ValueError("CM_ENDPOINT is required when not running in once or dry-run mode")
@@ -49,53 +131,355 @@ def stable_hash(obj) -> str:
     return hashlib.sha256(data).hexdigest()
 
 
-def build_payload(verbose: bool = False):
-    identity = get_machine_identity()
-    checks = collect_all_checks(verbose=verbose)
+def build_payload(config: Config, check_cache=None):
+    facts = Facts()
+    identity = facts.get("identity")
+    ts = now_ts()
+    # Without a cache (once/dry-run) every check runs
+    checks = collect_due_checks(
+        check_cache if check_cache is not None else {},
+        ts,
+        config.check_intervals,
+        force=check_cache is None,
+        verbose=config.verbose,
+        deadline=config.cycle_deadline,
+        max_workers=config.max_workers,
+        facts=facts,
+    )
     payload = {
         "machine_id": identity["machine_id"],
         "hostname": identity["hostname"],
         "os": identity["os"],
-        "timestamp": now_ts(),
+        "timestamp": ts,
         "checks": checks,
     }
     return payload
 
 
+def build_delta(payload, version: str, last) -> Optional[Dict[str, Any]]:
+    """Payload carrying only the checks whose hash changed since the last acked report."""
+    base = last.get("acked_payload")
+    if not last.get("server_delta") or not base or not last.get("acked_hash"):
+        return None
+    base_checks = base.get("checks", {})
+    checks = payload["checks"]
+    changed = {
+        name: result
+        for name, result in checks.items()
+        if name not in base_checks or stable_hash(base_checks[name]) != stable_hash(result)
+    }
+    delta = {key: value for key, value in payload.items() if key != "checks"}
+    delta.update({
+        "delta": True,
+        "base_version": last["acked_hash"],
+        "version": version,
+        "checks": changed,
+        "removed": sorted(name for name in base_checks if name not in checks),
+    })
+    return delta
+
+
+def send_report(config: Config, payload, version: str, last) -> "UploadResult":
+    from agent.transport import ResyncRequired
+
+    kwargs = {
+        "verify_tls": not config.insecure,
+        "accept_encoding": last.get("server_encodings"),
+        "compress_min_bytes": config.compress_min_bytes,
+    }
+    delta = build_delta(payload, version, last)
+    if delta is not None:
+        try:
+            result = config.transport().post_update(config.endpoint, config.api_key, delta, **kwargs)
+            if config.verbose:
+                print(f"Sent delta with {len(delta['checks'])} changed checks.")
+            return result
+        except ResyncRequired:
+            if config.verbose:
+                print("Server requested a full resync.")
+    full = dict(payload, version=version)
+    return config.transport().post_update(config.endpoint, config.api_key, full, **kwargs)
+
+
+def log_attempts(config: Config) -> None:
+    attempts = config.transport().take_attempts()
+    UPLOAD_TIMINGS.add(attempts)
+    if config.verbose:
+        for a in attempts:
+            outcome = a.get("error") or a["status"]
+            print(f"Upload attempt {a['attempt'] + 1}: {outcome} in {a['latency_ms']} ms")
+
+
+def record_upload_bytes(state, verbose: bool = False) -> None:
+    from agent.transport import UPLOAD_STATS
+
+    stats = UPLOAD_STATS.snapshot(reset=True)
+    totals = dict(state.get("upload_bytes") or {"raw": 0, "sent": 0})
+    totals["raw"] = totals.get("raw", 0) + stats["raw_bytes"]
+    totals["sent"] = totals.get("sent", 0) + stats["sent_bytes"]
+    state["upload_bytes"] = totals
+    if verbose and stats["uploads"]:
+        print(f"Uploaded {stats['sent_bytes']} bytes ({stats['raw_bytes']} uncompressed)")
+
+
+def cycle_counters(last, checks, check_stats, changed: bool):
+    """Running skip/error counters, carried across runs in the state file."""
+    counters = {name: 0 for name in COUNTERS}
+    counters.update((last.get("metrics") or {}).get("counters") or {})
+    counters["cycles"] += 1
+    if not changed:
+        counters["skipped"] += 1
+    # Timed-out results are never cached, so all of them are from this cycle
+    counters["check_timeouts"] += sum(1 for result in checks.values() if is_timed_out(result))
+    counters["check_errors"] += sum(
+        1 for name in check_stats if str(checks.get(name, {}).get("summary", "")).startswith("error:")
+    )
+    return counters
+
+
+def finish_cycle(config: Config, cycle, counters, state, upload_bytes_before, pending: int = 0) -> None:
+    """Record this cycle's upload figures in state and write the metrics textfile."""
+    upload = UPLOAD_TIMINGS.snapshot(reset=True)
+    totals = state.get("upload_bytes") or {}
+    before = upload_bytes_before or {}
+    upload["raw_bytes"] = totals.get("raw", 0) - before.get("raw", 0)
+    upload["sent_bytes"] = totals.get("sent", 0) - before.get("sent", 0)
+    counters["upload_errors"] += upload["failed"]
+    cycle["upload"] = upload
+    cycle["outbox_pending"] = pending
+    cycle["finished"] = time.time()
+    last_upload = upload if upload["attempts"] else (state.get("metrics") or {}).get("last_upload")
+    state["metrics"] = {"counters": counters, "last_upload": last_upload}
+    if config.metrics_textfile:
+        try:
+            write_textfile(config.metrics_textfile, render_textfile(cycle, counters))
+        except OSError as e:
+            if config.verbose:
+                print(f"Could not write metrics textfile: {e}")
+
+
 def maybe_report(config: Config) -> bool:
-    payload = build_payload(verbose=config.verbose)
+    last = load_last_state() or {}
+    oneshot = config.once or config.dry_run
+    check_cache = None if oneshot else last.get("check_cache", {})
 
-    last = load_last_state()
+    children_cpu = children_cpu_seconds()
+    started = time.perf_counter()
+    payload = build_payload(config, check_cache)
+    build_ms = (time.perf_counter() - started) * 1000
+    cmd_stats = CMD_STATS.snapshot(reset=True)
+    check_stats = CHECK_STATS.snapshot(reset=True)
+    if config.verbose:
+        print(
+            f"Commands: {cmd_stats['processes']} spawned, {cmd_stats['kills']} killed, "
+            f"{cmd_stats['bytes_read']} bytes read"
+        )
+        for name, stats in sorted(check_stats.items(), key=lambda item: -item[1]["wall_ms"]):
+            print(f"Check {name}: {stats['wall_ms']} ms wall, {stats['cpu_ms']} ms CPU, {stats['processes']} commands")
+
+    started = time.perf_counter()
     current_hash = stable_hash(payload["checks"])
-    last_hash = last.get("last_hash") if last else None
+    hash_ms = (time.perf_counter() - started) * 1000
+    last_hash = last.get("last_hash")
+    changed = last_hash != current_hash
+
+    counters = cycle_counters(last, payload["checks"], check_stats, changed or oneshot)
+    children_after = children_cpu_seconds()
+    cycle = {
+        "checks": check_stats,
+        "build_ms": round(build_ms, 1),
+        "hash_ms": round(hash_ms, 2),
+        "commands": cmd_stats,
+        "children_cpu_ms": None if children_cpu is None else round((children_after - children_cpu) * 1000, 1),
+        "last_upload": (last.get("metrics") or {}).get("last_upload"),
+    }
+    if config.payload_metrics:
+        # Outside payload["checks"], so it never makes an unchanged report look changed
+        payload["agent_metrics"] = payload_block(cycle, counters)
 
-    if config.once or config.dry_run:
+    if oneshot:
         if config.verbose:
             print(json.dumps(payload, indent=2))
+        # One-shot runs keep no state, so their counters are not carried over
+        state = dict(last)
         if not config.dry_run and config.endpoint and config.api_key:
-            post_update(config.endpoint, config.api_key, payload, verify_tls=not config.insecure)
+            config.transport().post_update(
+                config.endpoint, config.api_key, dict(payload, version=current_hash), verify_tls=not config.insecure
+            )
+            log_attempts(config)
+            record_upload_bytes(state, config.verbose)
+            counters["reports"] += 1
+        finish_cycle(config, cycle, counters, state, last.get("upload_bytes"))
         return True
 
-    if last_hash == current_hash:
-        if config.verbose:
-            print("No change detected; skipping report.")
-        return False
+    state = dict(last)
+    state["check_cache"] = check_cache
+    reporting = bool(config.endpoint and config.api_key)
 
-    if config.endpoint and config.api_key:
-        post_update(config.endpoint, config.api_key, payload, verify_tls=not config.insecure)
-        save_last_state({"last_hash": current_hash, "last_payload": payload})
-        if config.verbose:
-            print("Reported change.")
-        return True
-    else:
+    if changed and reporting:
+        # Queue before recording the hash so a crash cannot lose the change
+        config.outbox().append(payload, current_hash)
+        state["last_hash"] = current_hash
+    save_last_state(state)
+
+    if not reporting:
         if config.verbose:
             print("Endpoint or API key missing; not reporting.")
+        finish_cycle(config, cycle, counters, state, state.get("upload_bytes"))
+        save_last_state(state)
         return False
+    if not changed and config.verbose:
+        print("No change detected.")
+
+    upload_bytes_before = dict(state.get("upload_bytes") or {})
+    sent, rejected = drain_outbox(config, state)
+    if config.verbose and sent:
+        print(f"Reported {sent} queued change(s).")
+    counters["reports"] += sent
+    counters["rejected_reports"] += rejected
+    finish_cycle(config, cycle, counters, state, upload_bytes_before, pending=len(config.outbox()))
+    save_last_state(state)
+    return changed
+
+
+def run_cycle(config: Config) -> bool:
+    """One maybe_report() cycle, under the profiler when CM_PROFILE is set."""
+    if not config.profile:
+        return maybe_report(config)
+    return config.profiler().run(maybe_report, config)
+
+
+def batch_endpoint(endpoint: str) -> str:
+    return endpoint.rstrip("/") + "/batch"
+
+
+def send_batch(config: Config, records, instance: str, state) -> Tuple[int, Optional[Dict[str, Any]]]:
+    """Send records through the batch endpoint.
+
+    Returns how many leading records the server stored, and the server's
+    result for the first record it did not store (None if it stored all).
+    """
+    reports = []
+    base = state
+    for record in records:
+        payload = dict(record["payload"], seq=record["seq"], instance=instance)
+        # Each report is a delta against the one before it in the batch
+        delta = build_delta(payload, record["version"], base)
+        reports.append(delta if delta is not None else dict(payload, version=record["version"]))
+        base = dict(state, acked_hash=record["version"], acked_payload=record["payload"])
+    result = config.transport().post_batch(
+        batch_endpoint(config.endpoint),
+        config.api_key,
+        reports,
+        verify_tls=not config.insecure,
+        accept_encoding=state.get("server_encodings"),
+        compress_min_bytes=config.compress_min_bytes,
+    )
+    results = result.body.get("results") or []
+    stored = 0
+    failure = None
+    for outcome in results:
+        if not outcome.get("ok"):
+            failure = outcome
+            if outcome.get("resync"):
+                # The next send starts with a full report
+                state.pop("acked_payload", None)
+            break
+        stored += 1
+    if stored:
+        last = records[stored - 1]
+        state.update({"acked_hash": last["version"], "acked_payload": last["payload"]})
+    state.update({"server_encodings": result.accept_encoding, "server_batch_max": result.batch_max})
+    if config.verbose:
+        print(f"Sent batch of {len(records)} reports, {stored} stored.")
+    return stored, failure
+
+
+def reject_record(config: Config, outbox, record, status: Optional[int], error: Optional[str]) -> None:
+    outbox.reject(record, status, error)
+    if config.verbose:
+        print(f"Server rejected queued report {record['seq']} ({status}: {error}); moved to {outbox.rejected_path}")
+
+
+def drain_outbox(config: Config, state) -> Tuple[int, int]:
+    """Send queued reports oldest first.
+
+    Network errors, 5xx and 429 stop the drain and keep the rest queued for
+    the next cycle. A report the server refuses outright (any other 4xx) is
+    dead-lettered so it cannot hold back the ones behind it. Returns how
+    many reports were stored and how many were rejected.
+    """
+    from agent.transport import error_status, rejects_report
+
+    outbox = config.outbox()
+    sent = rejected = 0
+    batch_limit = config.outbox_batch
+    while True:
+        batch_max = min(batch_limit, state.get("server_batch_max") or 1)
+        batch = outbox.pending(max(1, batch_max))
+        if not batch:
+            break
+        if len(batch) > 1:
+            try:
+                stored, failure = send_batch(config, batch, outbox.instance, state)
+            except Exception as e:
+                log_attempts(config)
+                if rejects_report(error_status(e)):
+                    # The request as a whole was refused (e.g. 413); retry in
+                    # smaller batches, down to single reports
+                    batch_limit = len(batch) // 2
+                    continue
+                if config.verbose:
+                    print(f"Upload failed, {len(outbox)} report(s) queued: {e}")
+                return sent, rejected
+            log_attempts(config)
+            record_upload_bytes(state, config.verbose)
+            save_last_state(state)
+            if stored:
+                outbox.ack(batch[stored - 1]["seq"])
+                sent += stored
+            if failure is None or failure.get("resync"):
+                continue
+            if rejects_report(failure.get("status")):
+                reject_record(config, outbox, batch[stored], failure.get("status"), failure.get("error"))
+                rejected += 1
+            elif not stored:
+                # Rejected for a reason that may pass; retry next cycle
+                return sent, rejected
+            continue
+        record = batch[0]
+        payload = dict(record["payload"], seq=record["seq"], instance=outbox.instance)
+        try:
+            result = send_report(config, payload, record["version"], state)
+        except Exception as e:
+            log_attempts(config)
+            status = error_status(e)
+            if rejects_report(status):
+                reject_record(config, outbox, record, status, str(e))
+                rejected += 1
+                continue
+            if config.verbose:
+                print(f"Upload failed, {len(outbox)} report(s) queued: {e}")
+            return sent, rejected
+        state.update({
+            "acked_hash": record["version"],
+            "acked_payload": record["payload"],
+            "server_delta": bool(result.body.get("delta")),
+            "server_encodings": result.accept_encoding,
+            "server_batch_max": result.batch_max,
+        })
+        log_attempts(config)
+        record_upload_bytes(state, config.verbose)
+        # A crash between these two only causes a resend, which the server ignores
+        save_last_state(state)
+        outbox.ack(record["seq"])
+        sent += 1
+    return sent, rejected
 
 
 def daemon_loop(config: Config):
     # On start, always compute and possibly send if changed
-    if maybe_report(config):
+    if run_cycle(config):
         pass
     while True:
         interval_min = max(1, int(config.min_interval))
@@ -112,7 +496,7 @@ def daemon_loop(config: Config):
             # Ensure we continue running even if sleep is interrupted
             pass
         try:
-            maybe_report(config)
+            run_cycle(config)
         except Exception as e:
             if config.verbose:
                 print(f"Report error: {e}")
@@ -122,6 +506,10 @@ if __name__ == "__main__":
     try:
         config = Config()
         config.validate()
+        if config.cmd_record:
+            RECORDER.configure("record", config.cmd_record)
+        elif config.cmd_replay:
+            RECORDER.configure("replay", config.cmd_replay)
         
         if config.verbose:
             print("Compliance Monitor Agent starting...")
@@ -131,9 +519,10 @@ if __name__ == "__main__":
             print(f"Once mode: {config.once}")
             print(f"Dry run: {config.dry_run}")
             print(f"Insecure: {config.insecure}")
+            print(f"Cycle deadline: {config.cycle_deadline} seconds")
         
         if config.once or config.dry_run:
-            maybe_report(config)
+            run_cycle(config)
         else:
             daemon_loop(config)
             
@@ -1,7 +1,7 @@
 #!/usr/bin/env python3
 """
 Cross-platform build helper for Compliance Monitor Agent
-Usage: python make.py [command]
+Usage: python make.py [command] [build.py options, e.g. --profile startup]
 
 Commands:
   install-deps  - Install build dependencies
@@ -49,7 +49,7 @@ def main():
                 sys.exit(1)
         
         # Run the main build script
-        success = run_python_script("build.py")
+        success = run_python_script("build.py", *sys.argv[2:])
     else:
         print(__doc__)
         sys.exit(1)
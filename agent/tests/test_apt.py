@@ -0,0 +1,239 @@
+import os
+import re
+import shutil
+import subprocess
+
+import pytest
+
+from agent.apt import AptIndex, compare_versions, phase_draw
+
+
+def _sign(n):
+    return (n > 0) - (n < 0)
+
+
+# Expected results as given by `dpkg --compare-versions` (dpkg 1.21)
+DEB_PAIRS = [
+    ("1.0", "1.0", 0),
+    ("1.0", "1.0-0", 0),
+    ("1.00", "1.0", 0),
+    ("0:1.0", "1.0", 0),
+    ("1.0~rc1", "1.0", -1),
+    ("1.0~~", "1.0~", -1),
+    ("1.0~", "1.0", -1),
+    ("1.0~rc1-1", "1.0-0~", -1),
+    ("1.0", "1.0+b1", -1),
+    ("1:0.5", "2.0", 1),
+    ("1:2.3", "1:2.3.0", -1),
+    ("2.0", "10.0", -1),
+    ("2.30-1", "2.4-1", 1),
+    ("010", "10", 0),
+    ("9.1", "9.1.0", -1),
+    ("a", "1", 1),
+    ("1.0a", "1.0+", -1),
+    ("1.0.", "1.0a", 1),
+    ("1.0-a", "1.0-1", 1),
+    ("1.0+dfsg-1", "1.0-1", 1),
+    ("1.0-1", "1.0-1ubuntu1", -1),
+    ("1.0-1ubuntu1", "1.0-1build1", 1),
+    ("1.0-1~bpo12+1", "1.0-1", -1),
+    ("1.0-1.1", "1.0-1+b1", 1),
+    ("1.2.3-4+deb12u1", "1.2.3-4", 1),
+    ("7.88.1-10+deb12u5", "7.88.1-10+deb12u12", -1),
+    ("2:1.0-1", "1:9.9-9", 1),
+]
+
+@pytest.mark.parametrize("a,b,expected", DEB_PAIRS)
+def test_compare_versions_matches_dpkg(a, b, expected):
+    assert _sign(compare_versions(a, b)) == expected
+    assert _sign(compare_versions(b, a)) == -expected
+
+
+# Policy scenarios. Each one is laid out as a dpkg status file, apt lists,
+# sources.list, preferences and apt.conf under tmp_path; the expected names are
+# what `apt-get -s upgrade` (apt 2.6.1) did with the same tree, and
+# test_scenarios_match_real_apt re-checks that wherever apt-get is installed.
+
+MACHINE_ID = "0123456789abcdef0123456789abcdef"
+
+
+def _pkg(name, version, **fields):
+    return dict({"Package": name, "Version": version, "Architecture": "amd64"}, **fields)
+
+
+def _repo(path, suite, packages, **release):
+    return {"path": path, "suite": suite, "release": dict({"Suite": suite, "Codename": suite}, **release), "packages": packages}
+
+
+def _write_stanzas(path, stanzas, extra):
+    with open(path, "w", encoding="utf-8") as f:
+        for st in stanzas:
+            f.writelines(f"{k}: {v}\n" for k, v in st.items())
+            f.write(extra + "\n")
+
+
+def apt_tree(root, installed, repos, preferences="", apt_conf=""):
+    for d in ("etc/apt.conf.d", "etc/preferences.d", "etc/sources.list.d", "lists/partial", "state", "cache/archives/partial"):
+        os.makedirs(os.path.join(root, d), exist_ok=True)
+    _write_stanzas(os.path.join(root, "status"), installed, "Status: install ok installed\nMaintainer: x\nDescription: x\n")
+    sources = []
+    for repo in repos:
+        site_path, suite = repo["path"], repo["suite"]
+        sources.append(f"deb [trusted=yes arch=amd64] http://{site_path} {suite} main\n")
+        prefix = os.path.join(root, "lists", f"{site_path}/dists/{suite}_".replace("/", "_"))
+        with open(prefix + "Release", "w", encoding="utf-8") as f:
+            f.writelines(f"{k}: {v}\n" for k, v in dict(repo["release"], Components="main", Architectures="amd64 all").items())
+        _write_stanzas(prefix + "main_binary-amd64_Packages", repo["packages"], "Maintainer: x\nDescription: x\nFilename: pool/x.deb\nSize: 1\n")
+    with open(os.path.join(root, "etc", "sources.list"), "w", encoding="utf-8") as f:
+        f.writelines(sources)
+    with open(os.path.join(root, "etc", "preferences"), "w", encoding="utf-8") as f:
+        f.write(preferences)
+    with open(os.path.join(root, "etc", "apt.conf"), "w", encoding="utf-8") as f:
+        f.write(f'APT::Machine-ID "{MACHINE_ID}";\n' + apt_conf)
+    return AptIndex(
+        status_path=os.path.join(root, "status"),
+        lists_dir=os.path.join(root, "lists"),
+        etc_dir=os.path.join(root, "etc"),
+        machine_id_path=os.path.join(root, "no-machine-id"),
+    )
+
+
+def real_apt_upgrade(root):
+    """Names `apt-get -s upgrade` would upgrade and defer for phasing in an apt_tree."""
+    conf = os.path.join(root, "apt-test.conf")
+    with open(conf, "w", encoding="utf-8") as f:
+        f.write(f'Dir::Etc::main "{root}/etc/apt.conf";\nDir::Etc::parts "{root}/etc/apt.conf.d";\n')
+    options = {
+        "Dir::Etc": f"{root}/etc", "Dir::Etc::sourcelist": "sources.list",
+        "Dir::State": f"{root}/state", "Dir::State::Lists": f"{root}/lists",
+        "Dir::State::status": f"{root}/status", "Dir::Cache": f"{root}/cache",
+        "Debug::NoLocking": "1", "APT::Architecture": "amd64", "APT::Architectures": "amd64",
+    }
+    cmd = ["apt-get", "-s", "upgrade"] + [arg for k, v in options.items() for arg in ("-o", f"{k}={v}")]
+    proc = subprocess.run(cmd, capture_output=True, text=True, check=True, env=dict(os.environ, LC_ALL="C", APT_CONFIG=conf))
+    upgraded = set(re.findall(r"^Inst (\S+?)(?::\S+)? ", proc.stdout, re.M))
+    deferred = set()
+    # apt 2.6 lists phased packages as kept back, later versions as deferred
+    section = re.search(r"(?:kept back|deferred due to phasing):\n((?:  .*\n)+)", proc.stdout)
+    if section:
+        deferred.update(section.group(1).split())
+    return sorted(upgraded), sorted(deferred)
+
+
+DEBIAN = {"Origin": "Debian", "Label": "Debian"}
+
+SCENARIOS = {
+    # NotAutomatic lists get priority 1, with ButAutomaticUpgrades 100
+    "release-flags": dict(
+        installed=[_pkg("foo", "1.0"), _pkg("bar", "1.5"), _pkg("baz", "1.0"), _pkg("qux", "1.0")],
+        repos=[
+            _repo("deb.example.org/debian", "stable", [_pkg("foo", "1.1"), _pkg("bar", "1.0"), _pkg("baz", "1.0")], **DEBIAN),
+            _repo("deb.example.org/debian", "stable-backports", [_pkg("foo", "1.2"), _pkg("bar", "2.0")],
+                  NotAutomatic="yes", ButAutomaticUpgrades="yes", **DEBIAN),
+            _repo("deb.example.org/debian", "experimental", [_pkg("baz", "9.0"), _pkg("qux", "2.0")], NotAutomatic="yes", **DEBIAN),
+        ],
+    ),
+    # General and package pins: release, origin and version pins, globs,
+    # regexes and src: entries, negative priorities and a 1001 hold
+    "pins": dict(
+        installed=[_pkg("foo", "1.0"), _pkg("bar", "1.0"), _pkg("libfoo1", "1.0", Source="libfoo"),
+                   _pkg("qux", "1.0"), _pkg("web", "1.0")],
+        repos=[
+            _repo("deb.example.org/debian", "stable",
+                  [_pkg("foo", "1.1"), _pkg("bar", "1.1"), _pkg("libfoo1", "1.1", Source="libfoo"), _pkg("qux", "1.1"), _pkg("web", "1.1")],
+                  **DEBIAN),
+            _repo("deb.example.org/debian", "testing", [_pkg("foo", "1.2"), _pkg("bar", "1.2"), _pkg("libfoo1", "1.2", Source="libfoo")],
+                  Codename="trixie", **DEBIAN),
+            _repo("pkgs.vendor.io/apt", "stable", [_pkg("web", "2.0"), _pkg("qux", "3.0")], Origin="Vendor"),
+        ],
+        preferences=(
+            "Package: *\nPin: release n=trixie\nPin-Priority: 100\n\n"
+            "Package: bar*\nPin: release a=testing\nPin-Priority: 600\n\n"
+            "Package: foo\nPin: version 1.1*\nPin-Priority: -1\n\n"
+            "Package: src:libfoo\nPin: version 1.0\nPin-Priority: 1001\n\n"
+            "Package: /^qu/\nPin: origin \"pkgs.vendor.io\"\nPin-Priority: 990\n\n"
+            "Package: *\nPin: origin pkgs.vendor.io\nPin-Priority: -10\n"
+        ),
+    ),
+    # APT::Default-Release outranks the newer version in stable
+    "default-release": dict(
+        installed=[_pkg("foo", "1.0"), _pkg("bar", "1.0")],
+        repos=[
+            _repo("deb.example.org/debian", "stable", [_pkg("foo", "1.1"), _pkg("bar", "1.1")], **DEBIAN),
+            _repo("deb.example.org/debian", "testing", [_pkg("foo", "1.0"), _pkg("bar", "1.2")], **DEBIAN),
+        ],
+        apt_conf='APT::Default-Release "testing";\n',
+    ),
+    # One binary per percentage and source: the packages that upgrade start
+    # at this machine's draw, so a wrong draw moves the boundary
+    "phasing": dict(
+        installed=[_pkg(f"{src}{i}", "1.0", Source=src) for src in ("demo", "libx") for i in range(101)]
+        + [_pkg("sec", "1.0"), _pkg("held", "1.1")],
+        repos=[
+            _repo("deb.example.org/ubuntu", "jammy-updates",
+                  [_pkg(f"{src}{i}", "2.0", Source=f"{src} (2.0-1)", **{"Phased-Update-Percentage": i})
+                   for src in ("demo", "libx") for i in range(101)]
+                  + [_pkg("sec", "1.2", **{"Phased-Update-Percentage": 0}), _pkg("held", "1.2"),
+                     _pkg("held", "1.1", **{"Phased-Update-Percentage": 0})],
+                  Origin="Ubuntu"),
+            _repo("deb.example.org/ubuntu", "jammy-security", [_pkg("sec", "1.1")], Origin="Ubuntu"),
+        ],
+    ),
+}
+
+
+def _names(prefix, numbers):
+    return [f"{prefix}{i}" for i in numbers]
+
+
+EXPECTED = {
+    "release-flags": (["bar", "foo"], []),
+    "pins": (["bar", "foo", "qux", "web"], []),
+    "default-release": (["bar"], []),
+    # The draws are 48 for demo 2.0-1 and 8 for libx 2.0-1 on MACHINE_ID. sec
+    # supersedes a security update, so it is not phased. held stays back because
+    # its installed version is still being phased in.
+    "phasing": (
+        sorted(_names("demo", range(48, 101)) + _names("libx", range(8, 101)) + ["sec"]),
+        sorted(_names("demo", range(48)) + _names("libx", range(8)) + ["held"]),
+    ),
+}
+
+
+@pytest.mark.parametrize("name", sorted(SCENARIOS))
+def test_policy_scenarios(tmp_path, name):
+    result = apt_tree(str(tmp_path), **SCENARIOS[name]).upgradable()
+    assert (result["upgradable"], result["phased"]) == EXPECTED[name]
+
+
+@pytest.mark.skipif(shutil.which("apt-get") is None, reason="needs apt-get")
+@pytest.mark.parametrize("name", sorted(SCENARIOS))
+def test_scenarios_match_real_apt(tmp_path, name):
+    apt_tree(str(tmp_path), **SCENARIOS[name])
+    assert real_apt_upgrade(str(tmp_path)) == EXPECTED[name]
+
+
+def test_phase_draw():
+    assert phase_draw("demo", "2.0-1", MACHINE_ID) == 48
+    assert phase_draw("libx", "2.0-1", MACHINE_ID) == 8
+    assert all(0 <= phase_draw("demo", f"2.0-{i}", MACHINE_ID) <= 100 for i in range(200))
+
+
+def test_security_list_is_reported(tmp_path):
+    result = apt_tree(str(tmp_path), **SCENARIOS["phasing"]).upgradable()
+    assert result["security"] == ["sec"]
+
+
+@pytest.mark.parametrize(
+    "preferences",
+    [
+        "Package: foo\nPin: release x=stable\nPin-Priority: 500\n",
+        "Package: foo\nPin: label Debian\nPin-Priority: 500\n",
+        "Package: *\nPin: version 1.0\nPin-Priority: 500\n",
+        "Package: foo\nPin: release a=stable\n",
+    ],
+)
+def test_preferences_it_cannot_evaluate_raise(tmp_path, preferences):
+    index = apt_tree(str(tmp_path), **dict(SCENARIOS["release-flags"], preferences=preferences))
+    with pytest.raises(ValueError):
+        index.upgradable()
@@ -0,0 +1,117 @@
+import os
+
+from agent.blockdev import BlockGraph, encryption_coverage, read_mounts
+
+
+def _write(path, text):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(text + "\n")
+
+
+def _disk(sys_root, name, dev, partitions=()):
+    base = os.path.join(sys_root, "block", name)
+    _write(os.path.join(base, "dev"), dev)
+    for part, part_dev in partitions:
+        _write(os.path.join(base, part, "dev"), part_dev)
+        _write(os.path.join(base, part, "partition"), part[-1])
+
+
+def _dm(sys_root, name, dev, dm_name, uuid, slaves):
+    base = os.path.join(sys_root, "block", name)
+    _write(os.path.join(base, "dev"), dev)
+    _write(os.path.join(base, "dm", "name"), dm_name)
+    _write(os.path.join(base, "dm", "uuid"), uuid)
+    os.makedirs(os.path.join(base, "slaves"))
+    for slave in slaves:
+        os.makedirs(os.path.join(base, "slaves", slave))
+
+
+def _fake_host(tmp_path):
+    """sda2 -> LUKS (dm-0) -> LVM root and swap; sda3 -> plain LVM home; zram swap."""
+    sys_root = str(tmp_path / "sys")
+    proc_root = str(tmp_path / "proc")
+    _disk(sys_root, "sda", "8:0", [("sda1", "8:1"), ("sda2", "8:2"), ("sda3", "8:3")])
+    _dm(sys_root, "dm-0", "253:0", "luks-root", "CRYPT-LUKS2-0123456789abcdef-luks-root", ["sda2"])
+    _dm(sys_root, "dm-1", "253:1", "vg-root", "LVM-aaaa", ["dm-0"])
+    _dm(sys_root, "dm-2", "253:2", "vg-swap", "LVM-bbbb", ["dm-0"])
+    _dm(sys_root, "dm-3", "253:3", "vg2-home", "LVM-cccc", ["sda3"])
+    _disk(sys_root, "zram0", "252:0")
+    _write(os.path.join(proc_root, "self", "mountinfo"), "\n".join([
+        "22 1 253:1 / / rw,relatime shared:1 - ext4 /dev/mapper/vg-root rw",
+        "23 22 8:1 / /boot rw,relatime shared:2 - ext4 /dev/sda1 rw",
+        "24 22 253:3 / /home rw,relatime shared:3 - xfs /dev/mapper/vg2-home rw",
+        "25 24 0:45 / /home/my\\040files rw,nosuid shared:4 - tmpfs tmpfs rw",
+    ]))
+    _write(os.path.join(proc_root, "swaps"), "\n".join([
+        "Filename\t\t\t\tType\t\tSize\t\tUsed\t\tPriority",
+        "/dev/dm-2                               partition\t8388604\t\t0\t\t-2",
+        "/dev/zram0                              partition\t4194300\t\t0\t\t100",
+        "/swapfile                               file\t\t1048572\t\t0\t\t-3",
+    ]))
+    return sys_root, proc_root
+
+
+def test_from_sysfs_builds_device_graph(tmp_path):
+    sys_root, _ = _fake_host(tmp_path)
+    graph = BlockGraph.from_sysfs(sys_root)
+
+    assert set(graph.devices) == {"sda", "sda1", "sda2", "sda3", "dm-0", "dm-1", "dm-2", "dm-3", "zram0"}
+    assert graph.devices["sda2"]["parents"] == ["sda"]
+    assert graph.devices["sda2"]["partition"] is True
+    assert graph.devices["dm-1"]["parents"] == ["dm-0"]
+    assert graph.resolve(devno="253:1") == "dm-1"
+    assert graph.resolve(source="/dev/mapper/vg2-home") == "dm-3"
+    assert graph.resolve(source="/dev/sda1") == "sda1"
+    assert graph.resolve(devno="9:9", source="/dev/nope") is None
+
+
+def test_encryption_follows_device_mapper_parents(tmp_path):
+    sys_root, _ = _fake_host(tmp_path)
+    graph = BlockGraph.from_sysfs(sys_root)
+
+    assert graph.is_encrypted("dm-0")
+    assert graph.is_encrypted("dm-1")
+    assert graph.is_encrypted("dm-2")
+    assert not graph.is_encrypted("dm-3")
+    # The LUKS container partition itself holds ciphertext, not a plaintext filesystem
+    assert not graph.is_encrypted("sda2")
+    assert not graph.is_encrypted("sda")
+
+
+def test_encryption_survives_a_cycle():
+    graph = BlockGraph({
+        "dm-0": {"dev": "253:0", "dm_uuid": "LVM-a", "dm_name": "a", "parents": ["dm-1"]},
+        "dm-1": {"dev": "253:1", "dm_uuid": "LVM-b", "dm_name": "b", "parents": ["dm-0"]},
+    })
+    assert not graph.is_encrypted("dm-0")
+
+
+def test_read_mounts_unescapes_mountpoints(tmp_path):
+    _, proc_root = _fake_host(tmp_path)
+    mounts = read_mounts(proc_root)
+
+    assert [m["mountpoint"] for m in mounts] == ["/", "/boot", "/home", "/home/my files"]
+    assert mounts[0] == {"devno": "253:1", "mountpoint": "/", "fstype": "ext4", "source": "/dev/mapper/vg-root"}
+
+
+def test_encryption_coverage(tmp_path):
+    sys_root, proc_root = _fake_host(tmp_path)
+    coverage = encryption_coverage(sys_root, proc_root)
+
+    assert coverage["/"] == {"mountpoint": "/", "device": "dm-1", "fstype": "ext4", "encrypted": True}
+    assert coverage["/home"] == {"mountpoint": "/home", "device": "dm-3", "fstype": "xfs", "encrypted": False}
+    assert coverage["swap"] == [
+        {"path": "/dev/dm-2", "device": "dm-2", "encrypted": True},
+        {"path": "/dev/zram0", "device": "zram0", "encrypted": True, "volatile": True},
+        {"path": "/swapfile", "device": None, "encrypted": True},
+    ]
+
+
+def test_home_on_root_filesystem_is_not_reported_twice(tmp_path):
+    sys_root, proc_root = _fake_host(tmp_path)
+    _write(os.path.join(proc_root, "self", "mountinfo"), "22 1 253:1 / / rw - ext4 /dev/mapper/vg-root rw")
+    coverage = encryption_coverage(sys_root, proc_root)
+
+    assert "/home" not in coverage
+    assert coverage["/"]["encrypted"] is True
@@ -0,0 +1,150 @@
+import threading
+import time
+
+import pytest
+
+from agent import checks
+from agent.checks import CheckSpec, collect_all_checks
+
+# Trimmed `powercfg -q` output: "Sleep after" sits between two settings
+# whose index lines must not be picked up
+POWERCFG_EN = """\
+Power Scheme GUID: 381b4222-f694-41f0-9685-ff5bb260df2e  (Balanced)
+  Subgroup GUID: 238c9fa8-0aad-41ed-83f4-97be242c8f20  (Sleep)
+    GUID Alias: SUB_SLEEP
+    Power Setting GUID: 29f6c1db-86da-48c5-9fdb-f2b67b1f44da  (Sleep after)
+      GUID Alias: STANDBYIDLE
+      Minimum Possible Setting: 0x00000000
+      Maximum Possible Setting: 0xffffffff
+      Possible Settings increment: 0x00000001
+      Possible Settings units: Seconds
+    Current AC Power Setting Index: 0x00000708
+    Current DC Power Setting Index: 0x00000384
+
+    Power Setting GUID: 9d7815a6-7ee4-497e-8888-515a05f02364  (Hibernate after)
+      GUID Alias: HIBERNATEIDLE
+      Minimum Possible Setting: 0x00000000
+      Maximum Possible Setting: 0xffffffff
+      Possible Settings increment: 0x00000001
+      Possible Settings units: Seconds
+    Current AC Power Setting Index: 0x00002a30
+    Current DC Power Setting Index: 0x00002a30
+"""
+
+POWERCFG_DE = """\
+GUID des Energieschemas: 381b4222-f694-41f0-9685-ff5bb260df2e  (Ausbalanciert)
+  GUID der Untergruppe: 238c9fa8-0aad-41ed-83f4-97be242c8f20  (Energie sparen)
+    GUID-Alias: SUB_SLEEP
+    GUID der Energieeinstellung: 29f6c1db-86da-48c5-9fdb-f2b67b1f44da  (Energie sparen nach)
+      GUID-Alias: STANDBYIDLE
+      Minimaler möglicher Wert: 0x00000000
+      Maximaler möglicher Wert: 0xffffffff
+      Mögliche Einstellungen (Inkrement): 0x00000001
+      Mögliche Einstellungen (Einheiten): Sekunden
+    Index der aktuellen Wechselstromeinstellung: 0x00000258
+    Index der aktuellen Gleichstromeinstellung: 0x00000000
+"""
+
+
+def test_powercfg_indexes_reads_the_setting_block():
+    assert checks.powercfg_indexes(POWERCFG_EN, checks.STANDBYIDLE_GUID) == (1800, 900)
+    assert checks.powercfg_indexes(POWERCFG_EN, "9d7815a6-7ee4-497e-8888-515a05f02364") == (10800, 10800)
+
+
+def test_powercfg_indexes_localized_labels():
+    assert checks.powercfg_indexes(POWERCFG_DE, checks.STANDBYIDLE_GUID) == (600, 0)
+
+
+def test_powercfg_indexes_missing_setting():
+    assert checks.powercfg_indexes(POWERCFG_EN, "00000000-0000-0000-0000-000000000000") == (None, None)
+    assert checks.powercfg_indexes("", checks.STANDBYIDLE_GUID) == (None, None)
+
+
+@pytest.mark.parametrize("out,ok,summary", [
+    (POWERCFG_EN, False, "Sleep AC=30 DC=15 minutes"),
+    (POWERCFG_DE, False, "Sleep AC=10 DC=0 minutes"),  # 0 means never
+    (POWERCFG_DE.replace("0x00000000\n", "0x0000012c\n"), True, "Sleep AC=10 DC=5 minutes"),
+])
+def test_windows_sleep_policy(monkeypatch, out, ok, summary):
+    monkeypatch.setattr(checks, "run_cmd", lambda cmd, timeout=None: (0, out, ""))
+    result = checks.check_sleep_settings({"os_name": "Windows"})
+
+    assert result["ok"] is ok
+    assert result["summary"] == summary
+    assert result["data"]["sleep_ac_s"] is not None
+
+
+def test_windows_sleep_data_keeps_the_minute_fields(monkeypatch):
+    out = POWERCFG_DE.replace("0x00000000\n", "0x0000005a\n")  # DC 90 s
+    monkeypatch.setattr(checks, "run_cmd", lambda cmd, timeout=None: (0, out, ""))
+    result = checks.check_sleep_settings({"os_name": "Windows"})
+
+    assert result["data"] == {"sleep_ac": 10, "sleep_dc": 1.5, "policy": 10, "sleep_ac_s": 600, "sleep_dc_s": 90}
+    assert result["summary"] == "Sleep AC=10 DC=1.5 minutes"
+
+
+def _ok(summary):
+    return lambda facts: {"ok": True, "summary": summary, "data": {}, "status": "ok"}
+
+
+@pytest.fixture
+def release():
+    """Set at teardown so blocked fake checks do not outlive the test."""
+    event = threading.Event()
+    yield event
+    event.set()
+
+
+def test_collect_reports_stragglers_as_timed_out(monkeypatch, release):
+    def slow(facts):
+        release.wait(10)
+        return {"ok": True, "summary": "late", "data": {}, "status": "ok"}
+
+    def broken(facts):
+        raise RuntimeError("boom")
+
+    monkeypatch.setattr(checks, "CHECKS", {
+        "slow": CheckSpec(slow, interval=0, cost=5),
+        "fast": CheckSpec(_ok("fast"), interval=0, cost=1),
+        "broken": CheckSpec(broken, interval=0, cost=1),
+    })
+    start = time.monotonic()
+    result = collect_all_checks(deadline=0.3, max_workers=4)
+
+    assert time.monotonic() - start < 2
+    assert result["fast"]["summary"] == "fast"
+    assert checks.is_timed_out(result["slow"])
+    assert result["slow"]["status"] == "unknown"
+    assert result["broken"] == {"ok": None, "summary": "error: boom", "data": {}, "status": "unknown"}
+
+
+def test_collect_cancels_checks_that_never_started(monkeypatch, release):
+    started = []
+
+    def blocking(facts):
+        started.append("blocking")
+        release.wait(10)
+        return {"ok": True, "summary": "", "data": {}, "status": "ok"}
+
+    def queued(facts):
+        started.append("queued")
+        return {"ok": True, "summary": "", "data": {}, "status": "ok"}
+
+    # One worker, the costlier check starts first and holds it past the deadline
+    monkeypatch.setattr(checks, "CHECKS", {
+        "queued": CheckSpec(queued, interval=0, cost=1),
+        "blocking": CheckSpec(blocking, interval=0, cost=9),
+    })
+    result = collect_all_checks(deadline=0.2, max_workers=1)
+    release.set()
+    time.sleep(0.1)
+
+    assert started == ["blocking"]
+    assert checks.is_timed_out(result["queued"])
+    assert checks.is_timed_out(result["blocking"])
+
+
+def test_collect_runs_only_the_named_checks(monkeypatch):
+    monkeypatch.setattr(checks, "CHECKS", {"a": CheckSpec(_ok("a"), 0, 1), "b": CheckSpec(_ok("b"), 0, 1)})
+    assert list(collect_all_checks(names=["b", "gone"])) == ["b"]
+    assert collect_all_checks(names=[]) == {}
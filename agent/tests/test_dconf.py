@@ -0,0 +1,245 @@
+import os
+import struct
+
+import pytest
+
+from agent import dconf
+
+POWER = dconf.POWER_PATH
+# gschemas.compiled from glib-compile-schemas (GLib 2.74) over the .xml and
+# .override next to it; rerun `glib-compile-schemas .` there after editing them
+SCHEMA_DIR = os.path.join(os.path.dirname(__file__), "fixtures", "gschema")
+
+
+# Minimal GVDB writer (gvdb-format.h): a header, then one hash table per
+# table with a single bucket and no bloom filter, which is what dconf's
+# reader and ours both accept.
+
+def _gvdb_hash(key):
+    h = 5381
+    for c in key.encode():
+        h = (h * 33 + (c - 256 if c > 127 else c)) & 0xFFFFFFFF
+    return h
+
+
+def _align(buf, n):
+    buf.extend(b"\0" * (-len(buf) % n))
+
+
+def _table(buf, items, e):
+    """items: (key, parent index or None, type, bytes or nested items)."""
+    records = []
+    for key, parent, typ, value in items:
+        key_bytes = key.encode()
+        key_start = len(buf)
+        buf.extend(key_bytes)
+        if typ == "H":
+            value_start, value_end = _table(buf, value, e)
+        else:
+            _align(buf, 8)
+            value_start = len(buf)
+            buf.extend(value)
+            value_end = len(buf)
+        parent = 0xFFFFFFFF if parent is None else parent
+        records.append((_gvdb_hash(key), parent, key_start, len(key_bytes), typ, value_start, value_end))
+    _align(buf, 4)
+    start = len(buf)
+    buf.extend(struct.pack(e + "III", 0, 1, 0))  # no bloom words, one bucket starting at item 0
+    for h, parent, key_start, key_size, typ, value_start, value_end in records:
+        buf.extend(struct.pack(e + "IIIHccII", h, parent, key_start, key_size, typ.encode(), b"\0", value_start, value_end))
+    return start, len(buf)
+
+
+def gvdb(items, big_endian=False):
+    e = ">" if big_endian else "<"
+    buf = bytearray(24)
+    start, end = _table(buf, items, e)
+    buf[0:8] = b"raVGtnai" if big_endian else b"GVariant"
+    buf[8:24] = struct.pack(e + "IIII", 0, 0, start, end)
+    return bytes(buf)
+
+
+def v_int(n, big_endian=False):
+    return struct.pack(">i" if big_endian else "<i", n) + b"\0i"
+
+
+def v_str(s):
+    return s.encode() + b"\0\0s"
+
+
+def v_bool(b):
+    return bytes([b]) + b"\0b"
+
+
+def dconf_db(values, locks=(), big_endian=False):
+    """A dconf database: the power directory as a parent item, one child per key."""
+    items = [(POWER, None, "L", b"")]
+    for key, value in values.items():
+        items.append((key, 0, "v", value))
+    if locks:
+        items.append((".locks", None, "H", [(POWER + key, None, "v", v_bool(True)) for key in locks]))
+    return gvdb(items, big_endian)
+
+
+@pytest.mark.parametrize("big_endian", [False, True])
+def test_parse_gvdb_resolves_parents_and_nested_tables(big_endian):
+    data = dconf_db(
+        {
+            "sleep-inactive-ac-timeout": v_int(600, big_endian),
+            "sleep-inactive-ac-type": v_str("nothing"),
+            "idle-dim": v_bool(False),
+        },
+        locks=["sleep-inactive-ac-timeout"],
+        big_endian=big_endian,
+    )
+    table = dconf.parse_gvdb(data)
+
+    assert table.get_value(POWER + "sleep-inactive-ac-timeout") == 600
+    assert table.get_value(POWER + "sleep-inactive-ac-type") == "nothing"
+    assert table.get_value(POWER + "idle-dim") is False
+    assert table.get_value(POWER + "missing") is None
+    assert table.get_value(POWER) is None  # a directory, not a value
+    assert dconf._locks(table) == {POWER + "sleep-inactive-ac-timeout"}
+
+
+@pytest.mark.parametrize("data", [b"", b"GVariant" + b"\0" * 8, b"NotGVDB!" + b"\0" * 16])
+def test_parse_gvdb_rejects_garbage(data):
+    with pytest.raises(dconf.GvdbError):
+        dconf.parse_gvdb(data)
+
+
+def test_load_db_caches_by_mtime(tmp_path):
+    path = tmp_path / "user"
+    path.write_bytes(dconf_db({"sleep-inactive-ac-timeout": v_int(600)}))
+    first = dconf.load_db(str(path))
+    assert first is dconf.load_db(str(path))
+
+    path.write_bytes(dconf_db({"sleep-inactive-ac-timeout": v_int(60)}))
+    os.utime(path, ns=(1, 1))
+    second = dconf.load_db(str(path))
+    assert second is not first
+    assert second.get_value(POWER + "sleep-inactive-ac-timeout") == 60
+
+    path.write_bytes(b"corrupt")
+    assert dconf.load_db(str(path)) is None
+    assert dconf.load_db(str(tmp_path / "absent")) is None
+
+
+def test_read_key_honours_locks():
+    user = dconf.parse_gvdb(dconf_db({"sleep-inactive-ac-timeout": v_int(0)}))
+    site = dconf.parse_gvdb(dconf_db({"sleep-inactive-ac-timeout": v_int(900)}, locks=["sleep-inactive-ac-timeout"]))
+    unlocked = dconf.parse_gvdb(dconf_db({"sleep-inactive-ac-timeout": v_int(900)}))
+
+    key = POWER + "sleep-inactive-ac-timeout"
+    assert dconf.read_key(key, [user, unlocked]) == 0
+    assert dconf.read_key(key, [user, site]) == 900
+    assert dconf.read_key(key, [None, unlocked]) == 900
+    assert dconf.read_key(POWER + "idle-dim", [user, site]) is None
+
+
+def test_read_key_lowest_priority_lock_wins():
+    user = dconf.parse_gvdb(dconf_db({"sleep-inactive-ac-timeout": v_int(0)}))
+    local = dconf.parse_gvdb(dconf_db({"sleep-inactive-ac-timeout": v_int(600)}, locks=["sleep-inactive-ac-timeout"]))
+    site = dconf.parse_gvdb(dconf_db({"sleep-inactive-ac-timeout": v_int(1800)}, locks=["sleep-inactive-ac-timeout"]))
+    locked_only = dconf.parse_gvdb(dconf_db({}, locks=["sleep-inactive-ac-timeout"]))
+
+    key = POWER + "sleep-inactive-ac-timeout"
+    assert dconf.read_key(key, [user, local, site]) == 1800
+    assert dconf.read_key(key, [user, site, local]) == 600
+    # A lock without a value falls through to the schema default
+    assert dconf.read_key(key, [user, local, locked_only]) is None
+
+
+def test_gnome_power_settings_per_user(tmp_path):
+    db_dir = tmp_path / "db"
+    db_dir.mkdir()
+    (db_dir / "local").write_bytes(dconf_db(
+        {"sleep-inactive-ac-timeout": v_int(1800), "sleep-inactive-battery-type": v_str("hibernate")},
+        locks=["sleep-inactive-battery-type"],
+    ))
+    profile = tmp_path / "profile"
+    profile.write_text("user-db:user\nsystem-db:local\n")
+
+    alice = tmp_path / "home" / "alice"
+    (alice / ".config" / "dconf").mkdir(parents=True)
+    (alice / ".config" / "dconf" / "user").write_bytes(dconf_db(
+        {"sleep-inactive-ac-timeout": v_int(0), "sleep-inactive-battery-type": v_str("nothing")},
+    ))
+    bob = tmp_path / "home" / "bob"
+    bob.mkdir(parents=True)
+    passwd = tmp_path / "passwd"
+    passwd.write_text(
+        "root:x:0:0:root:/root:/bin/bash\n"
+        f"alice:x:1000:1000::{alice}:/bin/bash\n"
+        f"bob:x:1001:1001::{bob}:/bin/bash\n"
+    )
+
+    settings = dconf.gnome_power_settings(str(profile), str(db_dir), str(passwd), [SCHEMA_DIR])
+
+    assert list(settings) == ["alice"]  # bob has no dconf database
+    assert settings["alice"]["sleep-inactive-ac-timeout"] == 0
+    assert settings["alice"]["sleep-inactive-battery-type"] == "hibernate"  # locked by the site database
+    assert settings["alice"]["sleep-inactive-ac-type"] == "nothing"  # vendor override of the schema default
+
+    passwd.write_text(f"bob:x:1001:1001::{bob}:/bin/bash\n")
+    settings = dconf.gnome_power_settings(str(profile), str(db_dir), str(passwd), [SCHEMA_DIR])
+    assert list(settings) == ["(system)"]
+    assert settings["(system)"]["sleep-inactive-ac-timeout"] == 1800
+    assert settings["(system)"]["sleep-inactive-battery-timeout"] == 1800
+
+
+def test_power_defaults_come_from_the_compiled_schema(tmp_path):
+    defaults = dconf.power_defaults([str(tmp_path), SCHEMA_DIR])
+
+    assert defaults == {
+        "sleep-inactive-ac-timeout": 1200,
+        "sleep-inactive-battery-timeout": 1800,
+        "sleep-inactive-ac-type": "nothing",
+        "sleep-inactive-battery-type": "suspend",
+    }
+    assert dconf.schema_default(dconf.power_schema([SCHEMA_DIR]), "idle-dim") is True
+    assert dconf.gnome_installed(str(tmp_path / "db"), [SCHEMA_DIR])
+
+
+def test_power_defaults_without_a_schema(tmp_path):
+    assert dconf.power_defaults([str(tmp_path)]) == dconf.POWER_DEFAULTS
+    assert not dconf.gnome_installed(str(tmp_path / "db"), [str(tmp_path)])
+
+
+@pytest.mark.parametrize("value,expected", [
+    ("30", 30),
+    ("30min", 1800),
+    ("5min30s", 330),
+    ("5min 30s", 330),
+    ("1h30m", 5400),
+    ("1h 30min", 5400),
+    ("2.5h", 9000),
+    ("5 min", 300),
+    ("1d 2h", 93600),
+    ("1500ms", 1),
+    ("2 weeks", 1209600),
+    ("", None),
+    ("infinity", None),
+    ("5minx", None),
+    ("1.5.5s", None),
+])
+def test_parse_timespan(value, expected):
+    assert dconf.parse_timespan(value) == expected
+
+
+def test_logind_idle_applies_dropins_in_name_order(tmp_path):
+    conf = tmp_path / "logind.conf"
+    conf.write_text("[Login]\nIdleAction=suspend\nIdleActionSec=1h\n")
+    vendor = tmp_path / "lib"
+    local = tmp_path / "etc"
+    vendor.mkdir()
+    local.mkdir()
+    (vendor / "10-idle.conf").write_text("[Login]\nIdleActionSec=10min\n")
+    (vendor / "20-idle.conf").write_text("[Login]\nIdleActionSec=20min\n")
+    (local / "10-idle.conf").write_text("[Login]\nIdleActionSec=5min30s\n")
+
+    assert dconf.logind_idle(str(conf), [str(vendor)]) == {"idle_action": "suspend", "idle_action_s": 1200}
+    # /etc replaces the vendor 10-idle.conf, but 20-idle.conf still sorts after it
+    assert dconf.logind_idle(str(conf), [str(vendor), str(local)])["idle_action_s"] == 1200
+    (vendor / "20-idle.conf").unlink()
+    assert dconf.logind_idle(str(conf), [str(vendor), str(local)])["idle_action_s"] == 330
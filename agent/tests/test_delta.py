@@ -0,0 +1,115 @@
+from types import SimpleNamespace
+
+import pytest
+import requests
+
+import main
+from agent.transport import ResyncRequired, TransportClient, UploadResult
+
+PAYLOAD = {
+    "machine_id": "m1",
+    "hostname": "host",
+    "os": "Linux",
+    "timestamp": 1_700_000_000,
+    "checks": {"firewall": {"ok": True}, "antivirus": {"ok": False}, "sleep_policy": {"ok": True}},
+}
+
+
+def _state(base_checks, **extra):
+    state = {"server_delta": True, "acked_hash": "v1", "acked_payload": dict(PAYLOAD, checks=base_checks)}
+    state.update(extra)
+    return state
+
+
+def test_build_delta_sends_changed_and_removed_checks():
+    base = {"firewall": {"ok": True}, "antivirus": {"ok": True}, "disk_encryption": {"ok": True}}
+    delta = main.build_delta(PAYLOAD, "v2", _state(base))
+
+    assert delta["delta"] is True
+    assert (delta["base_version"], delta["version"]) == ("v1", "v2")
+    assert delta["checks"] == {"antivirus": {"ok": False}, "sleep_policy": {"ok": True}}
+    assert delta["removed"] == ["disk_encryption"]
+    assert delta["machine_id"] == "m1"
+    assert delta["timestamp"] == PAYLOAD["timestamp"]
+
+
+def test_build_delta_compares_results_by_value():
+    base = {"firewall": {"ok": True}, "antivirus": {"ok": False}, "sleep_policy": {"ok": True}}
+    delta = main.build_delta(PAYLOAD, "v2", _state(base))
+    assert delta["checks"] == {}
+    assert delta["removed"] == []
+
+
+def test_build_delta_needs_an_acked_base_and_server_support():
+    checks = PAYLOAD["checks"]
+    assert main.build_delta(PAYLOAD, "v2", {}) is None
+    assert main.build_delta(PAYLOAD, "v2", _state(checks, server_delta=False)) is None
+    assert main.build_delta(PAYLOAD, "v2", _state(checks, acked_hash=None)) is None
+    assert main.build_delta(PAYLOAD, "v2", _state(checks, acked_payload=None)) is None
+
+
+class FakeTransport:
+    def __init__(self, resync=False):
+        self.resync = resync
+        self.sent = []
+
+    def post_update(self, endpoint, api_key, payload, **kwargs):
+        self.sent.append(payload)
+        if payload.get("delta") and self.resync:
+            raise ResyncRequired("Version mismatch")
+        return UploadResult(body={"ok": True}, accept_encoding=[], raw_bytes=1, sent_bytes=1, encoding="identity")
+
+
+def _config(transport):
+    return SimpleNamespace(
+        endpoint="http://server/api/report",
+        api_key="key",
+        insecure=False,
+        compress_min_bytes=1024,
+        verbose=False,
+        transport=lambda: transport,
+    )
+
+
+def test_send_report_sends_a_delta_when_it_can():
+    transport = FakeTransport()
+    main.send_report(_config(transport), PAYLOAD, "v2", _state({"firewall": {"ok": True}}))
+    assert len(transport.sent) == 1
+    assert transport.sent[0]["delta"] is True
+
+
+def test_send_report_falls_back_to_the_full_report_on_resync():
+    transport = FakeTransport(resync=True)
+    result = main.send_report(_config(transport), PAYLOAD, "v2", _state({"firewall": {"ok": True}}))
+
+    assert result.body == {"ok": True}
+    assert [p.get("delta", False) for p in transport.sent] == [True, False]
+    full = transport.sent[1]
+    assert full["checks"] == PAYLOAD["checks"]
+    assert full["version"] == "v2"
+    assert "base_version" not in full
+
+
+def test_send_report_without_a_base_sends_the_full_report():
+    transport = FakeTransport()
+    main.send_report(_config(transport), PAYLOAD, "v2", {})
+    assert transport.sent == [dict(PAYLOAD, version="v2")]
+
+
+def _response(status, body):
+    resp = requests.Response()
+    resp.status_code = status
+    resp._content = body.encode()
+    return resp
+
+
+@pytest.mark.parametrize("payload,raises", [({"delta": True}, True), ({"checks": {}}, False)])
+def test_post_update_turns_409_on_a_delta_into_resync(monkeypatch, payload, raises):
+    client = TransportClient(max_retries=0)
+    monkeypatch.setattr(client.session, "post", lambda *a, **kw: _response(409, '{"resync": true}'))
+    if raises:
+        with pytest.raises(ResyncRequired):
+            client.post_update("http://server/api/report", "key", payload)
+    else:
+        with pytest.raises(requests.HTTPError):
+            client.post_update("http://server/api/report", "key", payload)
@@ -0,0 +1,98 @@
+import os
+import threading
+
+import pytest
+
+from agent import facts
+from agent.facts import FactProvider, Facts
+
+
+@pytest.fixture
+def provider(monkeypatch):
+    """Registers fact providers for one test; returns how often each ran."""
+    monkeypatch.setattr(facts, "_STABLE", {})
+    calls = {}
+
+    def register(name, stable=False, paths=(), value=None):
+        def func(_):
+            calls[name] = calls.get(name, 0) + 1
+            return value(calls[name]) if callable(value) else value
+
+        monkeypatch.setitem(facts.PROVIDERS, name, FactProvider(func, stable, paths))
+
+    return register, calls
+
+
+def test_a_fact_is_computed_once_per_cycle(provider):
+    register, calls = provider
+    register("sample", value=lambda n: n)
+    cycle = Facts()
+    assert cycle.get("sample") == 1
+    assert cycle.get("sample") == 1
+    assert Facts().get("sample") == 2
+
+
+def test_concurrent_readers_share_one_computation(provider):
+    register, calls = provider
+    gate = threading.Event()
+
+    def slow(n):
+        gate.wait(5)
+        return n
+
+    register("sample", value=slow)
+    cycle = Facts()
+    seen = []
+    threads = [threading.Thread(target=lambda: seen.append(cycle.get("sample"))) for _ in range(4)]
+    for t in threads:
+        t.start()
+    gate.set()
+    for t in threads:
+        t.join(5)
+    assert seen == [1, 1, 1, 1]
+    assert calls["sample"] == 1
+
+
+def test_stable_fact_is_kept_until_its_path_changes(provider, tmp_path):
+    register, calls = provider
+    conf = tmp_path / "release"
+    conf.write_text("one")
+    register("release", stable=True, paths=(str(conf),), value=lambda n: n)
+
+    assert Facts().get("release") == 1
+    assert Facts().get("release") == 1
+
+    conf.write_text("two!")
+    os.utime(conf, ns=(1, 1))
+    assert Facts().get("release") == 2
+    assert Facts().get("release") == 2
+
+    conf.unlink()
+    assert Facts().get("release") == 3
+    conf.write_text("one")
+    assert Facts().get("release") == 4
+
+
+def test_stable_paths_may_be_computed(provider, tmp_path):
+    register, calls = provider
+    dirs = [str(tmp_path / "a")]
+    os.mkdir(dirs[0])
+    register("tools", stable=True, paths=lambda: tuple(dirs), value=lambda n: n)
+
+    assert Facts().get("tools") == 1
+    assert Facts().get("tools") == 1
+    dirs.append(str(tmp_path))
+    assert Facts().get("tools") == 2
+
+
+def test_view_only_allows_declared_facts(provider):
+    register, _ = provider
+    register("declared", value="yes")
+    register("other", value="no")
+    view = Facts().view(["declared"], "sample_check")
+
+    assert view.get("declared") == "yes"
+    with pytest.raises(KeyError, match="sample_check did not declare fact 'other'"):
+        view.get("other")
+    with pytest.raises(KeyError, match="unknown facts: missing"):
+        Facts().view(["declared", "missing"], "sample_check")
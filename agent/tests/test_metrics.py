@@ -0,0 +1,41 @@
+import threading
+
+from agent.metrics import CheckStats
+
+
+def test_check_stats_records_each_check_once_per_cycle():
+    stats = CheckStats()
+
+    def check():
+        stats.add_command(0.25)
+        stats.add_command(0.25)
+        return "done"
+
+    assert stats.run("firewall", check) == "done"
+    stats.add_command(1.0)  # outside a check: not attributed
+    snap = stats.snapshot(reset=True)
+    assert list(snap) == ["firewall"]
+    assert (snap["firewall"]["processes"], snap["firewall"]["cmd_ms"]) == (2, 500.0)
+    assert stats.snapshot() == {}
+
+
+def test_a_check_finishing_after_its_cycle_is_dropped():
+    stats = CheckStats()
+    started, release = threading.Event(), threading.Event()
+
+    def slow():
+        started.set()
+        release.wait(5)
+
+    # Cycle 1 abandons the straggler at its deadline
+    straggler = threading.Thread(target=stats.run, args=("os_updates", slow))
+    straggler.start()
+    started.wait(5)
+    stats.run("firewall", lambda: None)
+    assert list(stats.snapshot(reset=True)) == ["firewall"]
+
+    # It returns while cycle 2 runs, and must not show up in cycle 2's numbers
+    stats.run("antivirus", lambda: None)
+    release.set()
+    straggler.join()
+    assert list(stats.snapshot(reset=True)) == ["antivirus"]
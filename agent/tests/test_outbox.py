@@ -0,0 +1,132 @@
+import json
+import os
+
+from agent.outbox import META_FILENAME, SEGMENT_FILENAME, Outbox, _decode
+
+NOW = 1_700_000_000
+
+
+def _fill(box, n, now=NOW):
+    return [box.append({"checks": {"n": i}}, f"v{i}", now=now + i) for i in range(n)]
+
+
+def _segment_lines(path):
+    with open(path / SEGMENT_FILENAME, "rb") as f:
+        return f.readlines()
+
+
+def test_records_survive_reopen(tmp_path):
+    box = Outbox(str(tmp_path))
+    assert _fill(box, 3) == [1, 2, 3]
+    box.ack(1)
+
+    again = Outbox(str(tmp_path))
+    assert again.instance == box.instance
+    assert [r["seq"] for r in again.pending()] == [2, 3]
+    assert [r["seq"] for r in again.pending(1)] == [2]
+    assert again.append({}, "v", now=NOW) == 4
+
+
+def test_torn_tail_is_cut_off(tmp_path):
+    box = Outbox(str(tmp_path))
+    _fill(box, 2)
+    with open(tmp_path / SEGMENT_FILENAME, "ab") as f:
+        f.write(b'0000abcd {"seq": 3, "ts"')
+
+    again = Outbox(str(tmp_path))
+    assert [r["seq"] for r in again.pending()] == [1, 2]
+    assert all(_decode(line) for line in _segment_lines(tmp_path))
+    assert again.append({}, "v", now=NOW) == 3
+
+
+def test_crc_mismatch_ends_the_segment(tmp_path):
+    box = Outbox(str(tmp_path))
+    _fill(box, 3)
+    lines = _segment_lines(tmp_path)
+    lines[2] = lines[2].replace(b'"v2"', b'"v9"')
+    with open(tmp_path / SEGMENT_FILENAME, "wb") as f:
+        f.writelines(lines)
+
+    again = Outbox(str(tmp_path))
+    assert [r["seq"] for r in again.pending()] == [1, 2]
+    assert len(_segment_lines(tmp_path)) == 2
+
+
+def test_lost_metadata_resends_under_the_same_instance(tmp_path):
+    box = Outbox(str(tmp_path))
+    _fill(box, 3)
+    box.ack(1)
+    (tmp_path / META_FILENAME).write_text("{trunc")
+
+    # Everything still in the segment goes out again with its old seq and
+    # instance, so the server answers the ones it has as duplicates
+    again = Outbox(str(tmp_path))
+    assert again.instance == box.instance
+    assert [r["seq"] for r in again.pending()] == [1, 2, 3]
+    assert again.append({}, "v", now=NOW) == 4
+
+    (tmp_path / META_FILENAME).unlink()
+    assert Outbox(str(tmp_path)).instance == box.instance
+
+
+def test_lost_metadata_with_nothing_queued_starts_a_new_instance(tmp_path):
+    box = Outbox(str(tmp_path))
+    _fill(box, 2)
+    box.ack(2)
+    (tmp_path / META_FILENAME).unlink()
+
+    again = Outbox(str(tmp_path))
+    assert again.instance != box.instance
+    assert again.append({}, "v", now=NOW) == 1
+
+
+def test_size_cap_drops_oldest(tmp_path):
+    box = Outbox(str(tmp_path))
+    _fill(box, 1)
+    size = os.path.getsize(tmp_path / SEGMENT_FILENAME)
+    box = Outbox(str(tmp_path), max_bytes=int(size * 3.5))
+    _fill(box, 9, now=NOW + 1)
+
+    assert [r["seq"] for r in box.pending()] == [8, 9, 10]
+    assert box.meta["dropped"] == 7
+    # Dropped records are cleared from disk as they pile up, not on every append
+    assert os.path.getsize(tmp_path / SEGMENT_FILENAME) <= 2 * int(size * 3.5)
+    assert [r["seq"] for r in Outbox(str(tmp_path)).pending()] == [8, 9, 10]
+
+
+def test_age_cap_drops_expired(tmp_path):
+    box = Outbox(str(tmp_path), max_age=3600)
+    box.append({}, "a", now=NOW)
+    box.append({}, "b", now=NOW + 60)
+    box.append({}, "c", now=NOW + 3650)
+
+    assert [r["version"] for r in box.pending()] == ["b", "c"]
+    assert box.meta["dropped"] == 1
+
+
+def test_ack_compacts_once_everything_is_delivered(tmp_path):
+    box = Outbox(str(tmp_path))
+    _fill(box, 4)
+    box.ack(1)
+    assert len(_segment_lines(tmp_path)) == 4
+    box.ack(3)
+    assert [_decode(line)["seq"] for line in _segment_lines(tmp_path)] == [4]
+    box.ack(4)
+    assert os.path.getsize(tmp_path / SEGMENT_FILENAME) == 0
+    assert len(box) == 0
+    assert box.append({}, "v", now=NOW) == 5
+
+
+def test_reject_dead_letters_and_moves_on(tmp_path):
+    box = Outbox(str(tmp_path))
+    _fill(box, 2)
+    box.reject(box.pending()[0], 422, "Missing fields", now=NOW)
+
+    assert [r["seq"] for r in box.pending()] == [2]
+    assert box.meta["rejected"] == 1
+    with open(box.rejected_path, "rb") as f:
+        dead = [_decode(line) for line in f]
+    assert len(dead) == 1
+    assert dead[0]["seq"] == 1
+    assert (dead[0]["status"], dead[0]["error"], dead[0]["rejected_at"]) == (422, "Missing fields", NOW)
+    assert json.loads((tmp_path / META_FILENAME).read_text())["acked"] == 1
@@ -0,0 +1,108 @@
+import cProfile
+import os
+import pstats
+import threading
+import time
+
+from agent.profiling import CycleProfiler, StackSampler, collapsed_from_stats
+
+
+def test_collapsed_lists_stacks_most_common_first():
+    sampler = StackSampler()
+    sampler.samples["MainThread;main (main.py:1)"] += 2
+    sampler.samples["MainThread;main (main.py:1);run_cmd (utils.py:9)"] += 5
+    assert sampler.collapsed() == (
+        "MainThread;main (main.py:1);run_cmd (utils.py:9) 5\n"
+        "MainThread;main (main.py:1) 2\n"
+    )
+    assert StackSampler().collapsed() == ""
+
+
+def parked_in_wait(event):
+    event.wait()
+
+
+def test_sampler_sees_other_threads_where_they_block():
+    release = threading.Event()
+    worker = threading.Thread(target=parked_in_wait, args=(release,), name="check-worker")
+    worker.start()
+    sampler = StackSampler(interval=0.001)
+    sampler.start()
+    time.sleep(0.05)
+    sampler.stop()
+    release.set()
+    worker.join()
+
+    stacks = [line.rsplit(" ", 1)[0] for line in sampler.collapsed().splitlines()]
+    assert any(s.startswith("check-worker;") and "parked_in_wait (test_profiling.py:" in s for s in stacks)
+    assert not any(s.startswith("cm-profiler;") for s in stacks)
+    assert "samples every 1 ms" in sampler.summary()
+
+
+def leaf():
+    time.sleep(0.02)
+
+
+def branch():
+    leaf()
+    leaf()
+
+
+LEAF = f"leaf (test_profiling.py:{leaf.__code__.co_firstlineno})"
+BRANCH = f"branch (test_profiling.py:{branch.__code__.co_firstlineno})"
+
+
+def test_collapsed_from_stats_splits_time_along_call_edges():
+    profile = cProfile.Profile()
+    profile.runcall(branch)
+    folded = {}
+    for line in collapsed_from_stats(pstats.Stats(profile)).splitlines():
+        stack, us = line.rsplit(" ", 1)
+        folded[stack] = int(us)
+
+    sleeps = [s for s in folded if s.endswith(f"{LEAF};<built-in method time.sleep>")]
+    assert len(sleeps) == 1
+    assert sleeps[0].startswith(f"{BRANCH};")
+    assert folded[sleeps[0]] >= 35_000  # two 20 ms sleeps, in microseconds
+
+
+def test_recursion_is_cut_at_the_first_repeat():
+    def countdown(n):
+        return countdown(n - 1) if n else 0
+
+    profile = cProfile.Profile()
+    profile.runcall(countdown, 5)
+    stacks = [line.rsplit(" ", 1)[0] for line in collapsed_from_stats(pstats.Stats(profile)).splitlines()]
+    assert all(s.count("countdown (") <= 1 for s in stacks)
+
+
+def test_cprofile_cycles_write_folded_stacks(tmp_path):
+    profiler = CycleProfiler("cprofile", str(tmp_path))
+    assert profiler.run(branch) is None
+    suffixes = sorted(os.path.splitext(name)[1] for name in os.listdir(tmp_path))
+    assert suffixes == [".folded", ".pstats", ".txt"]
+    folded = next(tmp_path.glob("*.folded")).read_text()
+    assert LEAF in folded
+
+
+def _cycle(directory, name, size, mtime, suffixes=(".folded", ".txt")):
+    for suffix in suffixes:
+        path = directory / f"cycle-{name}{suffix}"
+        path.write_bytes(b"x" * size)
+        os.utime(path, (mtime, mtime))
+
+
+def test_rotate_drops_whole_cycles_oldest_first(tmp_path):
+    now = time.time()
+    _cycle(tmp_path, "a", 100, now - 30)
+    _cycle(tmp_path, "b", 100, now - 20)
+    _cycle(tmp_path, "c", 100, now - 10)
+    (tmp_path / "notes.txt").write_bytes(b"x" * 1000)  # not a profile, never counted or removed
+
+    CycleProfiler("sample", str(tmp_path), max_bytes=450).rotate()
+    assert sorted(os.listdir(tmp_path)) == [
+        "cycle-b.folded", "cycle-b.txt", "cycle-c.folded", "cycle-c.txt", "notes.txt",
+    ]
+
+    CycleProfiler("sample", str(tmp_path), max_bytes=0).rotate()
+    assert os.listdir(tmp_path) == ["notes.txt"]
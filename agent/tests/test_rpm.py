@@ -0,0 +1,172 @@
+import os
+import sqlite3
+import struct
+import time
+
+import pytest
+
+from agent.rpm import RpmIndex, compare_evr, rpmvercmp
+
+
+# From rpm's own test suite (tests/rpmvercmp.at)
+RPM_PAIRS = [
+    ("1.0", "1.0", 0),
+    ("1.0", "2.0", -1),
+    ("2.0.1", "2.0", 1),
+    ("2.0.1a", "2.0.1", 1),
+    ("5.5p1", "5.5p2", -1),
+    ("5.5p1", "5.5p10", -1),
+    ("10xyz", "10.1xyz", -1),
+    ("xyz10", "xyz10.1", -1),
+    ("xyz.4", "8", -1),
+    ("xyz.4", "2", -1),
+    ("5.5p2", "5.6p1", -1),
+    ("6.0.rc1", "6.0", 1),
+    ("10b2", "10a1", 1),
+    ("10a2", "10b2", -1),
+    ("1.0a", "1.0aa", -1),
+    ("10.0001", "10.1", 0),
+    ("10.0001", "10.0039", -1),
+    ("4.999.9", "5.0", -1),
+    ("20101121", "20101122", -1),
+    ("2_0", "2.0", 0),
+    ("a+", "a_", 0),
+    ("+a", "_a", 0),
+    ("_+", "+_", 0),
+    ("+", "_", 0),
+    ("1.0~rc1", "1.0", -1),
+    ("1.0~rc1", "1.0~rc2", -1),
+    ("1.0~rc1~git123", "1.0~rc1", -1),
+    ("1.0^", "1.0", 1),
+    ("1.0^git1", "1.0", 1),
+    ("1.0^git1", "1.0^git2", -1),
+    ("1.0^git1", "1.01", -1),
+    ("1.0^20160101", "1.0.1", -1),
+    ("1.0^20160102", "1.0^20160101^git1", 1),
+    ("1.0~rc1^git1", "1.0~rc1", 1),
+    ("1.0^git1", "1.0^git1~pre", 1),
+    ("1b.fc17", "1.fc17", -1),
+    ("1g.fc17", "1.fc17", 1),
+]
+
+
+@pytest.mark.parametrize("a,b,expected", RPM_PAIRS)
+def test_rpmvercmp_matches_rpm(a, b, expected):
+    assert rpmvercmp(a, b) == expected
+    assert rpmvercmp(b, a) == -expected
+
+
+def test_compare_evr_orders_epoch_then_version_then_release():
+    assert compare_evr((1, "1.0", "1"), (0, "9.9", "9")) == 1
+    assert compare_evr((0, "1.0", "2.el9"), (0, "1.0", "10.el9")) == -1
+    assert compare_evr((0, "1.10", "1"), (0, "1.9", "1")) == 1
+    assert compare_evr((0, "1.0", "1.el9"), (0, "1.0", "1.el9")) == 0
+
+
+def _header(name, version, release, arch):
+    """A minimal rpm header blob carrying just the tags the index reads."""
+    entries, data = b"", b""
+    for tag, value in ((1000, name), (1001, version), (1002, release), (1022, arch)):
+        entries += struct.pack(">iiii", tag, 6, len(data), 1)
+        data += value.encode() + b"\0"
+    return struct.pack(">ii", len(entries) // 16, len(data)) + entries + data
+
+
+def _primary(packages):
+    body = "".join(
+        f'<package type="rpm"><name>{n}</name><arch>{a}</arch><version epoch="0" ver="{v}" rel="{r}"/></package>'
+        for n, v, r, a in packages
+    )
+    return f'<metadata xmlns="http://linux.duke.edu/metadata/common">{body}</metadata>'
+
+
+class Host:
+    """An rpmdb, dnf cache and /etc/yum.repos.d under tmp_path."""
+
+    def __init__(self, root):
+        self.root = root
+        (root / "etc" / "yum.repos.d").mkdir(parents=True)
+        (root / "cache").mkdir()
+
+    def installed(self, *packages):
+        conn = sqlite3.connect(self.root / "rpmdb.sqlite")
+        conn.execute("CREATE TABLE Packages (hnum INTEGER PRIMARY KEY, blob BLOB)")
+        conn.executemany("INSERT INTO Packages (blob) VALUES (?)", [(_header(*p),) for p in packages])
+        conn.commit()
+        conn.close()
+
+    def cache(self, dirname, *packages, mtime=None):
+        repodata = self.root / "cache" / dirname / "repodata"
+        repodata.mkdir(parents=True)
+        (repodata / "primary.xml").write_text(_primary(packages))
+        (repodata / "repomd.xml").write_text("<repomd/>")
+        if mtime is not None:
+            os.utime(repodata / "repomd.xml", (mtime, mtime))
+        return repodata
+
+    def repo_file(self, text, name="test.repo"):
+        (self.root / "etc" / "yum.repos.d" / name).write_text(text)
+
+    def index(self):
+        return RpmIndex(
+            rpmdb_paths=[str(self.root / "rpmdb.sqlite")],
+            cache_globs=[str(self.root / "cache" / "*" / "repodata")],
+            main_confs=[str(self.root / "etc" / "dnf.conf")],
+            repo_conf_dirs=[str(self.root / "etc" / "yum.repos.d")],
+            versionlock_lists=[str(self.root / "etc" / "versionlock.list")],
+        )
+
+
+@pytest.fixture
+def host(tmp_path):
+    h = Host(tmp_path)
+    h.installed(("bash", "5.1", "1.el9", "x86_64"), ("kernel", "5.14", "1.el9", "x86_64"), ("tzdata", "2024a", "1.el9", "noarch"))
+    h.cache("baseos-0123456789abcdef", ("bash", "5.2", "1.el9", "x86_64"), ("kernel", "5.14", "2.el9", "x86_64"))
+    h.cache("testing-fedcba9876543210", ("tzdata", "2025a", "1.el9", "noarch"))
+    return h
+
+
+def test_only_enabled_repos_count(host):
+    host.repo_file("[baseos]\nname=BaseOS\n\n[testing]\nname=Testing\nenabled=0\n")
+    result = host.index().upgradable()
+    assert result["upgradable"] == ["bash", "kernel"]
+    assert result["repos"] == 1
+
+
+def test_cached_repos_that_are_no_longer_configured_are_ignored(host):
+    host.repo_file("[testing]\nenabled=1\n")
+    assert host.index().upgradable()["upgradable"] == ["tzdata"]
+
+
+def test_repo_and_global_excludes_hide_candidates(host):
+    host.repo_file("[baseos]\nexclude=kernel*\n\n[testing]\n")
+    assert host.index().upgradable()["upgradable"] == ["bash", "tzdata"]
+
+    (host.root / "etc" / "dnf.conf").write_text("[main]\nexcludepkgs=bash.x86_64, tzdata-2025a\n")
+    assert host.index().upgradable()["upgradable"] == []
+
+
+def test_includepkgs_limits_a_repo(host):
+    host.repo_file("[baseos]\nincludepkgs=bash\n")
+    assert host.index().upgradable()["upgradable"] == ["bash"]
+
+
+def test_newest_cache_directory_wins_for_a_repo(host):
+    host.cache("baseos-aaaaaaaaaaaaaaaa", ("bash", "5.1", "1.el9", "x86_64"), mtime=time.time() + 60)
+    host.repo_file("[baseos]\n")
+    assert host.index().upgradable()["upgradable"] == []
+
+
+@pytest.mark.parametrize(
+    "setup",
+    [
+        lambda h: None,  # no repo files at all
+        lambda h: h.repo_file("[baseos]\n\n[updates]\n"),  # enabled but never cached
+        lambda h: h.repo_file("[baseos]\nname\n"),  # dnf refuses to load this too
+        lambda h: (h.repo_file("[baseos]\n"), (h.root / "etc" / "versionlock.list").write_text("bash-0:5.1-1.el9.*\n")),
+        lambda h: (h.repo_file("[baseos]\n"), (h.root / "cache" / "baseos-0123456789abcdef" / "repodata" / "modules.yaml.gz").write_bytes(b"")),
+    ],
+)
+def test_setups_it_cannot_model_fall_back(host, setup):
+    setup(host)
+    assert host.index().upgradable() is None
@@ -0,0 +1,88 @@
+import pytest
+
+from agent import checks, scheduler
+from agent.checks import CheckSpec
+
+NOW = 1_700_000_000
+
+
+@pytest.fixture
+def fake_checks(monkeypatch):
+    """Two fake checks whose next results are set by the test."""
+    results = {"hourly": {"ok": True}, "always": {"ok": True}}
+    runs = []
+
+    def make(name):
+        def check(facts):
+            runs.append(name)
+            return dict(results[name], summary=name, data={})
+        return check
+
+    specs = {"hourly": CheckSpec(make("hourly"), interval=60, cost=1), "always": CheckSpec(make("always"), interval=0, cost=1)}
+    monkeypatch.setattr(checks, "CHECKS", specs)
+    monkeypatch.setattr(scheduler, "CHECKS", specs)
+    return results, runs
+
+
+def test_check_intervals_apply_overrides(fake_checks):
+    assert scheduler.check_intervals() == {"hourly": 60, "always": 0}
+    assert scheduler.check_intervals({"hourly": 5, "always": None, "gone": 1}) == {"hourly": 5, "always": 0}
+    assert scheduler.check_intervals({"hourly": -3})["hourly"] == 0
+
+
+def test_due_checks(fake_checks):
+    intervals = scheduler.check_intervals()
+    cache = {"hourly": {"ts": NOW, "result": {}}, "always": {"ts": NOW, "result": {}}}
+
+    assert scheduler.due_checks({}, NOW, intervals) == ["hourly", "always"]
+    assert scheduler.due_checks(cache, NOW + 60, intervals) == ["always"]
+    assert scheduler.due_checks(cache, NOW + 3600, intervals) == ["hourly", "always"]
+    assert scheduler.due_checks({"hourly": {"ts": NOW}}, NOW, intervals) == ["hourly", "always"]
+
+
+def test_collect_due_checks_serves_fresh_results_from_the_cache(fake_checks):
+    results, runs = fake_checks
+    intervals = scheduler.check_intervals()
+    cache = {}
+
+    first = scheduler.collect_due_checks(cache, NOW, intervals)
+    assert runs == ["hourly", "always"]
+    assert cache["hourly"] == {"ts": NOW, "result": first["hourly"]}
+
+    runs.clear()
+    results["hourly"] = {"ok": False}
+    again = scheduler.collect_due_checks(cache, NOW + 600, intervals)
+    assert runs == ["always"]
+    assert again["hourly"]["ok"] is True  # still the cached result
+    assert list(again) == ["hourly", "always"]
+
+    runs.clear()
+    forced = scheduler.collect_due_checks(cache, NOW + 700, intervals, force=True)
+    assert sorted(runs) == ["always", "hourly"]
+    assert forced["hourly"]["ok"] is False
+
+
+def test_unknown_results_are_reported_but_not_cached(fake_checks):
+    results, runs = fake_checks
+    intervals = scheduler.check_intervals()
+    cache = {}
+    scheduler.collect_due_checks(cache, NOW, intervals)
+
+    results["hourly"] = {"ok": None}
+    out = scheduler.collect_due_checks(cache, NOW + 3600, intervals)
+    assert out["hourly"]["ok"] is None
+    assert "hourly" not in cache
+
+    # Retried on the next cycle instead of waiting out the interval
+    runs.clear()
+    results["hourly"] = {"ok": True}
+    out = scheduler.collect_due_checks(cache, NOW + 3660, intervals)
+    assert "hourly" in runs
+    assert cache["hourly"]["ts"] == NOW + 3660
+
+
+def test_cache_entries_for_removed_checks_are_dropped(fake_checks):
+    cache = {"retired": {"ts": NOW, "result": {"ok": True}}}
+    out = scheduler.collect_due_checks(cache, NOW, scheduler.check_intervals())
+    assert "retired" not in cache
+    assert "retired" not in out
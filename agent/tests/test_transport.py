@@ -0,0 +1,173 @@
+import gzip
+import os
+import time
+from email.utils import formatdate
+
+import pytest
+import requests
+
+from agent import transport
+from agent.transport import TransportClient, encode_body
+
+JSONISH = b'{"checks": {"ok": true}}' * 200
+
+
+def _response(status, body="{}", headers=None):
+    resp = requests.Response()
+    resp.status_code = status
+    resp._content = body.encode()
+    resp.headers.update(headers or {})
+    return resp
+
+
+def test_small_or_unnegotiated_bodies_go_uncompressed():
+    assert encode_body(JSONISH, None) == (JSONISH, "identity")
+    assert encode_body(JSONISH, []) == (JSONISH, "identity")
+    assert encode_body(JSONISH[:100], ["gzip"], min_bytes=1024) == (JSONISH[:100], "identity")
+    assert encode_body(JSONISH, ["gzip"], min_bytes=-1) == (JSONISH, "identity")
+    assert encode_body(JSONISH, ["br"]) == (JSONISH, "identity")
+
+
+def test_gzip_at_the_threshold():
+    data, encoding = encode_body(JSONISH[:1024], ["gzip", "deflate"], min_bytes=1024)
+    assert encoding == "gzip"
+    assert gzip.decompress(data) == JSONISH[:1024]
+
+
+def test_incompressible_body_is_sent_as_is():
+    noise = os.urandom(4096)
+    assert encode_body(noise, ["gzip"]) == (noise, "identity")
+
+
+def test_zstd_is_preferred_when_available(monkeypatch):
+    monkeypatch.setattr(transport, "_zstd_compress", lambda data: b"z" * 10)
+    assert encode_body(JSONISH, ["gzip", "zstd"]) == (b"z" * 10, "zstd")
+    assert encode_body(JSONISH, ["gzip"])[1] == "gzip"
+
+    # Without the zstandard module the next codec the server takes is used
+    monkeypatch.setattr(transport, "_zstd_compress", lambda data: None)
+    assert encode_body(JSONISH, ["zstd", "gzip"])[1] == "gzip"
+    assert encode_body(JSONISH, ["zstd"]) == (JSONISH, "identity")
+
+
+def test_zstd_round_trip():
+    zstandard = pytest.importorskip("zstandard")
+    data, encoding = encode_body(JSONISH, ["zstd"])
+    assert encoding == "zstd"
+    assert zstandard.ZstdDecompressor().decompress(data) == JSONISH
+
+
+def test_accept_encoding_header_is_parsed():
+    assert transport._parse_accept_encoding("zstd, gzip;q=0.8, identity, DEFLATE") == ["zstd", "gzip", "deflate"]
+    assert transport._parse_accept_encoding(None) == []
+
+
+def test_post_update_labels_the_body_and_reads_advertised_codecs(monkeypatch):
+    client = TransportClient(max_retries=0)
+    sent = []
+
+    def post(url, data, headers, timeout, verify):
+        sent.append((data, headers))
+        return _response(200, '{"ok": true}', {"Accept-Encoding": "gzip, deflate", "X-Report-Batch-Max": "500"})
+
+    monkeypatch.setattr(client.session, "post", post)
+    result = client.post_update("http://server/api/report", "key", {"blob": "x" * 4000}, accept_encoding=["gzip"])
+
+    data, headers = sent[0]
+    assert headers["Content-Encoding"] == "gzip"
+    assert gzip.decompress(data) == b'{"blob":"' + b"x" * 4000 + b'"}'
+    assert (result.encoding, result.raw_bytes, result.sent_bytes) == ("gzip", 4011, len(data))
+    assert result.accept_encoding == ["gzip", "deflate"]
+    assert result.batch_max == 500
+
+    client.post_update("http://server/api/report", "key", {"small": 1}, accept_encoding=["gzip"])
+    assert "Content-Encoding" not in sent[1][1]
+
+
+class Scripted:
+    """Stands in for session.post: answers from a list, records each call."""
+
+    def __init__(self, *answers):
+        self.answers = list(answers)
+        self.calls = 0
+
+    def __call__(self, url, data, headers, timeout, verify):
+        self.calls += 1
+        answer = self.answers.pop(0)
+        if isinstance(answer, Exception):
+            raise answer
+        return answer
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    delays = []
+    monkeypatch.setattr(transport.time, "sleep", delays.append)
+    # Full jitter at its upper bound, so the backoff schedule is visible
+    monkeypatch.setattr(transport.random, "uniform", lambda low, high: high)
+    return delays
+
+
+def _client(monkeypatch, session_post, **kwargs):
+    client = TransportClient(**kwargs)
+    monkeypatch.setattr(client.session, "post", session_post)
+    return client
+
+
+def test_retry_after_is_honoured_and_capped(monkeypatch, sleeps):
+    post = Scripted(
+        _response(503, headers={"Retry-After": "7"}),
+        _response(429, headers={"Retry-After": "600"}),
+        _response(200),
+    )
+    resp = _client(monkeypatch, post, backoff_max=60).post("http://server", b"{}", {})
+
+    assert resp.status_code == 200
+    assert sleeps == [7.0, 60]
+
+
+def test_server_errors_back_off_exponentially(monkeypatch, sleeps):
+    post = Scripted(_response(500), _response(502), _response(503), _response(504))
+    client = _client(monkeypatch, post, max_retries=3, backoff_base=1.0, backoff_max=3.0)
+    resp = client.post("http://server", b"{}", {})
+
+    # The last answer is returned once retries run out
+    assert resp.status_code == 504
+    assert sleeps == [1.0, 2.0, 3.0]
+    assert [(a["attempt"], a["status"]) for a in client.take_attempts()] == [(0, 500), (1, 502), (2, 503), (3, 504)]
+    assert client.take_attempts() == []
+
+
+def test_client_errors_are_not_retried(monkeypatch, sleeps):
+    post = Scripted(_response(400), _response(200))
+    assert _client(monkeypatch, post).post("http://server", b"{}", {}).status_code == 400
+    assert post.calls == 1
+    assert sleeps == []
+
+
+def test_network_errors_are_retried_then_raised(monkeypatch, sleeps):
+    post = Scripted(requests.ConnectionError("refused"), requests.Timeout("slow"), _response(200))
+    client = _client(monkeypatch, post, max_retries=2)
+    assert client.post("http://server", b"{}", {}).status_code == 200
+    assert [a.get("error") for a in client.take_attempts()] == ["ConnectionError", "Timeout", None]
+
+    post = Scripted(requests.ConnectionError("refused"), requests.ConnectionError("refused"))
+    with pytest.raises(requests.ConnectionError):
+        _client(monkeypatch, post, max_retries=1).post("http://server", b"{}", {})
+
+
+def test_retry_after_seconds():
+    assert transport.retry_after_seconds("120") == 120.0
+    assert transport.retry_after_seconds(" 1.5 ") == 1.5
+    assert transport.retry_after_seconds("-5") == 0.0
+    assert transport.retry_after_seconds("Wed, 21 Oct 2015 07:28:00 GMT") == 0.0
+    assert 3590 < transport.retry_after_seconds(formatdate(time.time() + 3600, usegmt=True)) <= 3600
+    assert transport.retry_after_seconds("soon") is None
+    assert transport.retry_after_seconds(None) is None
+
+
+def test_which_failures_keep_a_report_queued():
+    assert transport.rejects_report(400)
+    assert transport.rejects_report(422)
+    for status in (None, 401, 403, 404, 408, 429, 500, 503):
+        assert not transport.rejects_report(status)
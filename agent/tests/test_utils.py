@@ -0,0 +1,107 @@
+import os
+import sys
+import time
+
+import pytest
+
+from agent.utils import CMD_STATS, run_cmd
+
+posix = pytest.mark.skipif(os.name == "nt", reason="uses sh and process groups")
+
+
+def _gone(pid, wait=2.0):
+    """True once pid has exited (a zombie waiting for init counts as exited)."""
+    deadline = time.monotonic() + wait
+    while time.monotonic() < deadline:
+        try:
+            with open(f"/proc/{pid}/stat", encoding="utf-8") as f:
+                if f.read().rsplit(")", 1)[1].split()[0] == "Z":
+                    return True
+        except FileNotFoundError:
+            return True
+        except OSError:
+            try:
+                os.kill(pid, 0)
+            except ProcessLookupError:
+                return True
+        time.sleep(0.02)
+    return False
+
+
+def test_run_cmd_returns_code_and_output():
+    code, out, err = run_cmd([sys.executable, "-c", "import sys; print('hi'); sys.stderr.write('oops'); sys.exit(3)"])
+    assert (code, out.strip(), err) == (3, "hi", "oops")
+
+
+@posix
+def test_timeout_kills_the_whole_process_group(tmp_path):
+    pidfile = tmp_path / "pid"
+    kills = CMD_STATS.snapshot()["kills"]
+    start = time.monotonic()
+    code, out, err = run_cmd(["sh", "-c", f"sleep 30 & echo $! > {pidfile}; echo started; sleep 30"], timeout=0.5)
+
+    assert time.monotonic() - start < 5
+    assert code == 1
+    assert err == "timed out after 0.5s"
+    assert out == "started\n"
+    assert _gone(int(pidfile.read_text()))
+    assert CMD_STATS.snapshot()["kills"] > kills
+
+
+@posix
+def test_on_line_stops_early_with_success(tmp_path):
+    seen = []
+
+    def on_line(line):
+        seen.append(line)
+        return line == "b"
+
+    start = time.monotonic()
+    code, out, err = run_cmd(["sh", "-c", "echo a; echo b; echo c; sleep 30"], timeout=10, on_line=on_line)
+
+    assert time.monotonic() - start < 5
+    assert code == 0
+    assert seen == ["a", "b"]
+    assert out.startswith("a\nb\n")
+
+
+def test_on_line_sees_an_unterminated_last_line():
+    seen = []
+    code, _, _ = run_cmd([sys.executable, "-c", "import sys; sys.stdout.write('x\\r\\ny')"], on_line=seen.append)
+    assert code == 0
+    assert seen == ["x", "y"]
+
+
+def test_output_over_max_bytes_is_cut_off():
+    start = time.monotonic()
+    code, out, err = run_cmd(
+        [sys.executable, "-c", "import sys, time; sys.stdout.write('x' * 200000); sys.stdout.flush(); time.sleep(30)"],
+        timeout=10,
+        max_bytes=1000,
+    )
+
+    assert time.monotonic() - start < 5
+    assert code == 1
+    assert err == "output exceeded 1000 bytes"
+    assert len(out) <= 1000
+
+
+def test_missing_binary():
+    code, out, err = run_cmd(["cm-agent-no-such-binary"])
+    assert code == 1
+    assert out == ""
+    assert "cm-agent-no-such-binary" in err
+
+
+@posix
+def test_grandchild_holding_the_pipe_is_killed_on_timeout(tmp_path):
+    # The shell exits at once, but the backgrounded sleep keeps stdout open
+    pidfile = tmp_path / "pid"
+    start = time.monotonic()
+    code, out, err = run_cmd(["sh", "-c", f"sleep 30 & echo $! > {pidfile}; echo done"], timeout=1)
+
+    assert time.monotonic() - start < 5
+    assert code == 1
+    assert err == "timed out after 1s"
+    assert out == "done\n"
+    assert _gone(int(pidfile.read_text()))
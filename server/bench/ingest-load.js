@@ -0,0 +1,89 @@
+// Load test for report ingest: N concurrent clients post synthetic reports
+// for a fixed time, then print sustained reports/s and the server's
+// group-commit stats.
+//
+//   node bench/ingest-load.js --url http://localhost:3000 --concurrency 32 --seconds 20 --batch 1
+//
+// Uses only Node built-ins (fetch needs Node 18+).
+
+const args = Object.fromEntries(
+  process.argv.slice(2).reduce((pairs, arg, i, all) => {
+    if (arg.startsWith('--')) pairs.push([arg.slice(2), all[i + 1]]);
+    return pairs;
+  }, [])
+);
+const URL_BASE = (args.url || process.env.CM_BENCH_URL || 'http://localhost:3000').replace(/\/$/, '');
+const API_KEY = args.key || process.env.API_KEY || 'dev_local';
+const CONCURRENCY = parseInt(args.concurrency || '16', 10);
+const SECONDS = parseFloat(args.seconds || '10');
+const BATCH = parseInt(args.batch || '1', 10);
+const MACHINES = parseInt(args.machines || '1000', 10);
+
+const STATUSES = ['ok', 'issue', 'unknown'];
+let seq = 0;
+
+function report() {
+  seq += 1;
+  const n = seq % MACHINES;
+  const pick = () => STATUSES[Math.floor(Math.random() * STATUSES.length)];
+  return {
+    machine_id: `bench-${n}`,
+    hostname: `bench-host-${n}`,
+    os: ['Linux', 'Windows', 'Darwin'][n % 3],
+    timestamp: Math.floor(Date.now() / 1000),
+    version: `v${seq}`,
+    checks: {
+      disk_encryption: { status: pick(), summary: 'bench' },
+      os_updates: { status: pick(), summary: 'bench', data: { pending_updates: seq % 17 } },
+      antivirus: { status: pick(), summary: 'bench' },
+      sleep_policy: { status: pick(), summary: 'bench' }
+    }
+  };
+}
+
+function percentile(sorted, p) {
+  if (!sorted.length) return 0;
+  return sorted[Math.min(sorted.length - 1, Math.floor((p / 100) * sorted.length))];
+}
+
+async function client(deadline, latencies, counts) {
+  const batched = BATCH > 1;
+  const url = `${URL_BASE}/api/report${batched ? '/batch' : ''}`;
+  while (Date.now() < deadline) {
+    const body = batched ? { reports: Array.from({ length: BATCH }, report) } : report();
+    const started = process.hrtime.bigint();
+    try {
+      const res = await fetch(url, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json', 'X-API-Key': API_KEY },
+        body: JSON.stringify(body)
+      });
+      await res.arrayBuffer();
+      latencies.push(Number(process.hrtime.bigint() - started) / 1e6);
+      if (res.ok) counts.reports += batched ? BATCH : 1;
+      else counts.errors += 1;
+    } catch {
+      counts.errors += 1;
+    }
+  }
+}
+
+const latencies = [];
+const counts = { reports: 0, errors: 0 };
+const started = Date.now();
+const deadline = started + SECONDS * 1000;
+await Promise.all(Array.from({ length: CONCURRENCY }, () => client(deadline, latencies, counts)));
+const elapsed = (Date.now() - started) / 1000;
+
+latencies.sort((a, b) => a - b);
+console.log(`requests:     ${latencies.length} (${counts.errors} errors), batch ${BATCH}, concurrency ${CONCURRENCY}`);
+console.log(`reports/s:    ${(counts.reports / elapsed).toFixed(1)}`);
+console.log(`latency ms:   p50 ${percentile(latencies, 50).toFixed(1)}  p95 ${percentile(latencies, 95).toFixed(1)}  p99 ${percentile(latencies, 99).toFixed(1)}`);
+
+try {
+  const res = await fetch(`${URL_BASE}/api/ingest/stats`, { headers: { 'X-API-Key': API_KEY } });
+  const stats = await res.json();
+  console.log(`flushes:      ${stats.flushes}, avg ${stats.avg_batch.toFixed(1)} reports / ${stats.avg_ms.toFixed(1)} ms, max ${stats.max_batch} reports / ${stats.max_ms.toFixed(1)} ms`);
+} catch {
+  console.log('flushes:      (stats unavailable)');
+}
@@ -0,0 +1,65 @@
+import { Readable, pipeline } from 'stream';
+
+const CHUNK_BYTES = 64 * 1024;
+const BASE_COLUMNS = ['machine_id', 'hostname', 'os', 'timestamp'];
+
+function csvField(value) {
+  const s = value === null || value === undefined ? '' : String(value);
+  return /[",\r\n]/.test(s) ? `"${s.replaceAll('"', '""')}"` : s;
+}
+
+function hasIssue(checks) {
+  return Object.values(checks || {}).some((c) => (c?.status || 'unknown') === 'issue');
+}
+
+// Every stored report as an export item, filtered like the machine list.
+export function* historyItems(reports, { os, hasIssues, q } = {}) {
+  const osKey = os ? String(os).toLowerCase() : null;
+  const wantIssues = typeof hasIssues === 'undefined' ? null : String(hasIssues).toLowerCase() === 'true';
+  const needle = q ? String(q).toLowerCase() : null;
+  for (const r of reports) {
+    if (osKey !== null && (r.os || '').toLowerCase() !== osKey) continue;
+    const issue = hasIssue(r.checks);
+    if (wantIssues !== null && issue !== wantIssues) continue;
+    if (needle && !`${r.machine_id || ''}\n${r.hostname || ''}`.toLowerCase().includes(needle)) continue;
+    yield { machine_id: r.machine_id, hostname: r.hostname, os: r.os, timestamp: r.ts, checks: r.checks, has_issue: issue };
+  }
+}
+
+function* csvLines(items, checks) {
+  yield [...BASE_COLUMNS, ...checks.map((name) => `${name}.status`)].join(',') + '\n';
+  for (const item of items) {
+    const c = item.checks || {};
+    const row = [item.machine_id, item.hostname, item.os, item.timestamp];
+    for (const name of checks) row.push(c[name]?.status || 'unknown');
+    yield row.map(csvField).join(',') + '\n';
+  }
+}
+
+function* ndjsonLines(items) {
+  for (const item of items) yield JSON.stringify(item) + '\n';
+}
+
+// Groups lines into ~64 KB chunks so the socket sees few, large writes.
+function* chunked(lines) {
+  let buf = '';
+  for (const line of lines) {
+    buf += line;
+    if (buf.length >= CHUNK_BYTES) {
+      yield buf;
+      buf = '';
+    }
+  }
+  if (buf) yield buf;
+}
+
+// Streams items as CSV (one `<check>.status` column per check name) or
+// NDJSON. The pipeline only pulls the next rows once the client has drained
+// the previous ones, and stops walking the index if the client disconnects.
+export function sendExport(res, format, items, checks) {
+  const lines = format === 'csv' ? csvLines(items, checks) : ndjsonLines(items);
+  res.setHeader('Content-Type', format === 'csv' ? 'text/csv' : 'application/x-ndjson');
+  pipeline(Readable.from(chunked(lines), { highWaterMark: 1 }), res, (err) => {
+    if (err && !res.headersSent) res.status(500).end();
+  });
+}
@@ -0,0 +1,160 @@
+import { bound } from './storage/keyset.js';
+
+const STATUSES = ['ok', 'issue', 'unknown'];
+
+function hasIssue(checks) {
+  return Object.values(checks || {}).some((c) => (c?.status || 'unknown') === 'issue');
+}
+
+function emptyCounts() {
+  return { machines: 0, with_issues: 0 };
+}
+
+// Latest report per machine plus aggregate counters, updated on every ingest
+// so listing, filtering and /api/stats never walk the report history.
+export class FleetIndex {
+  constructor() {
+    this.machines = new Map(); // machine_id -> summary
+    this.order = []; // machine_ids sorted, the keyset for listing pages
+    this.byOs = new Map(); // lowercased os -> Set of machine_id
+    this.totals = emptyCounts();
+    this.osCounts = new Map(); // os as reported -> counts
+    this.checkCounts = new Map(); // check name -> { status: count }
+    this.version = 0; // bumped whenever any machine's latest report changes
+  }
+
+  static from(reports) {
+    const index = new FleetIndex();
+    for (const r of reports) index.update(r);
+    return index;
+  }
+
+  _summary(report) {
+    return {
+      item: {
+        machine_id: report.machine_id,
+        hostname: report.hostname,
+        os: report.os,
+        timestamp: report.ts,
+        checks: report.checks,
+        has_issue: hasIssue(report.checks)
+      },
+      // Lowercased once here instead of on every filtered request
+      os_key: (report.os || '').toLowerCase(),
+      search: `${report.machine_id || ''}\n${report.hostname || ''}`.toLowerCase()
+    };
+  }
+
+  _count({ item }, delta) {
+    this.totals.machines += delta;
+    if (item.has_issue) this.totals.with_issues += delta;
+    const osName = item.os || 'unknown';
+    const os = this.osCounts.get(osName) || emptyCounts();
+    os.machines += delta;
+    if (item.has_issue) os.with_issues += delta;
+    if (os.machines) this.osCounts.set(osName, os);
+    else this.osCounts.delete(osName);
+    for (const [name, check] of Object.entries(item.checks || {})) {
+      const status = check?.status || 'unknown';
+      const counts = this.checkCounts.get(name) || Object.fromEntries(STATUSES.map((s) => [s, 0]));
+      counts[status] = (counts[status] || 0) + delta;
+      if (Object.values(counts).some(Boolean)) this.checkCounts.set(name, counts);
+      else this.checkCounts.delete(name);
+    }
+  }
+
+  // Applies a stored report; older than the machine's current latest is a no-op.
+  update(report) {
+    const prev = this.machines.get(report.machine_id);
+    if (prev && prev.item.timestamp > report.ts) return false;
+    const next = this._summary(report);
+    this.version += 1;
+    next.changed = this.version;
+    if (prev) {
+      this._count(prev, -1);
+      this.byOs.get(prev.os_key)?.delete(report.machine_id);
+    }
+    if (!prev) this.order.splice(bound(this.order, report.machine_id, (id) => id), 0, report.machine_id);
+    this.machines.set(report.machine_id, next);
+    if (!this.byOs.has(next.os_key)) this.byOs.set(next.os_key, new Set());
+    this.byOs.get(next.os_key).add(report.machine_id);
+    this._count(next, 1);
+    return true;
+  }
+
+  // Machines matching the filters in machine_id order, after the `after` cursor.
+  *iterate({ os, hasIssues, q, after } = {}) {
+    const osKey = os ? String(os).toLowerCase() : null;
+    const osIds = osKey !== null ? this.byOs.get(osKey) : null;
+    if (osKey !== null && !osIds) return;
+    const wantIssues = typeof hasIssues === 'undefined' ? null : String(hasIssues).toLowerCase() === 'true';
+    const needle = q ? String(q).toLowerCase() : null;
+    const start = after != null ? bound(this.order, String(after), (id) => id, true) : 0;
+    for (let i = start; i < this.order.length; i += 1) {
+      const id = this.order[i];
+      if (osIds && !osIds.has(id)) continue;
+      const m = this.machines.get(id);
+      if (wantIssues !== null && m.item.has_issue !== wantIssues) continue;
+      if (needle && !m.search.includes(needle)) continue;
+      yield m.item;
+    }
+  }
+
+  get(machineId) {
+    return this.machines.get(machineId)?.item || null;
+  }
+
+  // Machines whose latest report changed after change version `version`.
+  *changedSince(version) {
+    for (const m of this.machines.values()) {
+      if (m.changed > version) yield m.item;
+    }
+  }
+
+  // Machines matching the filters across all pages, when a counter has it.
+  _counted({ os, hasIssues, q }) {
+    if (q || typeof hasIssues !== 'undefined') return null;
+    return os ? this.byOs.get(String(os).toLowerCase())?.size || 0 : this.totals.machines;
+  }
+
+  // One page of iterate(); `next` is the cursor for the following page and
+  // `total` the number of machines matching the filters on every page.
+  list({ limit, after, ...filters } = {}) {
+    const items = [];
+    let next = null;
+    const counted = this._counted(filters);
+    if (counted !== null) {
+      for (const item of this.iterate({ ...filters, after })) {
+        if (limit && items.length === limit) {
+          next = items[items.length - 1].machine_id;
+          break;
+        }
+        items.push(item);
+      }
+      return { items, next, total: counted };
+    }
+    // Search and issue filters have no counter: walk every match once,
+    // counting the ones before the cursor and after the page too
+    const cursor = after != null ? String(after) : null;
+    let total = 0;
+    for (const item of this.iterate(filters)) {
+      total += 1;
+      if (cursor !== null && item.machine_id <= cursor) continue;
+      if (limit && items.length === limit) next ??= items[items.length - 1].machine_id;
+      else items.push(item);
+    }
+    return { items, next, total };
+  }
+
+  checkNames() {
+    return [...this.checkCounts.keys()].sort();
+  }
+
+  stats() {
+    return {
+      ...this.totals,
+      by_os: Object.fromEntries(this.osCounts),
+      by_check: Object.fromEntries(this.checkCounts)
+    };
+  }
+}
@@ -1,25 +1,78 @@
 import 'dotenv/config';
 import express from 'express';
 import cors from 'cors';
-import { Low } from 'lowdb';
-import { JSONFile } from 'lowdb/node';
-import fs from 'fs';
 import path from 'path';
+import zlib from 'zlib';
+import { historyItems, sendExport } from './export.js';
+import { FleetIndex } from './fleet.js';
+import { ingestBatch, ingestReport } from './ingest.js';
+import { ProbeStats } from './probes.js';
+import { openStorage } from './storage/index.js';
 
 const PORT = process.env.PORT ? parseInt(process.env.PORT, 10) : 3000;
 const API_KEY = process.env.API_KEY || 'dev_local';
 const DB_PATH = process.env.DB_PATH || './data/db.json';
+const STORAGE = process.env.STORAGE || 'log';
+const DATA_DIR = process.env.DATA_DIR || path.dirname(DB_PATH);
+const SNAPSHOT_EVERY = parseInt(process.env.SNAPSHOT_EVERY || '10000', 10);
+const MAX_BODY_BYTES = parseInt(process.env.MAX_BODY_BYTES || String(256 * 1024), 10);
+const MAX_BATCH_BYTES = parseInt(process.env.MAX_BATCH_BYTES || String(8 * 1024 * 1024), 10);
+const MAX_BATCH_REPORTS = parseInt(process.env.MAX_BATCH_REPORTS || '500', 10);
+const GROUP_COMMIT_MS = parseInt(process.env.GROUP_COMMIT_MS || '10', 10);
+const PUSH_DELAY_MS = parseInt(process.env.PUSH_DELAY_MS || '1000', 10);
 
-fs.mkdirSync(path.dirname(DB_PATH), { recursive: true });
+// Request body codecs. gzip/deflate are inflated by express.json itself;
+// zstd needs a zlib build that has it (Node 22.15+).
+const SUPPORTED_ENCODINGS = [
+  ...(typeof zlib.zstdDecompress === 'function' ? ['zstd'] : []),
+  'gzip',
+  'deflate'
+];
 
-const adapter = new JSONFile(DB_PATH);
-const db = new Low(adapter, { reports: [] });
-await db.read();
-db.data ||= { reports: [] };
+const store = await openStorage({ backend: STORAGE, dataDir: DATA_DIR, dbPath: DB_PATH, snapshotEvery: SNAPSHOT_EVERY });
+const fleet = FleetIndex.from(store.latestAll());
+const probes = ProbeStats.from(store.latestAll());
 
 const app = express();
 app.use(cors());
-app.use(express.json({ limit: '256kb' }));
+
+function readRawBody(req, limit) {
+  return new Promise((resolve, reject) => {
+    const chunks = [];
+    let size = 0;
+    req.on('data', (chunk) => {
+      size += chunk.length;
+      if (size > limit) {
+        reject(Object.assign(new Error('Payload too large'), { status: 413 }));
+        req.destroy();
+        return;
+      }
+      chunks.push(chunk);
+    });
+    req.on('end', () => resolve(Buffer.concat(chunks)));
+    req.on('error', reject);
+  });
+}
+
+function bodyLimit(req) {
+  return req.path === '/api/report/batch' ? MAX_BATCH_BYTES : MAX_BODY_BYTES;
+}
+
+app.use(async (req, res, next) => {
+  const encoding = String(req.headers['content-encoding'] || '').toLowerCase();
+  if (encoding !== 'zstd' || !SUPPORTED_ENCODINGS.includes('zstd')) return next();
+  try {
+    const raw = await readRawBody(req, bodyLimit(req));
+    const decoded = zlib.zstdDecompressSync(raw, { maxOutputLength: bodyLimit(req) });
+    req.body = JSON.parse(decoded.toString('utf8'));
+    req._body = true; // tells express.json the body is already parsed
+    next();
+  } catch (err) {
+    res.status(err.status || 400).json({ error: err.status === 413 ? 'Payload too large' : 'Invalid request body' });
+  }
+});
+app.use('/api/report/batch', express.json({ limit: MAX_BATCH_BYTES }));
+app.use(express.json({ limit: MAX_BODY_BYTES }));
 
 // Static Admin Dashboard
 const publicDir = path.join(process.cwd(), 'public');
@@ -27,6 +80,10 @@ app.use('/admin', express.static(path.join(publicDir, 'admin')));
 
 // Simple API key middleware
 app.use('/api', (req, res, next) => {
+  // Advertise request codecs (RFC 7694) so agents only compress for servers that can decode
+  res.setHeader('Accept-Encoding', SUPPORTED_ENCODINGS.join(', '));
+  // Tells agents they may drain queued reports through /api/report/batch
+  res.setHeader('X-Report-Batch-Max', String(MAX_BATCH_REPORTS));
   const key = req.header('X-API-Key');
   if (!key || key !== API_KEY) {
     return res.status(401).json({ error: 'Unauthorized' });
@@ -34,120 +91,280 @@ app.use('/api', (req, res, next) => {
   next();
 });
 
+function onStored(record) {
+  if (fleet.update(record)) notifyChanged(record.machine_id);
+  probes.update(record);
+}
+
+// Group commit: reports arriving within GROUP_COMMIT_MS share one store.flush(),
+// and each request is acknowledged only once that write has completed.
+const commitStats = { flushes: 0, reports: 0, max_batch: 0, last_batch: 0, last_ms: 0, total_ms: 0, max_ms: 0, errors: 0 };
+let pending = [];
+let flushTimer = null;
+let flushing = null;
+
+function commit(count = 1) {
+  return new Promise((resolve, reject) => {
+    pending.push({ count, resolve, reject });
+    if (!flushTimer && !flushing) flushTimer = setTimeout(flush, GROUP_COMMIT_MS);
+  });
+}
+
+async function flush() {
+  flushTimer = null;
+  const waiters = pending;
+  pending = [];
+  const started = process.hrtime.bigint();
+  flushing = store.flush();
+  try {
+    await flushing;
+    const ms = Number(process.hrtime.bigint() - started) / 1e6;
+    const size = waiters.reduce((n, w) => n + w.count, 0);
+    commitStats.flushes += 1;
+    commitStats.reports += size;
+    commitStats.last_batch = size;
+    commitStats.max_batch = Math.max(commitStats.max_batch, size);
+    commitStats.last_ms = ms;
+    commitStats.total_ms += ms;
+    commitStats.max_ms = Math.max(commitStats.max_ms, ms);
+    for (const w of waiters) w.resolve();
+  } catch (err) {
+    commitStats.errors += 1;
+    for (const w of waiters) w.reject(err);
+  } finally {
+    flushing = null;
+    // Reports that arrived during the write go out in the next group
+    if (pending.length && !flushTimer) flushTimer = setTimeout(flush, GROUP_COMMIT_MS);
+  }
+}
+
 app.post('/api/report', async (req, res) => {
-  const { machine_id, hostname, os, timestamp, checks } = req.body || {};
-  if (!machine_id || !timestamp || !checks) {
-    return res.status(400).json({ error: 'Missing fields' });
+  const [status, body] = ingestReport(store, req.body, onStored);
+  if (status !== 200) return res.status(status).json(body);
+  try {
+    await commit();
+  } catch {
+    return res.status(503).json({ error: 'Storage unavailable' });
   }
-  db.data.reports.push({
-    machine_id,
-    hostname: hostname || null,
-    os: os || null,
-    ts: Number(timestamp),
-    checks
-  });
-  await db.write();
-  return res.json({ ok: true });
+  return res.json(body);
 });
 
-function getLatestPerMachine(filters = {}) {
-  const { os, hasIssues, q } = filters;
-  const reports = db.data.reports;
-  // Map of latest by machine_id
-  const latest = new Map();
-  for (const r of reports) {
-    const prev = latest.get(r.machine_id);
-    if (!prev || r.ts > prev.ts) latest.set(r.machine_id, r);
+// Many reports in one request, e.g. an agent draining its outbox. Reports are
+// applied in order up to the first failure; each gets its own result and all
+// stored ones share one durable write.
+app.post('/api/report/batch', async (req, res) => {
+  const reports = Array.isArray(req.body) ? req.body : req.body?.reports;
+  if (!Array.isArray(reports) || reports.length === 0) {
+    return res.status(400).json({ error: 'Missing reports' });
   }
-  let result = Array.from(latest.values()).map((r) => ({
-    machine_id: r.machine_id,
-    hostname: r.hostname,
-    os: r.os,
-    timestamp: r.ts,
-    checks: r.checks
-  }));
-
-  if (os) result = result.filter((x) => (x.os || '').toLowerCase() === String(os).toLowerCase());
-  if (typeof hasIssues !== 'undefined') {
-    const target = String(hasIssues).toLowerCase() === 'true';
-    result = result.filter((x) => {
-      const issues = Object.values(x.checks).some((c) => (c?.status || 'unknown') === 'issue');
-      return target ? issues : !issues;
-    });
+  if (reports.length > MAX_BATCH_REPORTS) {
+    return res.status(413).json({ error: 'Too many reports', max: MAX_BATCH_REPORTS });
   }
-  if (q) {
-    const s = String(q).toLowerCase();
-    result = result.filter((x) =>
-      (x.machine_id || '').toLowerCase().includes(s) ||
-      (x.hostname || '').toLowerCase().includes(s)
-    );
+  const results = ingestBatch(store, reports, onStored);
+  const stored = results.filter((r) => r.ok).length;
+  if (stored) {
+    try {
+      await commit(stored);
+    } catch {
+      return res.status(503).json({ error: 'Storage unavailable' });
+    }
   }
-  return result;
-}
+  return res.json({ ok: true, delta: true, results });
+});
 
-app.get('/api/machines', (req, res) => {
-  const { os, hasIssues, q } = req.query;
-  const data = getLatestPerMachine({ os, hasIssues, q });
-  res.json({ count: data.length, items: data });
+app.get('/api/ingest/stats', (_req, res) => {
+  const { flushes, reports, total_ms } = commitStats;
+  res.json({
+    ...commitStats,
+    avg_batch: flushes ? reports / flushes : 0,
+    avg_ms: flushes ? total_ms / flushes : 0,
+    window_ms: GROUP_COMMIT_MS,
+    queued: pending.reduce((n, w) => n + w.count, 0)
+  });
 });
 
-app.get('/api/export.csv', (req, res) => {
-  const { os, hasIssues, q } = req.query;
-  const data = getLatestPerMachine({ os, hasIssues, q });
-  const headers = [
-    'machine_id', 'hostname', 'os', 'timestamp',
-    'disk_encryption.status', 'os_updates.status', 'antivirus.status', 'sleep_policy.status'
-  ];
-  const rows = [headers.join(',')];
-  for (const item of data) {
-    const c = item.checks || {};
-    const line = [
-      item.machine_id,
-      item.hostname || '',
-      item.os || '',
-      String(item.timestamp),
-      c?.disk_encryption?.status || 'unknown',
-      c?.os_updates?.status || 'unknown',
-      c?.antivirus?.status || 'unknown',
-      c?.sleep_policy?.status || 'unknown',
-    ].map((v) => String(v).replaceAll('"', '""'))
-     .map((v) => /[,\n]/.test(v) ? `"${v}"` : v)
-     .join(',');
-    rows.push(line);
+// Change versions restart at boot, so they are qualified with a boot id
+const BOOT_ID = Date.now().toString(36);
+
+function changeId() {
+  return `${BOOT_ID}-${fleet.version}`;
+}
+
+function parseChangeId(value) {
+  const [boot, version] = String(value || '').split('-');
+  const n = parseInt(version, 10);
+  return boot === BOOT_ID && Number.isInteger(n) ? n : null;
+}
+
+// Everything derived from the fleet index shares one validator that changes
+// whenever any machine's latest report does.
+function notModified(req, res) {
+  const etag = `W/"${changeId()}"`;
+  res.setHeader('ETag', etag);
+  res.setHeader('Cache-Control', 'no-cache');
+  const match = req.headers['if-none-match'];
+  if (match && match.split(',').some((t) => t.trim() === etag || t.trim() === '*')) {
+    res.status(304).end();
+    return true;
   }
-  res.setHeader('Content-Type', 'text/csv');
-  res.send(rows.join('\n'));
-});
+  return false;
+}
 
-app.get('/api/machines/:id', (req, res) => {
-  const id = req.params.id;
-  const rows = db.data.reports
-    .filter((r) => r.machine_id === id)
-    .sort((a, b) => b.ts - a.ts)
-    .slice(0, 500)
-    .map((r) => ({ timestamp: r.ts, hostname: r.hostname, os: r.os, checks: r.checks }));
-  res.json({ machine_id: id, count: rows.length, items: rows });
-});
+// Server-Sent Events: clients get the latest summary of every machine whose
+// report changed, batched over PUSH_DELAY_MS. Event ids are change ids, so a
+// reconnecting EventSource resumes from Last-Event-ID; an unknown id (e.g.
+// after a restart) gets a `reset` event and the client reloads the list.
+const SSE_MAX_BUFFER = 1024 * 1024;
+const sseClients = new Set();
+let changedIds = new Set();
+let pushTimer = null;
+
+function sendEvent(res, event, data) {
+  res.write(`id: ${changeId()}\nevent: ${event}\ndata: ${JSON.stringify(data)}\n\n`);
+  // A client this far behind catches up after reconnecting instead
+  if (res.writableLength > SSE_MAX_BUFFER) res.end();
+}
+
+function notifyChanged(machineId) {
+  if (!sseClients.size) return;
+  changedIds.add(machineId);
+  pushTimer ||= setTimeout(pushChanges, PUSH_DELAY_MS);
+}
+
+function pushChanges() {
+  pushTimer = null;
+  const items = Array.from(changedIds, (id) => fleet.get(id));
+  changedIds = new Set();
+  for (const res of sseClients) sendEvent(res, 'machines', { version: changeId(), items });
+}
+
+function fleetEvents(req, res) {
+  res.writeHead(200, {
+    'Content-Type': 'text/event-stream',
+    'Cache-Control': 'no-cache',
+    Connection: 'keep-alive',
+    'X-Accel-Buffering': 'no'
+  });
+  res.write('retry: 5000\n\n');
+  const since = parseChangeId(req.headers['last-event-id'] || req.query.since);
+  if (since === null) {
+    sendEvent(res, 'reset', { version: changeId() });
+  } else if (since < fleet.version) {
+    sendEvent(res, 'machines', { version: changeId(), items: [...fleet.changedSince(since)] });
+  }
+  sseClients.add(res);
+  res.on('close', () => sseClients.delete(res));
+}
+
+setInterval(() => {
+  for (const res of sseClients) res.write(': ping\n\n');
+}, 25000).unref();
+
+const MACHINES_PAGE = 1000;
+const MAX_PAGE = 5000;
+
+function pageLimit(value, fallback) {
+  const n = parseInt(value, 10);
+  return Number.isFinite(n) && n > 0 ? Math.min(n, MAX_PAGE) : fallback;
+}
+
+function cursorTs(value) {
+  if (value === undefined || value === '') return undefined;
+  const n = Number(value);
+  if (!Number.isFinite(n)) throw Object.assign(new Error('Invalid cursor'), { status: 400 });
+  return n;
+}
+
+// Latest report per machine in machine_id order, one page at a time; pass
+// `next` back as `after` for the following page. `count` is the number of
+// matching machines on all pages, as it was before listings were paged.
+function listMachines(req, res) {
+  if (notModified(req, res)) return;
+  const { os, hasIssues, q, after, limit } = req.query;
+  const page = fleet.list({ os, hasIssues, q, after, limit: pageLimit(limit, MACHINES_PAGE) });
+  res.json({ count: page.total, items: page.items, next: page.next, version: changeId() });
+}
+
+// A machine's reports newest first. `before`/`after` are exclusive report
+// timestamps; `next` (as `before`) pages to older reports, `prev` (as `after`) to newer.
+function machineHistory(defaultLimit) {
+  return (req, res) => {
+    const id = req.params.id;
+    let before;
+    let after;
+    try {
+      before = cursorTs(req.query.before);
+      after = cursorTs(req.query.after);
+    } catch (err) {
+      return res.status(err.status).json({ error: err.message });
+    }
+    const page = store.history(id, { before, after, limit: pageLimit(req.query.limit, defaultLimit) });
+    const rows = page.items.map((r) => ({ timestamp: r.ts, hostname: r.hostname, os: r.os, checks: r.checks }));
+    res.json({ machine_id: id, count: rows.length, items: rows, next: page.next, prev: page.prev });
+  };
+}
+
+function fleetStats(req, res) {
+  if (notModified(req, res)) return;
+  res.json(fleet.stats());
+}
+
+app.get('/api/stats', fleetStats);
+
+app.get('/api/machines', listMachines);
+app.get('/api/events', fleetEvents);
+
+// Streaming exports of the latest report per machine, or with `history=true`
+// every stored report. `checks=a,b` picks the check columns (CSV); by
+// default there is one per check present in the exported data.
+function exportHandler(format) {
+  return (req, res) => {
+    const { os, hasIssues, q, history } = req.query;
+    const full = String(history).toLowerCase() === 'true';
+    const items = full
+      ? historyItems(store.scan(), { os, hasIssues, q })
+      : fleet.iterate({ os, hasIssues, q });
+    const checks = req.query.checks
+      ? String(req.query.checks).split(',').map((c) => c.trim()).filter(Boolean)
+      : full ? store.checkNames() : fleet.checkNames();
+    sendExport(res, format, items, checks);
+  };
+}
+
+app.get('/api/export.csv', exportHandler('csv'));
+app.get('/api/export.ndjson', exportHandler('ndjson'));
+
+app.get('/api/machines/:id', machineHistory(500));
+
+// Slowest probes across the fleet, from the agent_metrics of each machine's
+// latest reports. Only agents running with CM_PAYLOAD_METRICS=true contribute.
+function probeRankings(req, res) {
+  const { limit, os } = req.query;
+  res.json(probes.rankings({ limit, os }));
+}
+
+app.get('/api/probes', probeRankings);
 
 app.get('/health', (_req, res) => res.json({ ok: true }));
 
 // Admin API (read-only) that does not require client API key
-app.get('/admin/api/machines', (req, res) => {
-  const { os, hasIssues, q } = req.query;
-  const data = getLatestPerMachine({ os, hasIssues, q });
-  res.json({ count: data.length, items: data });
-});
+app.get('/admin/api/stats', fleetStats);
+app.get('/admin/api/events', fleetEvents);
 
-app.get('/admin/api/machines/:id', (req, res) => {
-  const id = req.params.id;
-  const rows = db.data.reports
-    .filter((r) => r.machine_id === id)
-    .sort((a, b) => b.ts - a.ts)
-    .slice(0, 200)
-    .map((r) => ({ timestamp: r.ts, hostname: r.hostname, os: r.os, checks: r.checks }));
-  res.json({ machine_id: id, count: rows.length, items: rows });
-});
+app.get('/admin/api/machines', listMachines);
 
-app.listen(PORT, () => {
+app.get('/admin/api/machines/:id', machineHistory(200));
+app.get('/admin/api/probes', probeRankings);
+
+const server = app.listen(PORT, () => {
   console.log(`Compliance Monitor server listening on http://localhost:${PORT}`);
 });
+
+// Flush queued reports and snapshot the index so the next start is fast
+for (const signal of ['SIGINT', 'SIGTERM']) {
+  process.once(signal, () => {
+    server.close();
+    for (const res of sseClients) res.end();
+    store.close().finally(() => process.exit(0));
+  });
+}
@@ -0,0 +1,60 @@
+// Report ingest, shared by /api/report and /api/report/batch. Reports are
+// applied to the store in memory; making them durable is up to the caller.
+// `onStored(record)` is called for every report that was appended.
+
+// Agents may send only the checks that changed since `base_version`; the
+// server rebuilds the full state from the latest stored report. Returns
+// [status, body].
+export function ingestReport(store, report, onStored) {
+  const { machine_id, hostname, os, timestamp, version, base_version, delta, removed, seq, instance, agent_metrics } =
+    report || {};
+  let { checks } = report || {};
+  if (!machine_id || !timestamp || !checks) {
+    return [400, { error: 'Missing fields' }];
+  }
+  // Agents replay queued reports after an outage and may resend one whose
+  // ack was lost; the per-instance sequence number makes that a no-op.
+  const sequenced = typeof instance === 'string' && Number.isInteger(seq);
+  if (sequenced && seq <= store.lastSeq(instance)) {
+    return [200, { ok: true, version: version || null, delta: true, duplicate: true }];
+  }
+  if (delta) {
+    const base = store.latest(machine_id);
+    if (!base_version || !version || !base || base.version !== base_version) {
+      return [409, { error: 'Version mismatch', resync: true }];
+    }
+    checks = { ...base.checks, ...checks };
+    for (const name of Array.isArray(removed) ? removed : []) delete checks[name];
+  }
+  const stored = store.append({
+    machine_id,
+    hostname: hostname || null,
+    os: os || null,
+    ts: Number(timestamp),
+    version: version || null,
+    ...(sequenced ? { instance, seq } : {}),
+    checks,
+    ...(agent_metrics && typeof agent_metrics === 'object' ? { agent_metrics } : {})
+  });
+  onStored?.(stored);
+  return [200, { ok: true, version: version || null, delta: true }];
+}
+
+// Applies reports in order and stops at the first one that fails: storing a
+// later report would advance its instance's last seq past the failed one, so
+// the agent's retry of it would be taken for a duplicate. The reports after
+// a failure are answered `skipped` and left for the agent to resend.
+export function ingestBatch(store, reports, onStored) {
+  const results = [];
+  let failed = false;
+  for (const report of reports) {
+    if (failed) {
+      results.push({ ok: false, skipped: true });
+      continue;
+    }
+    const [status, body] = ingestReport(store, report, onStored);
+    failed = status !== 200;
+    results.push(failed ? { ...body, status } : body);
+  }
+  return results;
+}
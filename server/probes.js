@@ -0,0 +1,93 @@
+const MAX_SLOWEST = 100;
+
+function isObject(value) {
+  return value !== null && typeof value === 'object' && !Array.isArray(value);
+}
+
+function finite(value) {
+  const n = Number(value);
+  return Number.isFinite(n) && n >= 0 ? n : null;
+}
+
+function percentile(sorted, p) {
+  if (!sorted.length) return null;
+  return sorted[Math.min(sorted.length - 1, Math.floor((p / 100) * sorted.length))];
+}
+
+// Fleet-wide probe timings from the optional `agent_metrics` block agents
+// attach to reports. A cycle only times the checks that actually ran (the
+// rest come from the agent's cache), so timings are merged per check and a
+// cached check keeps its last measured time.
+export class ProbeStats {
+  constructor() {
+    this.machines = new Map(); // machine_id -> { hostname, os, ts, build_ms, checks: { name: timing } }
+  }
+
+  static from(reports) {
+    const stats = new ProbeStats();
+    for (const r of reports) stats.update(r);
+    return stats;
+  }
+
+  update(report) {
+    const metrics = report?.agent_metrics;
+    if (!isObject(metrics)) return false;
+    let entry = this.machines.get(report.machine_id);
+    if (entry && entry.ts > report.ts) return false;
+    if (!entry) {
+      entry = { checks: {} };
+      this.machines.set(report.machine_id, entry);
+    }
+    entry.hostname = report.hostname;
+    entry.os = report.os;
+    entry.ts = report.ts;
+    entry.build_ms = finite(metrics.build_ms);
+    for (const [name, timing] of Object.entries(isObject(metrics.checks) ? metrics.checks : {})) {
+      const wall = finite(timing?.wall_ms);
+      if (wall === null) continue;
+      entry.checks[name] = {
+        wall_ms: wall,
+        cpu_ms: finite(timing.cpu_ms),
+        processes: finite(timing.processes),
+        measured_at: report.ts
+      };
+    }
+    return true;
+  }
+
+  // Per check: fleet p50/p95/max wall time and the slowest machines, sorted
+  // so the probe with the worst p95 comes first.
+  rankings({ limit = 10, os } = {}) {
+    const top = Math.max(1, Math.min(MAX_SLOWEST, Number(limit) || 10));
+    const osKey = os ? String(os).toLowerCase() : null;
+    const byCheck = new Map();
+    const cycles = [];
+    let machines = 0;
+    for (const [id, entry] of this.machines) {
+      if (osKey !== null && (entry.os || '').toLowerCase() !== osKey) continue;
+      machines += 1;
+      const who = { machine_id: id, hostname: entry.hostname, os: entry.os };
+      if (entry.build_ms !== null) cycles.push({ ...who, build_ms: entry.build_ms, timestamp: entry.ts });
+      for (const [name, timing] of Object.entries(entry.checks)) {
+        if (!byCheck.has(name)) byCheck.set(name, []);
+        byCheck.get(name).push({ ...who, ...timing });
+      }
+    }
+    const checks = [];
+    for (const [name, rows] of byCheck) {
+      rows.sort((a, b) => b.wall_ms - a.wall_ms);
+      const walls = rows.map((r) => r.wall_ms).reverse();
+      checks.push({
+        check: name,
+        machines: rows.length,
+        p50_ms: percentile(walls, 50),
+        p95_ms: percentile(walls, 95),
+        max_ms: walls[walls.length - 1],
+        slowest: rows.slice(0, top)
+      });
+    }
+    checks.sort((a, b) => b.p95_ms - a.p95_ms);
+    cycles.sort((a, b) => b.build_ms - a.build_ms);
+    return { machines, checks, slowest_cycles: cycles.slice(0, top) };
+  }
+}
@@ -4,80 +4,233 @@ const fmtTime = (ts) => {
   return d.toLocaleString();
 };
 
+const esc = (value) => String(value ?? '').replace(/[&<>"']/g, (ch) => `&#${ch.charCodeAt(0)};`);
+
+const STATUSES = new Set(['ok', 'issue', 'unknown']);
+
 const badge = (status) => {
-  const s = status || 'unknown';
+  const s = STATUSES.has(status) ? status : 'unknown';
   return `<span class="badge ${s}">${s}</span>`;
 };
 
+const CHECK_COLUMNS = ['disk_encryption', 'os_updates', 'antivirus', 'sleep_policy'];
+const ROW_HEIGHT = 41; // px, must match #machines-table td in style.css
+const OVERSCAN = 10; // rows rendered beyond each edge of the viewport
+
 let currentSort = { key: 'timestamp', dir: 'desc' };
+let rows = []; // { item, keys } for machines matching the filters, in sort order
+let rowById = new Map();
+let listVersion = null;
+let listEtag = null;
+let events = null;
+let renderQueued = false;
+
+const currentFilters = () => ({
+  os: document.getElementById('filter-os').value,
+  hasIssues: document.getElementById('filter-issues').value,
+  q: document.getElementById('filter-q').value.trim()
+});
+
+// Mirrors the server-side filters so pushed changes can be placed locally
+const matchesFilters = (x, filters) => {
+  if (filters.os && (x.os || '').toLowerCase() !== filters.os.toLowerCase()) return false;
+  if (filters.hasIssues !== '' && String(Boolean(x.has_issue)) !== filters.hasIssues) return false;
+  if (filters.q && !`${x.machine_id}\n${x.hostname || ''}`.toLowerCase().includes(filters.q.toLowerCase())) return false;
+  return true;
+};
 
 const fetchMachines = async (filters = {}) => {
   const params = new URLSearchParams();
   if (filters.os) params.set('os', filters.os);
   if (filters.hasIssues !== '') params.set('hasIssues', filters.hasIssues);
   if (filters.q) params.set('q', filters.q);
-  const res = await fetch(`/admin/api/machines?${params.toString()}`);
-  if (!res.ok) throw new Error('Failed to load machines');
-  const data = await res.json();
-  return data.items || [];
-};
-
-const renderTable = (items) => {
-  const tbody = document.querySelector('#machines-table tbody');
-  tbody.innerHTML = items.map((x) => {
-    const c = x.checks || {};
-    return `<tr data-id="${x.machine_id}">
-      <td>${x.hostname || ''}</td>
-      <td>${x.machine_id}</td>
-      <td>${x.os || ''}</td>
+  // The list is paged; follow the cursor until the last page
+  const items = [];
+  let next = null;
+  let version = null;
+  let etag = null;
+  do {
+    if (next) params.set('after', next);
+    const res = await fetch(`/admin/api/machines?${params.toString()}`);
+    if (!res.ok) throw new Error('Failed to load machines');
+    const data = await res.json();
+    items.push(...(data.items || []));
+    next = data.next;
+    version ??= data.version;
+    etag ??= res.headers.get('ETag');
+  } while (next);
+  return { items, version, etag };
+};
+
+// Sort keys are computed once per item rather than on every comparison
+const toRow = (item) => ({
+  item,
+  keys: {
+    hostname: (item.hostname || '').toLowerCase(),
+    machine_id: String(item.machine_id).toLowerCase(),
+    os: (item.os || '').toLowerCase(),
+    timestamp: Number(item.timestamp) || 0
+  }
+});
+
+const compareRows = (a, b) => {
+  const va = a.keys[currentSort.key];
+  const vb = b.keys[currentSort.key];
+  const order = va < vb ? -1 : va > vb ? 1 : 0;
+  return currentSort.dir === 'asc' ? order : -order;
+};
+
+// First index whose row sorts after `row`
+const insertionPoint = (row) => {
+  let lo = 0;
+  let hi = rows.length;
+  while (lo < hi) {
+    const mid = (lo + hi) >> 1;
+    if (compareRows(rows[mid], row) <= 0) lo = mid + 1;
+    else hi = mid;
+  }
+  return lo;
+};
+
+const rowHtml = ({ item: x }) => {
+  const c = x.checks || {};
+  return `<tr data-id="${esc(x.machine_id)}">
+      <td>${esc(x.hostname)}</td>
+      <td>${esc(x.machine_id)}</td>
+      <td>${esc(x.os)}</td>
       <td><div class="timestamp">${fmtTime(x.timestamp)}</div></td>
-      <td>${badge(c?.disk_encryption?.status)}</td>
-      <td>${badge(c?.os_updates?.status)}</td>
-      <td>${badge(c?.antivirus?.status)}</td>
-      <td>${badge(c?.sleep_policy?.status)}</td>
+      ${CHECK_COLUMNS.map((name) => `<td>${badge(c?.[name]?.status)}</td>`).join('')}
     </tr>`;
-  }).join('');
-
-  // Row click to open details
-  tbody.querySelectorAll('tr').forEach((tr) => {
-    tr.addEventListener('click', async () => {
-      const id = tr.getAttribute('data-id');
-      const res = await fetch(`/admin/api/machines/${encodeURIComponent(id)}`);
-      if (res.ok) {
-        const data = await res.json();
-        alert(JSON.stringify(data, null, 2));
-      }
-    });
-  });
 };
 
-const sortItems = (items, key, dir) => {
-  const mult = dir === 'asc' ? 1 : -1;
-  return [...items].sort((a, b) => {
-    const va = (a[key] ?? '').toString().toLowerCase();
-    const vb = (b[key] ?? '').toString().toLowerCase();
-    if (va < vb) return -1 * mult;
-    if (va > vb) return 1 * mult;
-    return 0;
-  });
+const spacer = (height) => (height > 0 ? `<tr class="spacer" style="height:${height}px"><td colspan="8"></td></tr>` : '');
+
+// Renders only the rows inside the scroll viewport; spacer rows keep the
+// scrollbar sized for the full list
+const renderWindow = () => {
+  renderQueued = false;
+  const wrap = document.getElementById('table-wrap');
+  const first = Math.max(0, Math.floor(wrap.scrollTop / ROW_HEIGHT) - OVERSCAN);
+  const last = Math.min(rows.length, Math.ceil((wrap.scrollTop + wrap.clientHeight) / ROW_HEIGHT) + OVERSCAN);
+  document.querySelector('#machines-table tbody').innerHTML =
+    spacer(first * ROW_HEIGHT) +
+    rows.slice(first, last).map(rowHtml).join('') +
+    spacer((rows.length - last) * ROW_HEIGHT);
+};
+
+const scheduleRender = () => {
+  if (renderQueued) return;
+  renderQueued = true;
+  requestAnimationFrame(renderWindow);
 };
 
-const updateStats = (items) => {
-  const total = items.length;
-  const issues = items.filter((x) => Object.values(x.checks || {}).some((c) => (c?.status || 'unknown') === 'issue')).length;
-  document.getElementById('stats').textContent = `Machines: ${total} • With issues: ${issues}`;
+const updateStats = () => {
+  const issues = rows.reduce((n, r) => n + (r.item.has_issue ? 1 : 0), 0);
+  document.getElementById('stats').textContent = `Machines: ${rows.length} • With issues: ${issues}`;
+};
+
+const setRows = (items) => {
+  rows = items.map(toRow).sort(compareRows);
+  rowById = new Map(rows.map((r) => [r.item.machine_id, r]));
+  updateStats();
+  scheduleRender();
 };
 
 const loadAndRender = async () => {
-  const filters = {
-    os: document.getElementById('filter-os').value,
-    hasIssues: document.getElementById('filter-issues').value,
-    q: document.getElementById('filter-q').value.trim()
-  };
-  const items = await fetchMachines(filters);
-  const sorted = sortItems(items, currentSort.key, currentSort.dir);
-  updateStats(sorted);
-  renderTable(sorted);
+  const { items, version, etag } = await fetchMachines(currentFilters());
+  listVersion = version;
+  listEtag = etag;
+  setRows(items);
+};
+
+// Moves, inserts or drops only the machines that changed
+const applyChanges = (changed) => {
+  const filters = currentFilters();
+  for (const x of changed) {
+    if (!x) continue;
+    const old = rowById.get(x.machine_id);
+    if (old) {
+      rows.splice(rows.indexOf(old), 1);
+      rowById.delete(x.machine_id);
+    }
+    if (!matchesFilters(x, filters)) continue;
+    const row = toRow(x);
+    rows.splice(insertionPoint(row), 0, row);
+    rowById.set(x.machine_id, row);
+  }
+  updateStats();
+  scheduleRender();
+  const open = document.getElementById('detail').dataset.id;
+  if (open && changed.some((x) => x?.machine_id === open)) showDetail(open);
+};
+
+const subscribe = () => {
+  if (!window.EventSource || events) return;
+  events = new EventSource(`/admin/api/events?since=${encodeURIComponent(listVersion || '')}`);
+  events.addEventListener('machines', (e) => applyChanges(JSON.parse(e.data).items || []));
+  events.addEventListener('reset', () => loadAndRender());
+};
+
+// Fallback while the event stream is down: a conditional fetch that costs a
+// 304 when nothing changed
+const pollIfDisconnected = async () => {
+  if (events && events.readyState === EventSource.OPEN) return;
+  const res = await fetch('/admin/api/machines?limit=1', { headers: listEtag ? { 'If-None-Match': listEtag } : {} });
+  if (res.status !== 304) await loadAndRender();
+};
+
+// Detail panel: machine summary plus its report history, one page at a time
+const historyRows = (items) => items.map((r) => `<tr>
+      <td><div class="timestamp">${fmtTime(r.timestamp)}</div></td>
+      ${CHECK_COLUMNS.map((name) => `<td>${badge(r.checks?.[name]?.status)}</td>`).join('')}
+    </tr>`).join('');
+
+const checkDetails = (checks) => Object.entries(checks || {}).map(([name, c]) => `
+    <div class="check">
+      <div>${badge(c?.status)} <strong>${esc(name)}</strong></div>
+      ${c?.summary ? `<div>${esc(c.summary)}</div>` : ''}
+      ${c?.data ? `<pre>${esc(JSON.stringify(c.data, null, 2))}</pre>` : ''}
+    </div>`).join('');
+
+const loadHistory = async (id, before) => {
+  const params = new URLSearchParams({ limit: '50' });
+  if (before != null) params.set('before', before);
+  const res = await fetch(`/admin/api/machines/${encodeURIComponent(id)}?${params.toString()}`);
+  if (!res.ok) throw new Error('Failed to load history');
+  return res.json();
+};
+
+const showDetail = async (id) => {
+  const panel = document.getElementById('detail');
+  panel.dataset.id = id;
+  panel.hidden = false;
+  const data = await loadHistory(id);
+  if (panel.dataset.id !== id) return; // another machine was opened meanwhile
+  const latest = data.items[0] || {};
+  panel.querySelector('.detail-body').innerHTML = `
+    <h2>${esc(latest.hostname || id)}</h2>
+    <div class="timestamp">${esc(id)} • ${esc(latest.os)} • ${fmtTime(latest.timestamp)}</div>
+    ${checkDetails(latest.checks)}
+    <h3>History</h3>
+    <table class="history">
+      <thead><tr><th>Time</th>${CHECK_COLUMNS.map((name) => `<th>${esc(name)}</th>`).join('')}</tr></thead>
+      <tbody>${historyRows(data.items)}</tbody>
+    </table>
+    <button class="more" ${data.next == null ? 'hidden' : ''}>Load older</button>`;
+  let next = data.next;
+  const more = panel.querySelector('.more');
+  more.addEventListener('click', async () => {
+    const page = await loadHistory(id, next);
+    panel.querySelector('.history tbody').insertAdjacentHTML('beforeend', historyRows(page.items));
+    next = page.next;
+    more.hidden = next == null;
+  });
+};
+
+const closeDetail = () => {
+  const panel = document.getElementById('detail');
+  panel.hidden = true;
+  delete panel.dataset.id;
 };
 
 const initSorting = () => {
@@ -90,11 +243,26 @@ const initSorting = () => {
         currentSort.key = key;
         currentSort.dir = 'asc';
       }
-      loadAndRender();
+      rows.sort(compareRows);
+      scheduleRender();
     });
   });
 };
 
+const initTable = () => {
+  document.getElementById('table-wrap').addEventListener('scroll', scheduleRender, { passive: true });
+  window.addEventListener('resize', scheduleRender);
+  // One delegated listener for every row, present or rendered later
+  document.querySelector('#machines-table tbody').addEventListener('click', (e) => {
+    const tr = e.target.closest('tr[data-id]');
+    if (tr) showDetail(tr.getAttribute('data-id')).catch(() => {});
+  });
+  document.getElementById('detail-close').addEventListener('click', closeDetail);
+  document.addEventListener('keydown', (e) => {
+    if (e.key === 'Escape') closeDetail();
+  });
+};
+
 const initFilters = () => {
   document.getElementById('apply-filters').addEventListener('click', () => loadAndRender());
   document.getElementById('filter-q').addEventListener('keydown', (e) => {
@@ -104,7 +272,9 @@ const initFilters = () => {
 
 window.addEventListener('DOMContentLoaded', async () => {
   initSorting();
+  initTable();
   initFilters();
   await loadAndRender();
-  setInterval(loadAndRender, 30000); // refresh every 30s
+  subscribe();
+  setInterval(() => pollIfDisconnected().catch(() => {}), 30000);
 });
@@ -0,0 +1,33 @@
+import fs from 'fs';
+import { LogStorage } from './log.js';
+import { LowdbStorage } from './lowdb.js';
+
+// Every backend implements:
+//   open(), append(report), flush(), close(), isEmpty(), count,
+//   lastSeq(instance), latest(machineId), latestAll(), scan(), checkNames(),
+//   history(machineId, { before, after, limit }) -> { items (newest first), next, prev }
+// append() makes a report visible immediately; flush() makes it durable.
+export async function openStorage({ backend = 'log', dataDir, dbPath, snapshotEvery }) {
+  if (backend === 'lowdb') return new LowdbStorage(dbPath).open();
+  if (backend !== 'log') throw new Error(`Unknown STORAGE backend: ${backend}`);
+  const store = await new LogStorage(dataDir, { snapshotEvery }).open();
+  if (store.isEmpty() && fs.existsSync(dbPath)) await migrateFromLowdb(dbPath, store);
+  return store;
+}
+
+// One-shot import of the legacy lowdb db.json. The file is renamed afterwards
+// so the import never runs twice.
+export async function migrateFromLowdb(dbPath, store) {
+  const legacy = JSON.parse(fs.readFileSync(dbPath, 'utf8'));
+  const reports = Array.isArray(legacy?.reports) ? legacy.reports : [];
+  // Stable sort keeps arrival order for equal timestamps
+  reports.sort((a, b) => a.ts - b.ts);
+  for (const r of reports) {
+    if (r && r.machine_id) store.append(r);
+  }
+  await store.flush();
+  store.snapshot?.();
+  fs.renameSync(dbPath, `${dbPath}.migrated`);
+  console.log(`Migrated ${reports.length} reports from ${dbPath}`);
+  return reports.length;
+}
@@ -0,0 +1,41 @@
+// Keyset pagination over an array sorted ascending by `key(entry)`.
+
+// First index whose key is >= value (or > value when `strict`).
+export function bound(entries, value, key, strict = false) {
+  let lo = 0;
+  let hi = entries.length;
+  while (lo < hi) {
+    const mid = (lo + hi) >> 1;
+    const k = key(entries[mid]);
+    if (k < value || (strict && k === value)) lo = mid + 1;
+    else hi = mid;
+  }
+  return lo;
+}
+
+// Picks the page between the exclusive `after`/`before` keys: the newest
+// `limit` entries, or with only `after` the oldest ones after it. Entries
+// sharing the boundary key are kept together so a cursor never skips any.
+// Returns the [start, end) slice plus cursors for the pages on either side.
+export function keysetPage(entries, key, { before, after, limit }) {
+  const lo = after != null ? bound(entries, after, key, true) : 0;
+  const hi = before != null ? bound(entries, before, key) : entries.length;
+  let start;
+  let end;
+  if (after != null && before == null) {
+    start = lo;
+    end = Math.min(hi, lo + limit);
+    while (end < hi && key(entries[end]) === key(entries[end - 1])) end += 1;
+  } else {
+    end = hi;
+    start = Math.max(lo, hi - limit);
+    while (start > lo && key(entries[start - 1]) === key(entries[start])) start -= 1;
+  }
+  if (start >= end) return { start, end, next: null, prev: null };
+  return {
+    start,
+    end,
+    next: start > 0 ? key(entries[start]) : null, // pass as `before` for older entries
+    prev: end < entries.length ? key(entries[end - 1]) : null // pass as `after` for newer ones
+  };
+}
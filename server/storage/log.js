@@ -0,0 +1,289 @@
+import fs from 'fs';
+import path from 'path';
+import { keysetPage } from './keyset.js';
+
+const LOG_FILE = 'reports.log';
+const SNAPSHOT_FILE = 'index.snapshot.json';
+const READ_CHUNK = 1024 * 1024;
+
+function writeAll(fd, data) {
+  return new Promise((resolve, reject) => {
+    const step = (offset) => {
+      if (offset >= data.length) return resolve();
+      fs.write(fd, data, offset, data.length - offset, null, (err, written) => {
+        if (err) return reject(err);
+        step(offset + written);
+      });
+    };
+    step(0);
+  });
+}
+
+function fsync(fd) {
+  return new Promise((resolve, reject) => fs.fsync(fd, (err) => (err ? reject(err) : resolve())));
+}
+
+// Yields every complete line from `start` as { offset, length, text }; the
+// offset just past the last complete line is returned when done.
+function* readLines(fd, start, end) {
+  const chunk = Buffer.alloc(READ_CHUNK);
+  let carry = Buffer.alloc(0);
+  let pos = start;
+  let lineStart = start;
+  while (pos < end) {
+    const n = fs.readSync(fd, chunk, 0, Math.min(READ_CHUNK, end - pos), pos);
+    if (n === 0) break;
+    pos += n;
+    let buf = carry.length ? Buffer.concat([carry, chunk.subarray(0, n)]) : chunk.subarray(0, n);
+    let from = 0;
+    let nl;
+    while ((nl = buf.indexOf(10, from)) !== -1) {
+      yield { offset: lineStart, length: nl - from + 1, text: buf.toString('utf8', from, nl) };
+      lineStart += nl - from + 1;
+      from = nl + 1;
+    }
+    carry = Buffer.from(buf.subarray(from));
+  }
+  return lineStart;
+}
+
+// Append-only report log. Every report is one JSON line in reports.log; the
+// in-memory index maps machine_id to its reports' (ts, offset, length) in ts
+// order, and caches each machine's latest report. The index is snapshotted
+// every `snapshotEvery` reports so startup only replays the log tail.
+export class LogStorage {
+  constructor(dir, { snapshotEvery = 10000 } = {}) {
+    this.dir = dir;
+    this.logPath = path.join(dir, LOG_FILE);
+    this.snapshotPath = path.join(dir, SNAPSHOT_FILE);
+    this.snapshotEvery = snapshotEvery;
+    this.byMachine = new Map(); // machine_id -> [[ts, offset, length], ...] sorted by ts
+    this.latestCache = new Map(); // machine_id -> { offset, record }
+    this.seqByInstance = new Map();
+    this.durableSeq = new Map(); // as seqByInstance, counting flushed reports only
+    this.checks = new Set(); // every check name ever stored
+    this.pending = []; // { buf, record } appended but not yet written
+    this.pendingBytes = 0;
+    this.inflightBytes = 0; // being written by the current flush
+    this.flushing = null;
+    this.unflushed = new Map(); // offset -> record, until written
+    this.size = 0;
+    this.count = 0;
+    this.sinceSnapshot = 0;
+    this.fd = null;
+  }
+
+  async open() {
+    fs.mkdirSync(this.dir, { recursive: true });
+    this.fd = fs.openSync(this.logPath, 'a+');
+    const fileSize = fs.fstatSync(this.fd).size;
+    let from = 0;
+    const snap = this._readSnapshot();
+    if (snap && snap.log_size <= fileSize) {
+      for (const [id, entries] of snap.machines) this.byMachine.set(id, entries);
+      for (const [instance, seq] of snap.seq) {
+        this.seqByInstance.set(instance, seq);
+        this.durableSeq.set(instance, seq);
+      }
+      for (const name of snap.checks || []) this.checks.add(name);
+      this.count = snap.count;
+      from = snap.log_size;
+    }
+    const lines = readLines(this.fd, from, fileSize);
+    let step;
+    while (!(step = lines.next()).done) {
+      const { offset, length, text } = step.value;
+      let record;
+      try {
+        record = JSON.parse(text);
+      } catch {
+        continue; // a damaged line in the middle is skipped, not fatal
+      }
+      this._index(record, offset, length);
+      this._noteSeq(this.durableSeq, record);
+      this.sinceSnapshot += 1;
+    }
+    this.size = step.value;
+    if (this.size < fileSize) {
+      // A crash mid-append leaves an unterminated line; drop it
+      fs.ftruncateSync(this.fd, this.size);
+    }
+    for (const [id, entries] of this.byMachine) {
+      const [, offset, length] = entries[entries.length - 1];
+      this.latestCache.set(id, { offset, record: this._readAt(offset, length) });
+    }
+    return this;
+  }
+
+  _readSnapshot() {
+    try {
+      const snap = JSON.parse(fs.readFileSync(this.snapshotPath, 'utf8'));
+      return snap.format === 1 ? snap : null;
+    } catch {
+      return null;
+    }
+  }
+
+  _noteSeq(map, record) {
+    if (record.instance && Number.isInteger(record.seq) && (map.get(record.instance) || 0) < record.seq) {
+      map.set(record.instance, record.seq);
+    }
+  }
+
+  _index(record, offset, length) {
+    let entries = this.byMachine.get(record.machine_id);
+    if (!entries) {
+      entries = [];
+      this.byMachine.set(record.machine_id, entries);
+    }
+    // Usually appended in ts order; queued reports replayed by agents arrive late
+    let i = entries.length;
+    while (i > 0 && entries[i - 1][0] > record.ts) i -= 1;
+    entries.splice(i, 0, [record.ts, offset, length]);
+    if (i === entries.length - 1) this.latestCache.set(record.machine_id, { offset, record });
+    for (const name of Object.keys(record.checks || {})) this.checks.add(name);
+    this._noteSeq(this.seqByInstance, record);
+    this.count += 1;
+  }
+
+  _readAt(offset, length) {
+    const cached = this.unflushed.get(offset);
+    if (cached) return cached;
+    const buf = Buffer.alloc(length);
+    fs.readSync(this.fd, buf, 0, length, offset);
+    return JSON.parse(buf.toString('utf8'));
+  }
+
+  append(record) {
+    const buf = Buffer.from(JSON.stringify(record) + '\n');
+    const offset = this.size + this.inflightBytes + this.pendingBytes;
+    this.pending.push({ buf, record });
+    this.pendingBytes += buf.length;
+    this.unflushed.set(offset, record);
+    this._index(record, offset, buf.length);
+    return record;
+  }
+
+  // Writes and fsyncs everything appended so far in one go.
+  async flush() {
+    while (this.flushing) await this.flushing.catch(() => {});
+    if (!this.pending.length) return;
+    this.flushing = this._flush();
+    try {
+      await this.flushing;
+    } finally {
+      this.flushing = null;
+    }
+  }
+
+  async _flush() {
+    const batch = this.pending;
+    const data = Buffer.concat(batch.map((p) => p.buf));
+    this.pending = [];
+    this.pendingBytes -= data.length;
+    this.inflightBytes = data.length;
+    try {
+      await writeAll(this.fd, data);
+      await fsync(this.fd);
+    } catch (err) {
+      // Undo a partial write and keep the reports for the next flush
+      try {
+        fs.ftruncateSync(this.fd, this.size);
+      } catch {
+        // the next open() drops any torn tail
+      }
+      this.pending = batch.concat(this.pending);
+      this.pendingBytes += data.length;
+      this.inflightBytes = 0;
+      throw err;
+    }
+    this.size += data.length;
+    this.inflightBytes = 0;
+    for (const offset of this.unflushed.keys()) {
+      if (offset < this.size) this.unflushed.delete(offset);
+    }
+    for (const { record } of batch) this._noteSeq(this.durableSeq, record);
+    this.sinceSnapshot += batch.length;
+    if (this.sinceSnapshot >= this.snapshotEvery) this.snapshot();
+  }
+
+  // Persists the index of everything flushed so far (tmp file + rename).
+  snapshot() {
+    const machines = [];
+    let count = 0;
+    for (const [id, entries] of this.byMachine) {
+      const durable = entries.filter((e) => e[1] < this.size);
+      if (durable.length) machines.push([id, durable]);
+      count += durable.length;
+    }
+    const snap = {
+      format: 1,
+      log_size: this.size,
+      count,
+      machines,
+      seq: [...this.durableSeq],
+      checks: [...this.checks]
+    };
+    const tmp = this.snapshotPath + '.tmp';
+    const fd = fs.openSync(tmp, 'w');
+    try {
+      fs.writeSync(fd, JSON.stringify(snap));
+      fs.fsyncSync(fd);
+    } finally {
+      fs.closeSync(fd);
+    }
+    fs.renameSync(tmp, this.snapshotPath);
+    this.sinceSnapshot = 0;
+  }
+
+  isEmpty() {
+    return this.count === 0;
+  }
+
+  lastSeq(instance) {
+    return this.seqByInstance.get(instance) || 0;
+  }
+
+  checkNames() {
+    return [...this.checks].sort();
+  }
+
+  latest(machineId) {
+    return this.latestCache.get(machineId)?.record || null;
+  }
+
+  *latestAll() {
+    for (const { record } of this.latestCache.values()) yield record;
+  }
+
+  // One page of a machine's reports, newest first; see keysetPage().
+  history(machineId, { before, after, limit = 500 } = {}) {
+    const entries = this.byMachine.get(machineId) || [];
+    const page = keysetPage(entries, (e) => e[0], { before, after, limit });
+    const items = [];
+    for (let i = page.end - 1; i >= page.start; i -= 1) items.push(this._readAt(entries[i][1], entries[i][2]));
+    return { items, next: page.next, prev: page.prev };
+  }
+
+  // Every stored report in arrival order.
+  *scan() {
+    const end = this.size;
+    for (const { text } of readLines(this.fd, 0, end)) {
+      try {
+        yield JSON.parse(text);
+      } catch {
+        // skipped, as in open()
+      }
+    }
+    for (const [offset, record] of this.unflushed) {
+      if (offset >= end) yield record;
+    }
+  }
+
+  async close() {
+    await this.flush();
+    if (this.sinceSnapshot) this.snapshot();
+    fs.closeSync(this.fd);
+    this.fd = null;
+  }
+}
@@ -0,0 +1,101 @@
+import fs from 'fs';
+import path from 'path';
+import { Low } from 'lowdb';
+import { JSONFile } from 'lowdb/node';
+import { keysetPage } from './keyset.js';
+
+// The original single-file JSON store: simple, but every flush rewrites the
+// whole history and startup parses all of it. Fine for a handful of machines.
+export class LowdbStorage {
+  constructor(file) {
+    this.file = file;
+    this.db = null;
+    this.latestMap = new Map();
+    this.byMachine = new Map(); // machine_id -> reports sorted by ts
+    this.seqByInstance = new Map();
+    this.checks = new Set();
+    this.dirty = false;
+  }
+
+  async open() {
+    fs.mkdirSync(path.dirname(this.file), { recursive: true });
+    this.db = new Low(new JSONFile(this.file), { reports: [] });
+    await this.db.read();
+    this.db.data ||= { reports: [] };
+    for (const r of this.db.data.reports) this._index(r);
+    return this;
+  }
+
+  _index(record) {
+    let history = this.byMachine.get(record.machine_id);
+    if (!history) {
+      history = [];
+      this.byMachine.set(record.machine_id, history);
+    }
+    let i = history.length;
+    while (i > 0 && history[i - 1].ts > record.ts) i -= 1;
+    history.splice(i, 0, record);
+    for (const name of Object.keys(record.checks || {})) this.checks.add(name);
+    const prev = this.latestMap.get(record.machine_id);
+    if (!prev || record.ts >= prev.ts) this.latestMap.set(record.machine_id, record);
+    if (record.instance && Number.isInteger(record.seq) && this.lastSeq(record.instance) < record.seq) {
+      this.seqByInstance.set(record.instance, record.seq);
+    }
+  }
+
+  get count() {
+    return this.db.data.reports.length;
+  }
+
+  append(record) {
+    this.db.data.reports.push(record);
+    this._index(record);
+    this.dirty = true;
+    return record;
+  }
+
+  async flush() {
+    if (!this.dirty) return;
+    this.dirty = false;
+    try {
+      await this.db.write();
+    } catch (err) {
+      this.dirty = true;
+      throw err;
+    }
+  }
+
+  isEmpty() {
+    return this.db.data.reports.length === 0;
+  }
+
+  lastSeq(instance) {
+    return this.seqByInstance.get(instance) || 0;
+  }
+
+  checkNames() {
+    return [...this.checks].sort();
+  }
+
+  latest(machineId) {
+    return this.latestMap.get(machineId) || null;
+  }
+
+  *latestAll() {
+    yield* this.latestMap.values();
+  }
+
+  history(machineId, { before, after, limit = 500 } = {}) {
+    const history = this.byMachine.get(machineId) || [];
+    const page = keysetPage(history, (r) => r.ts, { before, after, limit });
+    return { items: history.slice(page.start, page.end).reverse(), next: page.next, prev: page.prev };
+  }
+
+  *scan() {
+    yield* this.db.data.reports;
+  }
+
+  async close() {
+    await this.flush();
+  }
+}
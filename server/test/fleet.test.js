@@ -0,0 +1,77 @@
+import assert from 'node:assert/strict';
+import { test } from 'node:test';
+import { FleetIndex } from '../fleet.js';
+
+function report(machine, ts, { os = 'Linux', issue = false, hostname = `${machine}.local` } = {}) {
+  return {
+    machine_id: machine,
+    hostname,
+    os,
+    ts,
+    checks: { firewall: { status: 'ok' }, antivirus: { status: issue ? 'issue' : 'ok' } }
+  };
+}
+
+test('a late report does not replace the latest one', () => {
+  const fleet = new FleetIndex();
+  assert.equal(fleet.update(report('a', 10, { issue: true })), true);
+  const version = fleet.version;
+
+  assert.equal(fleet.update(report('a', 5)), false);
+  assert.equal(fleet.version, version);
+  assert.equal(fleet.get('a').timestamp, 10);
+  assert.equal(fleet.get('a').has_issue, true);
+
+  assert.equal(fleet.update(report('a', 10)), true); // same timestamp: the later arrival wins
+  assert.equal(fleet.get('a').has_issue, false);
+});
+
+test('counters follow each machine\'s latest report', () => {
+  const fleet = FleetIndex.from([
+    report('a', 1, { issue: true }),
+    report('b', 1, { os: 'Windows' }),
+    report('c', 1, { os: 'Windows', issue: true })
+  ]);
+  assert.deepEqual(fleet.stats(), {
+    machines: 3,
+    with_issues: 2,
+    by_os: { Linux: { machines: 1, with_issues: 1 }, Windows: { machines: 2, with_issues: 1 } },
+    by_check: { firewall: { ok: 3, issue: 0, unknown: 0 }, antivirus: { ok: 1, issue: 2, unknown: 0 } }
+  });
+
+  fleet.update(report('a', 2, { os: 'Windows' }));
+  fleet.update(report('c', 2, { os: 'Windows' }));
+  assert.deepEqual(fleet.stats(), {
+    machines: 3,
+    with_issues: 0,
+    by_os: { Windows: { machines: 3, with_issues: 0 } },
+    by_check: { firewall: { ok: 3, issue: 0, unknown: 0 }, antivirus: { ok: 3, issue: 0, unknown: 0 } }
+  });
+  assert.deepEqual(fleet.checkNames(), ['antivirus', 'firewall']);
+});
+
+test('iterate filters by os, issues and search text in machine_id order', () => {
+  const fleet = FleetIndex.from([
+    report('c', 1, { os: 'Windows', issue: true }),
+    report('a', 1, { hostname: 'Build-Server' }),
+    report('b', 1, { os: 'windows' })
+  ]);
+  const ids = (filters) => [...fleet.iterate(filters)].map((m) => m.machine_id);
+
+  assert.deepEqual(ids({}), ['a', 'b', 'c']);
+  assert.deepEqual(ids({ os: 'WINDOWS' }), ['b', 'c']);
+  assert.deepEqual(ids({ os: 'Darwin' }), []);
+  assert.deepEqual(ids({ hasIssues: 'true' }), ['c']);
+  assert.deepEqual(ids({ hasIssues: 'false', os: 'windows' }), ['b']);
+  assert.deepEqual(ids({ q: 'build' }), ['a']);
+  assert.deepEqual(ids({ after: 'a' }), ['b', 'c']);
+});
+
+test('changedSince returns machines updated after a version', () => {
+  const fleet = FleetIndex.from([report('a', 1), report('b', 1)]);
+  const version = fleet.version;
+  fleet.update(report('b', 2));
+  fleet.update(report('c', 1));
+  assert.deepEqual([...fleet.changedSince(version)].map((m) => m.machine_id).sort(), ['b', 'c']);
+  assert.deepEqual([...fleet.changedSince(fleet.version)], []);
+});
@@ -0,0 +1,83 @@
+import assert from 'node:assert/strict';
+import fs from 'node:fs';
+import os from 'node:os';
+import path from 'node:path';
+import { afterEach, beforeEach, test } from 'node:test';
+import { ingestBatch, ingestReport } from '../ingest.js';
+import { LogStorage } from '../storage/log.js';
+
+let store;
+let dir;
+
+beforeEach(async () => {
+  dir = fs.mkdtempSync(path.join(os.tmpdir(), 'cm-ingest-'));
+  store = await new LogStorage(dir).open();
+});
+
+afterEach(async () => {
+  await store.close();
+  fs.rmSync(dir, { recursive: true, force: true });
+});
+
+function report(seq, extra = {}) {
+  return {
+    machine_id: 'm1',
+    timestamp: 1000 + seq,
+    version: `v${seq}`,
+    instance: 'agent-1',
+    seq,
+    checks: { firewall: { status: 'ok' } },
+    ...extra
+  };
+}
+
+test('a delta against the stored version is merged into the full state', () => {
+  const stored = [];
+  ingestReport(store, report(1, { checks: { firewall: { status: 'ok' }, av: { status: 'issue' } } }));
+  const [status, body] = ingestReport(
+    store,
+    report(2, { delta: true, base_version: 'v1', checks: { av: { status: 'ok' } }, removed: ['firewall'] }),
+    (r) => stored.push(r)
+  );
+  assert.equal(status, 200);
+  assert.equal(body.ok, true);
+  assert.deepEqual(store.latest('m1').checks, { av: { status: 'ok' } });
+  assert.equal(stored.length, 1);
+});
+
+test('a resent seq is acknowledged as a duplicate and not stored twice', () => {
+  ingestReport(store, report(1));
+  const [status, body] = ingestReport(store, report(1));
+  assert.equal(status, 200);
+  assert.equal(body.duplicate, true);
+  assert.equal(store.count, 1);
+});
+
+test('a batch stops at the first failed report and skips the rest', () => {
+  ingestReport(store, report(1));
+  const results = ingestBatch(store, [
+    report(2),
+    report(3, { delta: true, base_version: 'stale' }),
+    report(4),
+    report(5)
+  ]);
+  assert.equal(results[0].ok, true);
+  assert.equal(results[1].status, 409);
+  assert.equal(results[1].resync, true);
+  assert.deepEqual(results.slice(2), [{ ok: false, skipped: true }, { ok: false, skipped: true }]);
+  assert.equal(store.count, 2);
+  assert.equal(store.lastSeq('agent-1'), 2);
+
+  // The agent resends from the failed report with a full one; nothing is a duplicate
+  const retry = ingestBatch(store, [report(3), report(4), report(5)]);
+  assert.deepEqual(retry.map((r) => [r.ok, r.duplicate]), [[true, undefined], [true, undefined], [true, undefined]]);
+  assert.equal(store.count, 5);
+  assert.equal(store.latest('m1').version, 'v5');
+});
+
+test('a batch with a malformed report stores only the ones before it', () => {
+  const results = ingestBatch(store, [report(1), { machine_id: 'm1' }, report(2)]);
+  assert.deepEqual(results.map((r) => r.status), [undefined, 400, undefined]);
+  assert.equal(results[2].skipped, true);
+  assert.equal(store.lastSeq('agent-1'), 1);
+});
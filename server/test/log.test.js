@@ -0,0 +1,178 @@
+import assert from 'node:assert/strict';
+import fs from 'node:fs';
+import os from 'node:os';
+import path from 'node:path';
+import { afterEach, beforeEach, test } from 'node:test';
+import { LogStorage } from '../storage/log.js';
+
+let dir;
+const open = [];
+
+beforeEach(() => {
+  dir = fs.mkdtempSync(path.join(os.tmpdir(), 'cm-log-'));
+});
+
+afterEach(async () => {
+  for (const store of open.splice(0)) {
+    if (store.fd !== null) fs.closeSync(store.fd);
+  }
+  fs.rmSync(dir, { recursive: true, force: true });
+});
+
+async function openStore(options) {
+  const store = await new LogStorage(dir, options).open();
+  open.push(store);
+  return store;
+}
+
+function report(machine, ts, extra = {}) {
+  return { machine_id: machine, ts, hostname: `${machine}.local`, checks: { firewall: { status: 'ok' } }, ...extra };
+}
+
+// Simulates a crash: the file descriptor goes away without close() or a snapshot
+function crash(store) {
+  fs.closeSync(store.fd);
+  store.fd = null;
+}
+
+test('appended reports are visible at once and durable after flush', async () => {
+  const store = await openStore();
+  store.append(report('a', 1, { instance: 'i', seq: 1 }));
+  store.append(report('b', 2, { instance: 'i', seq: 2 }));
+  assert.equal(store.latest('a').ts, 1);
+  assert.equal(store.count, 2);
+  await store.flush();
+  crash(store);
+
+  const again = await openStore();
+  assert.equal(again.count, 2);
+  assert.deepEqual([...again.latestAll()].map((r) => r.machine_id).sort(), ['a', 'b']);
+  assert.equal(again.lastSeq('i'), 2);
+  assert.deepEqual(again.checkNames(), ['firewall']);
+});
+
+test('reports that were never flushed are gone after a crash', async () => {
+  const store = await openStore();
+  store.append(report('a', 1));
+  await store.flush();
+  store.append(report('a', 2));
+  crash(store);
+
+  const again = await openStore();
+  assert.equal(again.count, 1);
+  assert.equal(again.latest('a').ts, 1);
+});
+
+test('a torn last line is dropped and later appends land after it', async () => {
+  const store = await openStore();
+  store.append(report('a', 1));
+  await store.flush();
+  crash(store);
+  const logPath = path.join(dir, 'reports.log');
+  const goodSize = fs.statSync(logPath).size;
+  fs.appendFileSync(logPath, '{"machine_id":"a","ts":2,"che');
+
+  const again = await openStore();
+  assert.equal(fs.statSync(logPath).size, goodSize);
+  again.append(report('a', 3));
+  await again.flush();
+  crash(again);
+
+  const third = await openStore();
+  assert.deepEqual(third.history('a').items.map((r) => r.ts), [3, 1]);
+});
+
+test('open() replays only the log tail after the snapshot', async () => {
+  const store = await openStore({ snapshotEvery: 3 });
+  for (let ts = 1; ts <= 4; ts += 1) store.append(report('a', ts, { instance: 'i', seq: ts }));
+  await store.flush();
+  const snap = JSON.parse(fs.readFileSync(path.join(dir, 'index.snapshot.json'), 'utf8'));
+  assert.equal(snap.count, 4);
+  store.append(report('b', 5, { instance: 'i', seq: 5 }));
+  await store.flush();
+  crash(store);
+
+  const again = await openStore({ snapshotEvery: 3 });
+  assert.equal(again.sinceSnapshot, 1); // just b's report
+  assert.equal(again.count, 5);
+  assert.equal(again.lastSeq('i'), 5);
+  assert.deepEqual(again.history('a').items.map((r) => r.ts), [4, 3, 2, 1]);
+  assert.equal(again.latest('b').ts, 5);
+});
+
+test('a snapshot from a longer log than the one on disk is ignored', async () => {
+  const store = await openStore({ snapshotEvery: 1 });
+  store.append(report('a', 1));
+  await store.flush();
+  store.append(report('a', 2));
+  await store.flush();
+  crash(store);
+  fs.truncateSync(path.join(dir, 'reports.log'), 0);
+
+  const again = await openStore();
+  assert.equal(again.count, 0);
+  assert.equal(again.latest('a'), null);
+});
+
+test('a failed flush keeps its reports for the next one', async () => {
+  const store = await openStore();
+  store.append(report('a', 1, { instance: 'i', seq: 1 }));
+  await store.flush();
+  store.append(report('a', 2, { instance: 'i', seq: 2 }));
+
+  const fd = store.fd;
+  store.fd = fs.openSync(path.join(dir, 'reports.log'), 'r'); // writes fail with EBADF
+  await assert.rejects(store.flush());
+  fs.closeSync(store.fd);
+  store.fd = fd;
+  assert.equal(store.durableSeq.get('i'), 1);
+  assert.equal(store.latest('a').ts, 2); // still visible while queued
+
+  store.append(report('a', 3, { instance: 'i', seq: 3 }));
+  await store.flush();
+  assert.equal(store.durableSeq.get('i'), 3);
+  crash(store);
+
+  const again = await openStore();
+  assert.deepEqual(again.history('a').items.map((r) => r.seq), [3, 2, 1]);
+});
+
+test('reports replayed late are indexed by timestamp, not arrival', async () => {
+  const store = await openStore();
+  store.append(report('a', 10));
+  store.append(report('a', 5));
+  assert.equal(store.latest('a').ts, 10);
+  await store.flush();
+  crash(store);
+
+  const again = await openStore();
+  assert.equal(again.latest('a').ts, 10);
+  assert.deepEqual(again.history('a').items.map((r) => r.ts), [10, 5]);
+  assert.deepEqual([...again.scan()].map((r) => r.ts), [10, 5]); // scan is arrival order
+});
+
+test('scan includes reports that are not flushed yet', async () => {
+  const store = await openStore();
+  store.append(report('a', 1));
+  await store.flush();
+  store.append(report('b', 2));
+  assert.deepEqual([...store.scan()].map((r) => r.machine_id), ['a', 'b']);
+});
+
+test('history pages through a machine with keyset cursors', async () => {
+  const store = await openStore();
+  for (const ts of [1, 2, 3, 3, 4, 5]) store.append(report('a', ts));
+  await store.flush();
+
+  const first = store.history('a', { limit: 2 });
+  assert.deepEqual(first.items.map((r) => r.ts), [5, 4]);
+  assert.equal(first.prev, null);
+  const second = store.history('a', { before: first.next, limit: 2 });
+  // Both reports at ts 3 come together, so the cursor never splits them
+  assert.deepEqual(second.items.map((r) => r.ts), [3, 3]);
+  const third = store.history('a', { before: second.next, limit: 2 });
+  assert.deepEqual(third.items.map((r) => r.ts), [2, 1]);
+  assert.equal(third.next, null);
+  assert.deepEqual(store.history('a', { after: third.prev, limit: 2 }).items.map((r) => r.ts), [3, 3]);
+  assert.deepEqual(store.history('nobody').items, []);
+});
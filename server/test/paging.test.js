@@ -0,0 +1,99 @@
+import assert from 'node:assert/strict';
+import { test } from 'node:test';
+import { FleetIndex } from '../fleet.js';
+import { bound, keysetPage } from '../storage/keyset.js';
+
+function report(machine, { os = 'Linux', issue = false } = {}) {
+  return { machine_id: machine, hostname: `${machine}.local`, os, ts: 1, checks: { av: { status: issue ? 'issue' : 'ok' } } };
+}
+
+// m00..m09; odd ones run Windows, every third one has an issue
+const FLEET = FleetIndex.from(
+  Array.from({ length: 10 }, (_, i) => report(`m0${i}`, { os: i % 2 ? 'Windows' : 'Linux', issue: i % 3 === 0 }))
+);
+
+function pages(filters, limit) {
+  const seen = [];
+  let after;
+  for (;;) {
+    const page = FLEET.list({ ...filters, after, limit });
+    seen.push({ ids: page.items.map((m) => m.machine_id), total: page.total });
+    if (page.next === null) return seen;
+    after = page.next;
+  }
+}
+
+test('list reports the filtered total on every page', () => {
+  for (const [filters, total] of [
+    [{}, 10],
+    [{ os: 'windows' }, 5],
+    [{ hasIssues: 'true' }, 4],
+    [{ q: 'm0' }, 10],
+    [{ os: 'Linux', hasIssues: 'false' }, 3]
+  ]) {
+    const seen = pages(filters, 3);
+    assert.deepEqual(new Set(seen.map((p) => p.total)), new Set([total]), JSON.stringify(filters));
+    assert.equal(seen.flatMap((p) => p.ids).length, total, JSON.stringify(filters));
+  }
+});
+
+test('list pages in machine_id order without gaps or repeats', () => {
+  assert.deepEqual(pages({}, 4).map((p) => p.ids), [
+    ['m00', 'm01', 'm02', 'm03'],
+    ['m04', 'm05', 'm06', 'm07'],
+    ['m08', 'm09']
+  ]);
+  assert.deepEqual(pages({ hasIssues: 'true' }, 2).map((p) => p.ids), [['m00', 'm03'], ['m06', 'm09']]);
+  // A page that ends exactly at the last match has no next cursor
+  assert.deepEqual(pages({ os: 'Windows' }, 5).map((p) => p.ids), [['m01', 'm03', 'm05', 'm07', 'm09']]);
+});
+
+test('an unknown os or cursor past the end gives an empty page', () => {
+  assert.deepEqual(FLEET.list({ os: 'Plan9', limit: 5 }), { items: [], next: null, total: 0 });
+  assert.deepEqual(FLEET.list({ after: 'zzz', limit: 5 }), { items: [], next: null, total: 10 });
+  assert.deepEqual(FLEET.list({ q: 'm', after: 'zzz', limit: 5 }), { items: [], next: null, total: 10 });
+});
+
+// keysetPage over plain numbers: the entries are their own keys
+const key = (n) => n;
+const slice = (entries, page) => entries.slice(page.start, page.end);
+
+test('bound finds the first key at or past a value', () => {
+  const entries = [1, 3, 3, 5];
+  assert.equal(bound(entries, 3, key), 1);
+  assert.equal(bound(entries, 3, key, true), 3);
+  assert.equal(bound(entries, 0, key), 0);
+  assert.equal(bound(entries, 9, key), 4);
+});
+
+test('keysetPage walks back with next and forward with prev', () => {
+  const entries = [1, 2, 3, 4, 5, 6, 7];
+  const newest = keysetPage(entries, key, { limit: 3 });
+  assert.deepEqual(slice(entries, newest), [5, 6, 7]);
+  assert.equal(newest.prev, null);
+
+  const older = keysetPage(entries, key, { before: newest.next, limit: 3 });
+  assert.deepEqual(slice(entries, older), [2, 3, 4]);
+  const oldest = keysetPage(entries, key, { before: older.next, limit: 3 });
+  assert.deepEqual(slice(entries, oldest), [1]);
+  assert.equal(oldest.next, null);
+
+  const back = keysetPage(entries, key, { after: oldest.prev, limit: 3 });
+  assert.deepEqual(slice(entries, back), [2, 3, 4]);
+  assert.deepEqual(slice(entries, keysetPage(entries, key, { after: 2, before: 6, limit: 9 })), [3, 4, 5]);
+});
+
+test('keysetPage keeps entries that share the boundary key together', () => {
+  const entries = [1, 2, 2, 2, 3];
+  const newest = keysetPage(entries, key, { limit: 2 });
+  assert.deepEqual(slice(entries, newest), [2, 2, 2, 3]);
+  assert.deepEqual(slice(entries, keysetPage(entries, key, { before: newest.next, limit: 2 })), [1]);
+  assert.deepEqual(slice(entries, keysetPage(entries, key, { after: 1, limit: 1 })), [2, 2, 2]);
+});
+
+test('keysetPage on an empty range has no cursors', () => {
+  assert.deepEqual(keysetPage([], key, { limit: 5 }), { start: 0, end: 0, next: null, prev: null });
+  const page = keysetPage([1, 2], key, { before: 1, limit: 5 });
+  assert.equal(page.next, null);
+  assert.equal(page.prev, null);
+});